@@ -2,51 +2,134 @@
 
 from __future__ import annotations
 
+import asyncio
 from collections import deque
-from collections.abc import Callable, Mapping
+from collections.abc import Callable, Iterable, Mapping
 from dataclasses import asdict, dataclass
 from datetime import timedelta
+import hashlib
 import logging
+from pathlib import Path
+import shutil
 import time
 from typing import Any
 
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.core import (
     CALLBACK_TYPE,
+    Event,
     HomeAssistant,
     State,
     callback,
 )
-from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.event import (
+    EventStateChangedData,
+    async_call_later,
+    async_track_state_change_event,
+    async_track_time_interval,
+)
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType
 
-from .attributes import extract_attribute_lines
+from .aggregate import Accumulator
+from .attributes import (
+    attribute_tags,
+    extract_attribute_lines,
+    extract_attribute_values,
+)
+from .backfill import STORAGE_VERSION as BACKFILL_STORAGE_VERSION, Backfiller
 from .const import (
+    CONF_ALIGN_TIMESTAMPS,
+    CONF_BACKFILL_HOURS,
     CONF_BATCH_INTERVAL,
+    CONF_COALESCE_WINDOW,
+    CONF_COMPRESSION,
+    CONF_COMPRESSION_THRESHOLD,
     CONF_ENTITY_SETTINGS,
+    CONF_EVENT_WINDOW,
     CONF_EXPORT_ENTITIES,
+    CONF_EXPORT_RULES,
+    CONF_EXTRA_ENDPOINTS,
+    CONF_FLUSH_SLICE_BUDGET,
+    CONF_HEARTBEAT_INTERVALS,
     CONF_HOST,
+    CONF_LINE_MODE,
+    CONF_MAX_BATCH_BYTES,
+    CONF_MAX_BATCH_LINES,
+    CONF_MAX_IN_FLIGHT,
     CONF_METRIC_PREFIX,
     CONF_PORT,
+    CONF_QUEUE_FULL_POLICY,
+    CONF_QUEUE_SIZE,
+    CONF_REGISTRY_TAGS,
+    CONF_REPLICAS,
+    CONF_SPOOL_EVICTION,
+    CONF_SPOOL_MAX_SIZE,
     CONF_SSL,
+    CONF_STAGGER_FLUSHES,
+    CONF_TIMESTAMP_PRECISION,
     CONF_TOKEN,
+    CONF_TRANSPORT,
     CONF_VERIFY_SSL,
+    DEADBAND_HEARTBEAT_INTERVALS,
+    DEFAULT_ALIGN_TIMESTAMPS,
+    DEFAULT_BACKFILL_HOURS,
     DEFAULT_BATCH_INTERVAL,
+    DEFAULT_COALESCE_WINDOW,
+    DEFAULT_COMPRESSION,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_EVENT_WINDOW,
+    DEFAULT_EXPORT_MODE,
+    DEFAULT_EXPORT_RULES,
+    DEFAULT_EXTRA_ENDPOINTS,
+    DEFAULT_FLUSH_SLICE_BUDGET,
+    DEFAULT_HEARTBEAT_INTERVALS,
+    DEFAULT_LINE_MODE,
+    DEFAULT_MAX_BATCH_BYTES,
+    DEFAULT_MAX_BATCH_LINES,
+    DEFAULT_MAX_IN_FLIGHT,
     DEFAULT_METRIC_PREFIX,
+    DEFAULT_QUEUE_FULL_POLICY,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_REGISTRY_TAGS,
+    DEFAULT_REPLICAS,
+    DEFAULT_SPOOL_EVICTION,
+    DEFAULT_SPOOL_MAX_SIZE,
+    DEFAULT_STAGGER_FLUSHES,
+    DEFAULT_TIMESTAMP_PRECISION,
+    DEFAULT_TRANSPORT,
     DOMAIN,
+    EXPORT_MODE_AGGREGATE,
+    EXPORT_MODE_REALTIME,
+    EXPORT_MODES,
+    FLUSH_SLICE_ENTITIES,
+    LINE_MODE_MULTI_FIELD,
     PLATFORMS,
+    SPOOL_DIR,
+    SPOOL_REPLAY_INTERVAL,
     STATE_MAP,
     build_metric_name,
 )
+from .deadband import Deadband
+from .encoders import Sample, Series, value_field
+from .enrichment import RegistryTags, TagItems
+from .options_store import OptionsStore
 from .panel import async_register_more_info_js, async_register_panel
+from .scheduler import FlushScheduler
+from .selection import EntityIndex, parse_rules
+from .sharding import parse_endpoints, parse_replicas
+from .spool import WriteSpool
 from .websocket import async_register_websocket_commands
-from .writer import VictoriaMetricsWriter
+from .writer import PRIMARY_TARGET, BatchStats, ReplicaConfig, VictoriaMetricsWriter
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def _build_tags(entity_id: str, state: State) -> dict[str, str]:
-    """Build tag dict for a state object."""
+def _build_tags(
+    entity_id: str, state: State, registry_tags: TagItems = ()
+) -> dict[str, str]:
+    """Build tag dict for a state object, plus any registry tags."""
     domain = entity_id.split(".", 1)[0]
     tags: dict[str, str] = {
         "entity_id": entity_id,
@@ -60,10 +143,18 @@ def _build_tags(entity_id: str, state: State) -> dict[str, str]:
         tags["device_class"] = str(device_class)
     if unit := attrs.get("unit_of_measurement"):
         tags["unit"] = str(unit)
+    tags.update(registry_tags)
 
     return tags
 
 
+def _uncached_sample(
+    metric_name: str, tags: dict[str, str], value: float | str, ts: int
+) -> Sample:
+    """Build a single-value sample on a series that is not cached."""
+    return Series(metric_name, tags).sample(value, ts)
+
+
 def _process_state(state_value: str) -> float | str | None:
     """Convert a state string to a numeric value, mapped boolean, or string.
 
@@ -96,42 +187,139 @@ def _build_entity_configs_from_options(
 
     Returns (entity_configs, global_batch_interval).
     """
-    prefix = options.get(CONF_METRIC_PREFIX, DEFAULT_METRIC_PREFIX)
     global_batch_interval = int(
         options.get(CONF_BATCH_INTERVAL, DEFAULT_BATCH_INTERVAL)
     )
     entity_ids: list[str] = options.get(CONF_EXPORT_ENTITIES, [])
-    entity_settings: dict[str, dict[str, Any]] = options.get(CONF_ENTITY_SETTINGS, {})
+    entity_configs = {
+        entity_id: _build_entity_config(entity_id, options) for entity_id in entity_ids
+    }
+    return entity_configs, global_batch_interval
 
-    entity_configs: dict[str, EntityConfig] = {}
-    for entity_id in entity_ids:
-        settings = entity_settings.get(entity_id, {})
-        metric_name = build_metric_name(
-            prefix, entity_id, settings.get("metric_name") or None
-        )
-        entity_configs[entity_id] = EntityConfig(
-            entity_id=entity_id,
-            metric_name=metric_name,
-            batch_interval=int(settings.get("batch_interval", global_batch_interval)),
-        )
 
-    return entity_configs, global_batch_interval
+def _build_entity_config(entity_id: str, options: Mapping[str, Any]) -> EntityConfig:
+    """Build the EntityConfig of one entity from config entry options."""
+    prefix = options.get(CONF_METRIC_PREFIX, DEFAULT_METRIC_PREFIX)
+    global_batch_interval = int(
+        options.get(CONF_BATCH_INTERVAL, DEFAULT_BATCH_INTERVAL)
+    )
+    settings = options.get(CONF_ENTITY_SETTINGS, {}).get(entity_id, {})
+    return EntityConfig(
+        entity_id=entity_id,
+        metric_name=build_metric_name(
+            prefix, entity_id, settings.get("metric_name") or None
+        ),
+        batch_interval=int(settings.get("batch_interval", global_batch_interval)),
+        export_mode=settings.get("export_mode", DEFAULT_EXPORT_MODE),
+        deadband=Deadband.from_settings(settings),
+    )
 
 
 class EntityConfig:
-    """Parsed entity configuration."""
+    """Parsed entity configuration.
+
+    Also caches the entity's tags and one Series per metric name, so the
+    escaped line prefix is only rebuilt when friendly_name, device_class or
+    unit_of_measurement change, or when the metric name is changed.
+    """
 
-    __slots__ = ("batch_interval", "entity_id", "metric_name")
+    __slots__ = (
+        "_last_sent",
+        "_series",
+        "_tag_signature",
+        "_tags",
+        "accumulator",
+        "batch_interval",
+        "deadband",
+        "entity_id",
+        "export_mode",
+        "metric_name",
+    )
 
     def __init__(
         self,
         entity_id: str,
         metric_name: str,
         batch_interval: int = DEFAULT_BATCH_INTERVAL,
+        export_mode: str = DEFAULT_EXPORT_MODE,
+        deadband: Deadband | None = None,
     ) -> None:
         self.entity_id = entity_id
         self.metric_name = metric_name
         self.batch_interval = batch_interval
+        self.export_mode = export_mode
+        self.deadband = deadband
+        # Set while the entity is in aggregate mode and being tracked
+        self.accumulator: Accumulator | None = None
+        self._tags: dict[str, str] | None = None
+        self._tag_signature: tuple[Any, ...] = ()
+        # Keyed by metric name and whether the unit tag is present, the only
+        # way the tags passed for one entity differ (see attribute_tags).
+        self._series: dict[tuple[str, bool], Series] = {}
+        # Last fields sent per series and how many repeats were skipped since
+        self._last_sent: dict[Series, tuple[dict[str, float | str], int]] = {}
+
+    def tags_for(self, state: State, registry_tags: TagItems = ()) -> dict[str, str]:
+        """Return the tags for a state, rebuilding them if they changed."""
+        attrs = state.attributes
+        signature = (
+            attrs.get("friendly_name"),
+            attrs.get("device_class"),
+            attrs.get("unit_of_measurement"),
+            registry_tags,
+        )
+        if self._tags is None or signature != self._tag_signature:
+            self._tags = _build_tags(self.entity_id, state, registry_tags)
+            self._tag_signature = signature
+            self._series.clear()
+            self._last_sent.clear()
+        return self._tags
+
+    def invalidate(self) -> None:
+        """Drop the cached series, e.g. after the metric name changed."""
+        self._series.clear()
+        self._last_sent.clear()
+
+    def series(self, metric_name: str, tags: dict[str, str]) -> Series:
+        """Return the cached series of the metric name.
+
+        Tags are only used when the series is not cached yet; tags_for
+        clears the cache whenever they change.
+        """
+        key = (metric_name, "unit" in tags)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = Series(metric_name, tags)
+        return series
+
+    def make_sample(
+        self, metric_name: str, tags: dict[str, str], value: float | str, ts: int
+    ) -> Sample:
+        """Build a single-value sample on the cached series."""
+        return self.series(metric_name, tags).sample(value, ts)
+
+    def is_state_series(self, series: Series) -> bool:
+        """Return True if the series carries the entity's state."""
+        tags = self._tags
+        return tags is not None and series is self._series.get(
+            (self.metric_name, "unit" in tags)
+        )
+
+    def is_unchanged(self, sample: Sample, heartbeat: int) -> bool:
+        """Return True if the sample repeats the last one sent on its series.
+
+        Every heartbeat-th repeat is reported as changed, so that the value
+        is resent; with a heartbeat of 0 repeats are never resent. Samples
+        reported as changed are remembered as sent.
+        """
+        last = self._last_sent.get(sample.series)
+        if last is not None and last[0] == sample.fields:
+            skipped = last[1] + 1
+            if not heartbeat or skipped < heartbeat:
+                self._last_sent[sample.series] = (last[0], skipped)
+                return True
+        self._last_sent[sample.series] = (sample.fields, 0)
+        return False
 
 
 @dataclass(slots=True)
@@ -144,10 +332,22 @@ class AuditLogEntry:
     value: float | str | None
     mode: str
     lines_count: int
+    bytes_raw: int | None = None
+    bytes_sent: int | None = None
+    encoding: str | None = None
 
 
 class ExportManager:
-    """Manages per-entity export listeners and periodic state sampling."""
+    """Manages per-entity export listeners and periodic state sampling.
+
+    Entities in batch mode are sampled on their batch interval, driven by a
+    FlushScheduler, optionally staggered across the interval.
+    Entities in realtime mode are written on every state change; changes
+    are coalesced per entity over the event window, so only the latest
+    state of an entity within the window is written. Entities in aggregate
+    mode feed every state change into an Accumulator, which the batch
+    timer flushes as a min/max/avg/count/last summary.
+    """
 
     def __init__(
         self,
@@ -155,13 +355,52 @@ class ExportManager:
         writer: VictoriaMetricsWriter,
         entity_configs: dict[str, EntityConfig],
         batch_interval: int,
+        *,
+        line_mode: str = DEFAULT_LINE_MODE,
+        align_timestamps: bool = DEFAULT_ALIGN_TIMESTAMPS,
+        event_window: float = DEFAULT_EVENT_WINDOW,
+        heartbeat_intervals: int = DEFAULT_HEARTBEAT_INTERVALS,
+        stagger_flushes: bool = DEFAULT_STAGGER_FLUSHES,
+        flush_slice_budget: float = DEFAULT_FLUSH_SLICE_BUDGET / 1000,
+        registry_tags: bool = DEFAULT_REGISTRY_TAGS,
+        backfill_hours: int = DEFAULT_BACKFILL_HOURS,
+        backfill_outages: bool = False,
+        checkpoint: Store[dict[str, Any]] | None = None,
     ) -> None:
         self.hass = hass
         self.writer = writer
         self.entity_configs = entity_configs
         self.batch_interval = batch_interval
-        self._batch_timers: dict[int, CALLBACK_TYPE] = {}
+        self.line_mode = line_mode
+        self.align_timestamps = align_timestamps
+        self.event_window = event_window
+        self.heartbeat_intervals = heartbeat_intervals
+        self.flush_slice_budget = flush_slice_budget
+        # Longest time the last batch flush held the event loop, in seconds
+        self.longest_flush_slice = 0.0
+        self._scheduler = FlushScheduler(
+            hass, self._flush_interval, stagger=stagger_flushes
+        )
+        self._aligned_ns: dict[tuple[int, int], int] = {}
+        self._registry_tags = RegistryTags(hass) if registry_tags else None
+        self.backfill = Backfiller(
+            hass,
+            self,
+            checkpoint,
+            max_age=timedelta(hours=backfill_hours),
+            outages=backfill_outages,
+        )
+        self._entity_listener: Callable[[EntityConfig, bool], None] | None = None
+        self._tracked_entities: set[str] = set()
+        self._state_listener: CALLBACK_TYPE | None = None
+        self._pending_states: dict[str, State] = {}
+        self._event_flush: CALLBACK_TYPE | None = None
+        # Event flushes started by the window timer, awaited on shutdown so
+        # that none resumes writing after the writer is closed
+        self._event_flushes: set[asyncio.Task[None]] = set()
+        self._replay_timer: CALLBACK_TYPE | None = None
         self._audit_log: deque[AuditLogEntry] = deque(maxlen=100)
+        writer.set_batch_listener(self._record_write_audit_entry)
 
     def _record_audit_entry(
         self,
@@ -185,6 +424,42 @@ class ExportManager:
             )
         )
 
+    def _record_suppression_audit_entry(
+        self, interval: int, suppressed: int, total: int
+    ) -> None:
+        """Record how many samples of a batch flush were unchanged."""
+        self._audit_log.append(
+            AuditLogEntry(
+                timestamp=time.time(),
+                entity_id="",
+                metric_name=f"batch {interval}s",
+                value=round(suppressed / total, 2),
+                mode="suppressed",
+                lines_count=suppressed,
+            )
+        )
+
+    @callback
+    def _record_write_audit_entry(self, stats: BatchStats) -> None:
+        """Record a write request, including its compression ratio."""
+        self._audit_log.append(
+            AuditLogEntry(
+                timestamp=time.time(),
+                entity_id="",
+                metric_name=(
+                    "write"
+                    if stats.target == PRIMARY_TARGET
+                    else f"write {stats.target}"
+                ),
+                value=round(stats.compression_ratio, 2),
+                mode="write" if stats.success else "write_failed",
+                lines_count=stats.lines_count,
+                bytes_raw=stats.bytes_raw,
+                bytes_sent=stats.bytes_sent,
+                encoding=stats.encoding,
+            )
+        )
+
     def get_audit_log(self, limit: int = 50) -> list[dict[str, Any]]:
         """Return recent audit log entries as dicts, newest first."""
         entries = list(self._audit_log)
@@ -192,89 +467,381 @@ class ExportManager:
         return [asdict(e) for e in entries[:limit]]
 
     def _format_state_lines(
-        self, entity_id: str, state: State, *, timestamp_ns: int | None = None
-    ) -> list[str]:
-        """Format a state and its attributes into InfluxDB line protocol strings."""
+        self,
+        entity_id: str,
+        state: State,
+        *,
+        timestamp_ns: int | None = None,
+        history: bool = False,
+    ) -> list[Sample]:
+        """Format a state and its attributes into samples for the writer.
+
+        Historical states bypass the accumulator and deadband, which only
+        track live state changes, and the entity's tag and series caches,
+        so older tags do not evict the live ones.
+        """
         ec = self.entity_configs.get(entity_id)
         if ec is None:
             return []
 
-        tags = _build_tags(entity_id, state)
+        registry_tags = (
+            self._registry_tags.get(entity_id) if self._registry_tags else ()
+        )
+        series: Callable[[str, dict[str, str]], Series]
+        make_sample: Callable[[str, dict[str, str], float | str, int], Sample]
+        if history:
+            tags = _build_tags(entity_id, state, registry_tags)
+            series, make_sample = Series, _uncached_sample
+        else:
+            tags = ec.tags_for(state, registry_tags)
+            series, make_sample = ec.series, ec.make_sample
         ts = timestamp_ns if timestamp_ns is not None else _state_to_timestamp_ns(state)
-        lines: list[str] = []
+        lines: list[Sample] = []
+
+        fields: dict[str, float | str] | None = None
+        if ec.accumulator is not None and not history:
+            # The interval ends now; ts may be snapped to an earlier grid
+            # point than changes the accumulator already holds
+            fields = ec.accumulator.flush(time.time())
+        elif (value := _process_state(state.state)) is not None:
+            if ec.deadband is not None and not history:
+                value = ec.deadband.hold(value)
+            fields = {value_field(value): value}
+        if self.line_mode == LINE_MODE_MULTI_FIELD:
+            return self._format_multi_field(ec, state, tags, fields, ts, series=series)
 
         # Primary state line
-        value = _process_state(state.state)
-        if value is not None:
-            lines.append(self.writer.format_line(ec.metric_name, tags, value, ts))
+        if fields is not None:
+            lines.append(Sample(series(ec.metric_name, tags), fields, ts))
 
         # Domain-specific attribute lines
         lines.extend(
-            extract_attribute_lines(
-                state, ec.metric_name, tags, ts, self.writer.format_line
-            )
+            extract_attribute_lines(state, ec.metric_name, tags, ts, make_sample)
         )
 
         return lines
 
+    def format_history(self, entity_id: str, state: State) -> list[Sample]:
+        """Format a state from the recorder at its original time."""
+        return self._format_state_lines(
+            entity_id, state, timestamp_ns=_state_to_timestamp_ns(state), history=True
+        )
+
+    @staticmethod
+    def _format_multi_field(
+        ec: EntityConfig,
+        state: State,
+        tags: dict[str, str],
+        state_fields: dict[str, float | str] | None,
+        ts: int,
+        *,
+        series: Callable[[str, dict[str, str]], Series],
+    ) -> list[Sample]:
+        """Format a state and its attributes as fields of one sample.
+
+        Attribute fields are named <attribute>_value (or _state_text), so
+        they map to the same <metric>_<attribute>_value series as separate
+        lines would. Attributes are written without the unit tag, so an
+        entity with a unit keeps its state on a line of its own.
+        """
+        fields: dict[str, float | str] = {
+            f"{attr_name}_{value_field(attr_value)}": attr_value
+            for attr_name, attr_value in extract_attribute_values(state).items()
+        }
+        samples: list[Sample] = []
+        if "unit" in tags:
+            if state_fields is not None:
+                samples.append(Sample(series(ec.metric_name, tags), state_fields, ts))
+            tags = attribute_tags(tags)
+        elif state_fields is not None:
+            fields = {**state_fields, **fields}
+        if fields:
+            samples.append(Sample(series(ec.metric_name, tags), fields, ts))
+        return samples
+
     def start(self) -> None:
-        """Register batch timers for all entity configs."""
-        self._sync_batch_timers()
+        """Register batch timers and state listeners for all entity configs."""
+        for eid, ec in self.entity_configs.items():
+            if ec.export_mode != EXPORT_MODE_REALTIME:
+                self._scheduler.add(eid, ec.batch_interval)
+        if self._registry_tags is not None:
+            self._registry_tags.start()
+        self._scheduler.start()
+        self._sync_state_listener()
+        for ec in self.entity_configs.values():
+            if ec.export_mode == EXPORT_MODE_AGGREGATE:
+                self._start_aggregation(ec)
+        # Write the current state of realtime entities once, rather than
+        # waiting for their first change
+        self._queue_current_states(
+            {
+                eid
+                for eid, ec in self.entity_configs.items()
+                if ec.export_mode == EXPORT_MODE_REALTIME
+            }
+        )
+        self._replay_timer = async_track_time_interval(
+            self.hass,
+            self._replay_spool,
+            timedelta(seconds=SPOOL_REPLAY_INTERVAL),
+        )
+
+        for mode in EXPORT_MODES:
+            entity_ids = [
+                eid for eid, ec in self.entity_configs.items() if ec.export_mode == mode
+            ]
+            if entity_ids:
+                _LOGGER.info(
+                    "Tracking %d entities in %s mode: %s",
+                    len(entity_ids),
+                    mode,
+                    ", ".join(entity_ids),
+                )
 
-        entity_ids = list(self.entity_configs)
+    async def _flush_interval(
+        self, interval: int, slot: int, entity_ids: set[str]
+    ) -> None:
+        """Sample the entities of a batch interval slot and write them.
+
+        Processing yields to the event loop every flush_slice_budget
+        seconds or FLUSH_SLICE_ENTITIES entities, so a flush of many
+        entities does not block Home Assistant. The entities are copied
+        first, as entity_ids is the scheduler's live index.
+        """
+        pending = list(entity_ids)
+        now_ns = int(time.time() * 1e9)
+        if self.align_timestamps:
+            # Snap to the interval grid. The timer is not aligned with the
+            # grid and may fire a little early, so never reuse the
+            # previous grid point. Staggered slots fire later in the
+            # interval but still snap to its start.
+            interval_ns = interval * 1_000_000_000
+            now_ns = max(
+                now_ns - now_ns % interval_ns,
+                self._aligned_ns.get((interval, slot), 0) + interval_ns,
+            )
+            self._aligned_ns[interval, slot] = now_ns
+        heartbeat = self.heartbeat_intervals
+        lines: list[Sample] = []
+        suppressed = 0
+        longest_slice = 0.0
+        slice_start = time.perf_counter()
+        slice_entities = 0
+        for eid in pending:
+            elapsed = time.perf_counter() - slice_start
+            if (
+                slice_entities >= FLUSH_SLICE_ENTITIES
+                or elapsed >= self.flush_slice_budget
+            ):
+                longest_slice = max(longest_slice, elapsed)
+                await asyncio.sleep(0)
+                slice_start = time.perf_counter()
+                slice_entities = 0
+            slice_entities += 1
+            state = self.hass.states.get(eid)
+            # The entity may have been removed while the flush yielded
+            ec = self.entity_configs.get(eid)
+            if state is None or ec is None:
+                continue
+            entity_lines = self._format_state_lines(eid, state, timestamp_ns=now_ns)
+            if heartbeat or ec.deadband is not None:
+                count = len(entity_lines)
+                entity_lines = self._drop_unchanged(ec, entity_lines, heartbeat)
+                suppressed += count - len(entity_lines)
+            if entity_lines:
+                value = _process_state(state.state)
+                self._record_audit_entry(eid, value, "batch", len(entity_lines))
+            lines.extend(entity_lines)
+        self.longest_flush_slice = max(longest_slice, time.perf_counter() - slice_start)
+        if suppressed:
+            self._record_suppression_audit_entry(
+                interval, suppressed, suppressed + len(lines)
+            )
+        if lines:
+            await self.writer.write_batch(lines)
+
+    def _sync_state_listener(self) -> None:
+        """Subscribe to state changes of exactly the realtime and aggregate entities."""
+        entity_ids = {
+            eid
+            for eid, ec in self.entity_configs.items()
+            if ec.export_mode in (EXPORT_MODE_REALTIME, EXPORT_MODE_AGGREGATE)
+        }
+        if entity_ids == self._tracked_entities:
+            return
+        if self._state_listener is not None:
+            self._state_listener()
+            self._state_listener = None
+        self._tracked_entities = entity_ids
         if entity_ids:
-            _LOGGER.info(
-                "Tracking %d entities in batch mode: %s",
-                len(entity_ids),
-                ", ".join(entity_ids),
+            # Dispatched through a dict keyed on entity ID, so unrelated
+            # state changes cost a single lookup
+            self._state_listener = async_track_state_change_event(
+                self.hass, entity_ids, self._handle_state_change
+            )
+
+    @callback
+    def _handle_state_change(self, event: Event[EventStateChangedData]) -> None:
+        """Aggregate a state change, or buffer it until the event window closes."""
+        new_state = event.data["new_state"]
+        if new_state is None:
+            return
+        entity_id = event.data["entity_id"]
+        ec = self.entity_configs.get(entity_id)
+        if ec is not None and ec.accumulator is not None:
+            # Attribute-only updates are not state changes, so are not counted
+            old_state = event.data["old_state"]
+            if old_state is not None and old_state.state == new_state.state:
+                return
+            value = _process_state(new_state.state)
+            if isinstance(value, float):
+                ec.accumulator.add(value, new_state.last_updated.timestamp())
+            return
+        self._pending_states[entity_id] = new_state
+        self._schedule_event_flush()
+
+    def _start_aggregation(self, ec: EntityConfig) -> None:
+        """Start aggregating an entity from its current state."""
+        state = self.hass.states.get(ec.entity_id)
+        value = _process_state(state.state) if state is not None else None
+        ec.accumulator = Accumulator(
+            value if isinstance(value, float) else None, time.time()
+        )
+
+    def _queue_current_states(self, entity_ids: set[str]) -> None:
+        """Buffer the current state of entities, as if they had changed."""
+        for eid in entity_ids:
+            if (state := self.hass.states.get(eid)) is not None:
+                self._pending_states[eid] = state
+        if self._pending_states:
+            self._schedule_event_flush()
+
+    def _schedule_event_flush(self) -> None:
+        """Flush buffered state changes once the event window closes."""
+        if self._event_flush is None:
+            self._event_flush = async_call_later(
+                self.hass, self.event_window, self._event_window_elapsed
             )
 
-    def _get_needed_batch_intervals(self) -> set[int]:
-        """Return the set of batch intervals currently in use."""
-        return {ec.batch_interval for ec in self.entity_configs.values()}
-
-    def _sync_batch_timers(self) -> None:
-        """Ensure one timer is running per unique batch interval in use."""
-        needed = self._get_needed_batch_intervals()
-
-        # Stop timers that are no longer needed
-        for interval in list(self._batch_timers):
-            if interval not in needed:
-                self._batch_timers.pop(interval)()
-
-        # Start timers that are missing
-        for interval in needed:
-            if interval not in self._batch_timers:
-                self._batch_timers[interval] = async_track_time_interval(
-                    self.hass,
-                    self._make_flush_callback(interval),
-                    timedelta(seconds=interval),
+    @callback
+    def _event_window_elapsed(self, _now: object) -> None:
+        """Start flushing the state changes buffered over the event window."""
+        self._event_flush = None
+        task = self.hass.async_create_task(
+            self._flush_events(), name="victoria_metrics_event_flush"
+        )
+        self._event_flushes.add(task)
+        task.add_done_callback(self._event_flushes.discard)
+
+    async def _flush_events(self) -> None:
+        """Write the latest buffered state of every changed entity."""
+        pending, self._pending_states = self._pending_states, {}
+        lines: list[Sample] = []
+        for eid, state in pending.items():
+            entity_lines = self._format_state_lines(eid, state)
+            ec = self.entity_configs.get(eid)
+            if ec is not None and ec.deadband is not None:
+                entity_lines = self._drop_unchanged(ec, entity_lines, 0)
+            if entity_lines:
+                value = _process_state(state.state)
+                self._record_audit_entry(
+                    eid, value, EXPORT_MODE_REALTIME, len(entity_lines)
                 )
+            lines.extend(entity_lines)
+        if lines:
+            await self.writer.write_batch(lines)
 
-    def _make_flush_callback(self, interval: int) -> Callable[..., Any]:
-        """Create a periodic sampling callback for a specific batch interval."""
+    @staticmethod
+    def _drop_unchanged(
+        ec: EntityConfig, samples: list[Sample], heartbeat: int
+    ) -> list[Sample]:
+        """Drop samples repeating the last one sent, apart from heartbeats.
+
+        Without a heartbeat only the state sample of an entity with a
+        deadband is checked, as values held by the deadband repeat it.
+        Those are resent every DEADBAND_HEARTBEAT_INTERVALS-th repeat.
+        """
+        if heartbeat:
+            return [
+                sample for sample in samples if not ec.is_unchanged(sample, heartbeat)
+            ]
+        if ec.deadband is None:
+            return samples
+        return [
+            sample
+            for sample in samples
+            if not (
+                ec.is_state_series(sample.series)
+                and ec.is_unchanged(sample, DEADBAND_HEARTBEAT_INTERVALS)
+            )
+        ]
 
-        async def _flush(_now: object = None) -> None:
-            entity_ids = {
-                eid
-                for eid, ec in self.entity_configs.items()
-                if ec.batch_interval == interval
-            }
-            now_ns = int(time.time() * 1e9)
-            lines: list[str] = []
-            for eid in entity_ids:
-                state = self.hass.states.get(eid)
-                if state is None:
-                    continue
-                entity_lines = self._format_state_lines(eid, state, timestamp_ns=now_ns)
-                if entity_lines:
-                    value = _process_state(state.state)
-                    self._record_audit_entry(eid, value, "batch", len(entity_lines))
-                lines.extend(entity_lines)
-            if lines:
-                await self.writer.write_batch(lines)
-
-        return _flush
+    async def _replay_spool(self, _now: object = None) -> None:
+        """Re-probe endpoints that are down and replay spooled batches."""
+        await self.writer.check_endpoints()
+        await self.writer.replay_spool()
+
+    @callback
+    def add_entities(self, ecs: Iterable[EntityConfig]) -> None:
+        """Start exporting entities that are not exported yet."""
+        realtime: set[str] = set()
+        added: list[str] = []
+        for ec in ecs:
+            entity_id = ec.entity_id
+            if entity_id in self.entity_configs:
+                continue
+            self.entity_configs[entity_id] = ec
+            added.append(entity_id)
+            if ec.export_mode == EXPORT_MODE_REALTIME:
+                realtime.add(entity_id)
+            else:
+                self._scheduler.add(entity_id, ec.batch_interval)
+            if ec.export_mode == EXPORT_MODE_AGGREGATE:
+                self._start_aggregation(ec)
+            if self._entity_listener is not None:
+                self._entity_listener(ec, True)
+            _LOGGER.debug("Started exporting %s in %s mode", entity_id, ec.export_mode)
+        if added:
+            self._sync_state_listener()
+            self._queue_current_states(realtime)
+            self.backfill.request_recent(added)
+            _LOGGER.info("Started exporting %d entities", len(added))
+
+    @callback
+    def add_entities_from_options(
+        self, entity_ids: Iterable[str], options: Mapping[str, Any]
+    ) -> None:
+        """Start exporting entities with their settings from entry options."""
+        self.add_entities(
+            _build_entity_config(entity_id, options)
+            for entity_id in entity_ids
+            if entity_id not in self.entity_configs
+        )
+
+    @callback
+    def remove_entities(self, entity_ids: Iterable[str]) -> None:
+        """Stop exporting entities."""
+        removed = 0
+        for entity_id in entity_ids:
+            ec = self.entity_configs.pop(entity_id, None)
+            if ec is None:
+                continue
+            removed += 1
+            if ec.export_mode != EXPORT_MODE_REALTIME:
+                self._scheduler.remove(entity_id, ec.batch_interval)
+            self._pending_states.pop(entity_id, None)
+            if self._entity_listener is not None:
+                self._entity_listener(ec, False)
+            _LOGGER.debug("Stopped exporting %s", entity_id)
+        if removed:
+            self._sync_state_listener()
+            _LOGGER.info("Stopped exporting %d entities", removed)
+
+    def set_entity_listener(
+        self, listener: Callable[[EntityConfig, bool], None]
+    ) -> None:
+        """Register a callback invoked when an entity is added or removed."""
+        self._entity_listener = listener
 
     @callback
     def set_batch_interval(self, entity_id: str, interval: int) -> None:
@@ -284,10 +851,45 @@ class ExportManager:
             return
         if ec.batch_interval == interval:
             return
+        if ec.export_mode != EXPORT_MODE_REALTIME:
+            self._scheduler.move(entity_id, ec.batch_interval, interval)
         ec.batch_interval = interval
-        self._sync_batch_timers()
         _LOGGER.info("Changed batch interval for %s to %ds", entity_id, interval)
 
+    @callback
+    def set_export_mode(self, entity_id: str, mode: str) -> None:
+        """Switch an entity between batch, realtime and aggregate export."""
+        ec = self.entity_configs.get(entity_id)
+        if ec is None:
+            return
+        if ec.export_mode == mode:
+            return
+        ec.export_mode = mode
+        ec.accumulator = None
+        if mode == EXPORT_MODE_REALTIME:
+            self._scheduler.remove(entity_id, ec.batch_interval)
+        else:
+            self._scheduler.add(entity_id, ec.batch_interval)
+        self._sync_state_listener()
+        if mode == EXPORT_MODE_REALTIME:
+            self._queue_current_states({entity_id})
+        elif mode == EXPORT_MODE_AGGREGATE:
+            self._start_aggregation(ec)
+        _LOGGER.info("Changed export mode for %s to %s", entity_id, mode)
+
+    @callback
+    def set_deadband(self, entity_id: str, deadband: Deadband | None) -> None:
+        """Change the deadband of an entity, or remove it with None."""
+        ec = self.entity_configs.get(entity_id)
+        if ec is None:
+            return
+        ec.deadband = deadband
+        _LOGGER.info(
+            "Changed deadband for %s to %s",
+            entity_id,
+            f"{deadband.absolute} / {deadband.percent}%" if deadband else "none",
+        )
+
     @callback
     def set_metric_name(self, entity_id: str, metric_name: str) -> None:
         """Change the metric name for an entity."""
@@ -297,17 +899,33 @@ class ExportManager:
         if ec.metric_name == metric_name:
             return
         ec.metric_name = metric_name
+        ec.invalidate()
         _LOGGER.info("Changed metric name for %s to %s", entity_id, metric_name)
 
     async def shutdown(self) -> None:
         """Clean up all listeners and send final sample."""
-        for unsub in self._batch_timers.values():
-            unsub()
-        self._batch_timers.clear()
-
-        # Final sample of all entities before closing
+        await self.backfill.async_stop()
+        self.writer.begin_close()
+        await self._scheduler.async_stop()
+        if self._registry_tags is not None:
+            self._registry_tags.stop()
+        if self._replay_timer is not None:
+            self._replay_timer()
+            self._replay_timer = None
+        if self._state_listener is not None:
+            self._state_listener()
+            self._state_listener = None
+        if self._event_flush is not None:
+            self._event_flush()
+            self._event_flush = None
+        if self._event_flushes:
+            await asyncio.gather(*self._event_flushes, return_exceptions=True)
+        await self._flush_events()
+
+        # Final sample of all entities before closing. It keeps its exact
+        # time, as snapping it could overwrite the last grid-aligned sample.
         now_ns = int(time.time() * 1e9)
-        lines: list[str] = []
+        lines: list[Sample] = []
         for eid in self.entity_configs:
             state = self.hass.states.get(eid)
             if state is None:
@@ -328,14 +946,89 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     return True
 
 
+def _spool_path(hass: HomeAssistant, entry: ConfigEntry) -> Path:
+    """Return the spool directory for a config entry."""
+    return Path(hass.config.path(SPOOL_DIR, entry.entry_id))
+
+
+def _backfill_store(hass: HomeAssistant, entry: ConfigEntry) -> Store[dict[str, Any]]:
+    """Return the store of the backfill checkpoint of a config entry."""
+    return Store(hass, BACKFILL_STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.backfill")
+
+
+async def _async_open_spool(
+    hass: HomeAssistant, entry: ConfigEntry, directory: Path
+) -> WriteSpool | None:
+    """Open a spool in directory, or return None if spooling is disabled."""
+    spool_max_size = int(entry.options.get(CONF_SPOOL_MAX_SIZE, DEFAULT_SPOOL_MAX_SIZE))
+    if spool_max_size <= 0:
+        return None
+    spool = WriteSpool(
+        directory,
+        spool_max_size * 1024 * 1024,
+        eviction=entry.options.get(CONF_SPOOL_EVICTION, DEFAULT_SPOOL_EVICTION),
+    )
+    await hass.async_add_executor_job(spool.open)
+    return spool
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Victoria Metrics connection from config entry (UI)."""
+    spool_path = _spool_path(hass, entry)
+    spool = await _async_open_spool(hass, entry, spool_path)
+    # Replica spools live below the primary one, keyed by URL so that they
+    # survive reordering the replica list.
+    replicas = [
+        ReplicaConfig(
+            url,
+            token,
+            await _async_open_spool(
+                hass,
+                entry,
+                spool_path
+                / f"replica_{hashlib.blake2b(url.encode(), digest_size=6).hexdigest()}",
+            ),
+        )
+        for url, token in parse_replicas(
+            entry.options.get(CONF_REPLICAS, DEFAULT_REPLICAS)
+        )
+    ]
+
     writer = VictoriaMetricsWriter(
         host=entry.data[CONF_HOST],
         port=entry.data[CONF_PORT],
         ssl=entry.data.get(CONF_SSL, False),
         verify_ssl=entry.data.get(CONF_VERIFY_SSL, True),
         token=entry.data.get(CONF_TOKEN) or None,
+        compression=entry.options.get(CONF_COMPRESSION, DEFAULT_COMPRESSION),
+        compression_threshold=int(
+            entry.options.get(CONF_COMPRESSION_THRESHOLD, DEFAULT_COMPRESSION_THRESHOLD)
+        ),
+        spool=spool,
+        max_in_flight=int(entry.options.get(CONF_MAX_IN_FLIGHT, DEFAULT_MAX_IN_FLIGHT)),
+        queue_size=int(entry.options.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE)),
+        queue_full_policy=entry.options.get(
+            CONF_QUEUE_FULL_POLICY, DEFAULT_QUEUE_FULL_POLICY
+        ),
+        max_batch_lines=int(
+            entry.options.get(CONF_MAX_BATCH_LINES, DEFAULT_MAX_BATCH_LINES)
+        ),
+        max_batch_bytes=int(
+            entry.options.get(CONF_MAX_BATCH_BYTES, DEFAULT_MAX_BATCH_BYTES)
+        )
+        * 1024,
+        coalesce_window=float(
+            entry.options.get(CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW)
+        ),
+        transport=entry.options.get(CONF_TRANSPORT, DEFAULT_TRANSPORT),
+        precision=entry.options.get(
+            CONF_TIMESTAMP_PRECISION, DEFAULT_TIMESTAMP_PRECISION
+        ),
+        extra_endpoints=parse_endpoints(
+            entry.options.get(CONF_EXTRA_ENDPOINTS, DEFAULT_EXTRA_ENDPOINTS),
+            entry.data[CONF_PORT],
+        ),
+        replicas=replicas,
     )
 
     if not await writer.test_connection():
@@ -356,6 +1049,32 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     domain_data = hass.data.setdefault(DOMAIN, {})
     entity_configs, batch_interval = _build_entity_configs_from_options(entry.options)
 
+    store = OptionsStore(hass, entry)
+    entry.async_on_unload(
+        hass.bus.async_listen(EVENT_HOMEASSISTANT_STOP, store.async_save)
+    )
+    rules = parse_rules(entry.options.get(CONF_EXPORT_RULES, DEFAULT_EXPORT_RULES))
+    index: EntityIndex | None = None
+    if rules:
+
+        @callback
+        def _rule_matched(entity_id: str) -> None:
+            manager.add_entities_from_options([entity_id], store.options)
+
+        @callback
+        def _rule_unmatched(entity_id: str) -> None:
+            # Explicitly listed entities stay exported
+            if entity_id not in store.entity_set:
+                manager.remove_entities([entity_id])
+
+        index = EntityIndex(
+            hass, rules, on_add=_rule_matched, on_remove=_rule_unmatched
+        )
+        matched = index.resolve()
+        for entity_id in matched.difference(entity_configs):
+            entity_configs[entity_id] = _build_entity_config(entity_id, entry.options)
+        _LOGGER.info("Export rules matched %d entities", len(matched))
+
     if not entity_configs:
         _LOGGER.warning(
             "No entity mappings configured for Victoria Metrics. "
@@ -363,13 +1082,45 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             "to select entities for export.",
         )
 
-    manager = ExportManager(hass, writer, entity_configs, batch_interval)
+    manager = ExportManager(
+        hass,
+        writer,
+        entity_configs,
+        batch_interval,
+        line_mode=entry.options.get(CONF_LINE_MODE, DEFAULT_LINE_MODE),
+        align_timestamps=entry.options.get(
+            CONF_ALIGN_TIMESTAMPS, DEFAULT_ALIGN_TIMESTAMPS
+        ),
+        stagger_flushes=entry.options.get(
+            CONF_STAGGER_FLUSHES, DEFAULT_STAGGER_FLUSHES
+        ),
+        flush_slice_budget=entry.options.get(
+            CONF_FLUSH_SLICE_BUDGET, DEFAULT_FLUSH_SLICE_BUDGET
+        )
+        / 1000,
+        registry_tags=entry.options.get(CONF_REGISTRY_TAGS, DEFAULT_REGISTRY_TAGS),
+        event_window=float(entry.options.get(CONF_EVENT_WINDOW, DEFAULT_EVENT_WINDOW)),
+        heartbeat_intervals=int(
+            entry.options.get(CONF_HEARTBEAT_INTERVALS, DEFAULT_HEARTBEAT_INTERVALS)
+        ),
+        backfill_hours=int(
+            entry.options.get(CONF_BACKFILL_HOURS, DEFAULT_BACKFILL_HOURS)
+        ),
+        # Without a spool, samples of an outage are lost unless backfilled
+        backfill_outages=spool is None,
+        checkpoint=_backfill_store(hass, entry),
+    )
     manager.start()
+    await manager.backfill.async_start()
+    if index is not None:
+        index.start()
 
     # Store runtime data keyed by entry_id
     domain_data[entry.entry_id] = {
         "manager": manager,
         "writer": writer,
+        "index": index,
+        "store": store,
     }
 
     # Forward platform setup
@@ -385,8 +1136,17 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     domain_data = hass.data.get(DOMAIN, {})
     entry_data = domain_data.pop(entry.entry_id, None)
     if entry_data:
+        entry_data["store"].async_save()
+        if index := entry_data.get("index"):
+            index.stop()
         manager = entry_data.get("manager")
         if manager:
             await manager.shutdown()
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the spool and backfill checkpoint of a removed config entry."""
+    await hass.async_add_executor_job(shutil.rmtree, _spool_path(hass, entry), True)
+    await _backfill_store(hass, entry).async_remove()
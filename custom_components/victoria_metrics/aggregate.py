@@ -0,0 +1,67 @@
+"""Constant-memory aggregation of numeric state changes between flushes.
+
+Entities in aggregate mode are not point-sampled. Every state change feeds
+an Accumulator, and each flush writes a summary of the interval as the
+fields min, max, avg, count and last, which Victoria Metrics stores as the
+<metric>_min, <metric>_max, ... series.
+"""
+
+from __future__ import annotations
+
+
+class Accumulator:
+    """Running min/max/time-weighted average/count/last of one entity.
+
+    The value held when an interval starts counts towards its min, max and
+    average, so an interval without changes summarizes to that value with
+    a count of 0. The average is weighted by how long each value was held.
+    """
+
+    __slots__ = ("_area", "_since", "_start", "count", "last", "max", "min")
+
+    def __init__(self, value: float | None, now: float) -> None:
+        self._reset(value, now)
+
+    def _reset(self, value: float | None, now: float) -> None:
+        """Start a new interval holding value."""
+        self.count = 0
+        self.last = value
+        self.min = value
+        self.max = value
+        self._area = 0.0
+        self._start = now
+        self._since = now
+
+    def add(self, value: float, now: float) -> None:
+        """Record a state change to value at time now."""
+        if self.last is None or self.min is None or self.max is None:
+            # Nothing was held before, so the interval starts here
+            self._start = now
+            self.min = self.max = value
+        else:
+            self._area += self.last * max(0.0, now - self._since)
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+        self._since = max(self._since, now)
+        self.last = value
+        self.count += 1
+
+    def flush(self, now: float) -> dict[str, float | str] | None:
+        """Return the summary of the interval ending now and start the next.
+
+        Returns None if no numeric value has been seen yet.
+        """
+        last, low, high = self.last, self.min, self.max
+        if last is None or low is None or high is None:
+            return None
+        duration = now - self._start
+        area = self._area + last * max(0.0, now - self._since)
+        summary: dict[str, float | str] = {
+            "min": low,
+            "max": high,
+            "avg": area / duration if duration > 0 else last,
+            "count": float(self.count),
+            "last": last,
+        }
+        self._reset(last, now)
+        return summary
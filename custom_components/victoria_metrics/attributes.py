@@ -89,48 +89,61 @@ def _process_attribute(raw_value: Any) -> float | str | None:
         return STATE_MAP.get(lower, raw_value)
 
 
-def extract_attribute_lines(
+def extract_attribute_values(state: State) -> dict[str, float | str]:
+    """Return the converted DOMAIN_ATTRIBUTES values present on a state."""
+    domain = state.entity_id.split(".", 1)[0]
+    attr_names = DOMAIN_ATTRIBUTES.get(domain)
+    if attr_names is None:
+        return {}
+
+    values: dict[str, float | str] = {}
+    attrs = state.attributes
+    for attr_name in attr_names:
+        value = _process_attribute(attrs.get(attr_name))
+        if value is not None:
+            values[attr_name] = value
+    return values
+
+
+def attribute_tags(tags: dict[str, str]) -> dict[str, str]:
+    """Return the tags of attribute metrics.
+
+    Drops the primary entity's unit tag, as attributes may have different units.
+    """
+    return {k: v for k, v in tags.items() if k != "unit"}
+
+
+def extract_attribute_lines[T](
     state: State,
     base_metric_name: str,
     tags: dict[str, str],
     timestamp_ns: int,
-    format_line: Callable[[str, dict[str, str], float | str, int], str],
-) -> list[str]:
+    format_line: Callable[[str, dict[str, str], float | str, int], T],
+) -> list[T]:
     """Extract additional metric lines from entity attributes.
 
     Looks up the entity's domain in DOMAIN_ATTRIBUTES, converts each present
-    attribute to a value, and produces an InfluxDB line protocol string per
-    attribute using the caller-provided format_line function.
+    attribute to a value, and produces one line per attribute using the
+    caller-provided format_line function (e.g. EntityConfig.make_sample).
 
     Args:
         state: The HA state object with .entity_id and .attributes.
         base_metric_name: Primary metric name (e.g. "ha_thermostat").
         tags: Base tag dict shared with the primary metric line.
         timestamp_ns: Timestamp in nanoseconds since epoch.
-        format_line: Writer's format_line static method.
+        format_line: Builds a line from (metric name, tags, value,
+            timestamp_ns), e.g. EntityConfig.make_sample.
 
     Returns:
-        List of line protocol strings. Empty if domain has no configured
-        attributes or all attribute values are None.
+        List of whatever format_line returns. Empty if domain has no
+        configured attributes or all attribute values are None.
     """
-    domain = state.entity_id.split(".", 1)[0]
-    attr_names = DOMAIN_ATTRIBUTES.get(domain)
-    if attr_names is None:
+    values = extract_attribute_values(state)
+    if not values:
         return []
 
-    lines: list[str] = []
-    attrs = state.attributes
-
-    # Drop the primary entity's unit tag — attributes may have different units.
-    attr_tags = {k: v for k, v in tags.items() if k != "unit"}
-
-    for attr_name in attr_names:
-        raw_value = attrs.get(attr_name)
-        value = _process_attribute(raw_value)
-        if value is None:
-            continue
-
-        attr_metric_name = f"{base_metric_name}_{attr_name}"
-        lines.append(format_line(attr_metric_name, attr_tags, value, timestamp_ns))
-
-    return lines
+    attr_tags = attribute_tags(tags)
+    return [
+        format_line(f"{base_metric_name}_{attr_name}", attr_tags, value, timestamp_ns)
+        for attr_name, value in values.items()
+    ]
@@ -0,0 +1,316 @@
+"""Backfill of exported entities from the Home Assistant recorder.
+
+The recorder already holds the history of entities that are newly
+exported, and of time ranges in which nothing reached Victoria Metrics.
+Backfiller reads it in chunks of BACKFILL_QUERY_ENTITIES entities and
+BACKFILL_CHUNK seconds, so memory use stays bounded, and writes every state
+with its original last_updated timestamp. Writing is limited to
+BACKFILL_RATE samples per second and waits while the send queue is backed
+up or Victoria Metrics is down, so live export keeps priority.
+
+A checkpoint in .storage records the exported entities and the time up to
+which they were exported. On startup the downtime since the checkpoint is
+backfilled, as is the history of entities that were not exported before.
+Historical states are written as they were: aggregate summaries and
+deadbands only apply to live export.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from functools import partial
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from homeassistant.components.recorder import get_instance, history
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, State, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    BACKFILL_CHECKPOINT_INTERVAL,
+    BACKFILL_CHUNK,
+    BACKFILL_MAX_QUEUE_DEPTH,
+    BACKFILL_QUERY_ENTITIES,
+    BACKFILL_RATE,
+    DEFAULT_BACKFILL_HOURS,
+    FLUSH_SLICE_ENTITIES,
+)
+
+if TYPE_CHECKING:
+    from . import ExportManager
+    from .encoders import Sample
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+
+# Seconds between checks whether the send queue has drained
+QUEUE_POLL_INTERVAL = 1
+
+
+class BackfillJob(NamedTuple):
+    """Entities and the time range to backfill them for."""
+
+    entity_ids: list[str]
+    start: datetime
+    end: datetime
+
+    @property
+    def chunks(self) -> int:
+        """Return the number of recorder queries the job takes."""
+        groups = math.ceil(len(self.entity_ids) / BACKFILL_QUERY_ENTITIES)
+        windows = math.ceil((self.end - self.start).total_seconds() / BACKFILL_CHUNK)
+        return groups * windows
+
+
+@dataclass(slots=True)
+class BackfillProgress:
+    """Progress of the current or last backfill run."""
+
+    running: bool = False
+    chunks_done: int = 0
+    chunks_total: int = 0
+    samples_written: int = 0
+    # Start of the time range being read, seconds since the epoch
+    position: float | None = None
+    finished: float | None = None
+
+
+class Backfiller:
+    """Queue of backfill jobs, run one at a time in the background."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        manager: ExportManager,
+        store: Store[dict[str, Any]] | None,
+        *,
+        max_age: timedelta,
+        outages: bool,
+    ) -> None:
+        """Initialize the backfiller.
+
+        max_age bounds automatic backfill; zero disables it. With outages
+        set, time in which no endpoint was reachable is backfilled once one
+        is again, for when the spool does not keep those samples.
+        """
+        self.hass = hass
+        self._manager = manager
+        self._store = store
+        self._max_age = max_age
+        self._outages = outages
+        self.progress = BackfillProgress()
+        self._jobs: deque[BackfillJob] = deque()
+        self._task: asyncio.Task[None] | None = None
+        self._exported_until = time.time()
+        self._outage = False
+        self._unsub_checkpoint: CALLBACK_TYPE | None = None
+
+    async def async_start(self) -> None:
+        """Backfill the downtime since the checkpoint and keep it current."""
+        data = await self._store.async_load() if self._store is not None else None
+        now = dt_util.utcnow()
+        if data is not None and self._max_age:
+            earliest = now - self._max_age
+            since = max(dt_util.utc_from_timestamp(data["exported_until"]), earliest)
+            previous = set(data["entities"])
+            known: list[str] = []
+            new: list[str] = []
+            for entity_id in self._manager.entity_configs:
+                (known if entity_id in previous else new).append(entity_id)
+            self.request(known, since, now)
+            self.request(new, earliest, now)
+        self._exported_until = now.timestamp()
+        self._save_checkpoint()
+        self._unsub_checkpoint = async_track_time_interval(
+            self.hass,
+            self._checkpoint,
+            timedelta(seconds=BACKFILL_CHECKPOINT_INTERVAL),
+        )
+
+    async def async_stop(self) -> None:
+        """Cancel backfill and save the checkpoint."""
+        if self._unsub_checkpoint is not None:
+            self._unsub_checkpoint()
+            self._unsub_checkpoint = None
+        await self.async_cancel()
+        if self._store is not None:
+            if not self._outage:
+                self._exported_until = time.time()
+            await self._store.async_save(self._checkpoint_data())
+
+    @property
+    def hours(self) -> int:
+        """Return the hours a manual backfill covers.
+
+        That is the configured backfill window, or the default one while
+        automatic backfill is disabled.
+        """
+        hours = int(self._max_age.total_seconds() // 3600)
+        return hours or DEFAULT_BACKFILL_HOURS
+
+    def status(self) -> dict[str, Any]:
+        """Return the progress, the number of queued jobs and the window."""
+        return {
+            **asdict(self.progress),
+            "queued": len(self._jobs),
+            "hours": self.hours,
+        }
+
+    @callback
+    def request(
+        self, entity_ids: Iterable[str], start: datetime, end: datetime
+    ) -> None:
+        """Queue a backfill of entities between start and end."""
+        entity_ids = list(entity_ids)
+        if not entity_ids or start >= end:
+            return
+        if "recorder" not in self.hass.config.components:
+            _LOGGER.debug(
+                "Recorder not loaded, not backfilling %d entities", len(entity_ids)
+            )
+            return
+        if self._task is None:
+            self.progress = BackfillProgress(running=True)
+        job = BackfillJob(entity_ids, start, end)
+        self._jobs.append(job)
+        self.progress.chunks_total += job.chunks
+        if self._task is None:
+            self._task = self.hass.async_create_background_task(
+                self._run(), name="victoria_metrics_backfill"
+            )
+
+    @callback
+    def request_recent(self, entity_ids: Iterable[str]) -> None:
+        """Queue a backfill of newly exported entities, if enabled."""
+        if self._max_age:
+            now = dt_util.utcnow()
+            self.request(entity_ids, now - self._max_age, now)
+
+    async def async_cancel(self) -> None:
+        """Drop queued jobs and stop the running one."""
+        self._jobs.clear()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        """Run queued jobs until there are none left."""
+        try:
+            while self._jobs:
+                await self._backfill(self._jobs.popleft())
+        except Exception:
+            _LOGGER.exception("Backfill from the recorder failed")
+        finally:
+            self._task = None
+            self.progress.running = False
+            self.progress.position = None
+            self.progress.finished = time.time()
+
+    async def _backfill(self, job: BackfillJob) -> None:
+        """Read the history of a job chunk by chunk and write it."""
+        _LOGGER.info(
+            "Backfilling %d entities from %s to %s",
+            len(job.entity_ids),
+            job.start.isoformat(timespec="seconds"),
+            job.end.isoformat(timespec="seconds"),
+        )
+        chunk = timedelta(seconds=BACKFILL_CHUNK)
+        recorder = get_instance(self.hass)
+        # At startup the recorder may still be migrating its database
+        if not await recorder.async_db_ready:
+            _LOGGER.warning("Recorder database not available, skipping backfill")
+            return
+        for offset in range(0, len(job.entity_ids), BACKFILL_QUERY_ENTITIES):
+            group = job.entity_ids[offset : offset + BACKFILL_QUERY_ENTITIES]
+            start = job.start
+            while start < job.end:
+                end = min(start + chunk, job.end)
+                self.progress.position = start.timestamp()
+                states = await recorder.async_add_executor_job(
+                    partial(
+                        history.get_significant_states,
+                        self.hass,
+                        start,
+                        end,
+                        group,
+                        include_start_time_state=False,
+                        significant_changes_only=False,
+                    )
+                )
+                await self._write(states)
+                self.progress.chunks_done += 1
+                start = end
+
+    async def _write(self, states: dict[str, list[State | dict[str, Any]]]) -> None:
+        """Format historical states and write them at the backfill rate."""
+        manager = self._manager
+        lines: list[Sample] = []
+        formatted = 0
+        for entity_id, entity_states in states.items():
+            for state in entity_states:
+                if not isinstance(state, State):
+                    continue
+                lines.extend(manager.format_history(entity_id, state))
+                formatted += 1
+                if formatted % FLUSH_SLICE_ENTITIES == 0:
+                    await asyncio.sleep(0)
+        writer = manager.writer
+        for offset in range(0, len(lines), BACKFILL_RATE):
+            await self._wait_for_live_export()
+            part = lines[offset : offset + BACKFILL_RATE]
+            await writer.write_batch(part)
+            self.progress.samples_written += len(part)
+            await asyncio.sleep(len(part) / BACKFILL_RATE)
+
+    async def _wait_for_live_export(self) -> None:
+        """Wait while live batches are queued up or no endpoint is reachable."""
+        writer = self._manager.writer
+        while True:
+            if (
+                writer.queue_stats.queue_depth < BACKFILL_MAX_QUEUE_DEPTH
+                and writer.healthy_endpoints
+            ):
+                return
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+    @callback
+    def _checkpoint(self, _now: object = None) -> None:
+        """Advance the checkpoint, and backfill outages once they end."""
+        if self._outages and not self._manager.writer.healthy_endpoints:
+            if not self._outage:
+                _LOGGER.info("Victoria Metrics unreachable, holding the checkpoint")
+                self._outage = True
+            return
+        now = time.time()
+        if self._outage:
+            self._outage = False
+            if self._max_age:
+                since = max(self._exported_until, now - self._max_age.total_seconds())
+                self.request(
+                    list(self._manager.entity_configs),
+                    dt_util.utc_from_timestamp(since),
+                    dt_util.utc_from_timestamp(now),
+                )
+        self._exported_until = now
+        self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        """Schedule writing the checkpoint to .storage."""
+        if self._store is not None:
+            self._store.async_delay_save(self._checkpoint_data, 0)
+
+    def _checkpoint_data(self) -> dict[str, Any]:
+        """Return the checkpoint as stored."""
+        return {
+            "exported_until": self._exported_until,
+            "entities": list(self._manager.entity_configs),
+        }
@@ -0,0 +1,101 @@
+"""Circuit breaker with jittered exponential backoff for write endpoints.
+
+A closed breaker lets requests through and counts consecutive failures.
+Once CIRCUIT_FAILURE_THRESHOLD is reached it opens: requests are no longer
+attempted until a jittered, exponentially growing delay has passed. The
+breaker then becomes half-open, and the caller probes the endpoint's cheap
+/health check instead of sending data. A successful probe closes the
+breaker; a failed one opens it again with a longer delay.
+"""
+
+from __future__ import annotations
+
+from enum import StrEnum
+import random
+import time
+
+from .const import CIRCUIT_BASE_DELAY, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_MAX_DELAY
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Return an "equal jitter" exponential backoff delay.
+
+    Half of the delay is fixed and half is random, so clients that failed
+    together do not retry together.
+    """
+    delay = min(cap, base * (1 << min(attempt, 32)))
+    return delay / 2 + random.uniform(0, delay / 2)  # noqa: S311
+
+
+class BreakerState(StrEnum):
+    """State of a circuit breaker."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Track consecutive failures of one endpoint."""
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        base_delay: float = CIRCUIT_BASE_DELAY,
+        max_delay: float = CIRCUIT_MAX_DELAY,
+    ) -> None:
+        """Initialize a closed breaker."""
+        self.state = BreakerState.CLOSED
+        self._failure_threshold = max(1, failure_threshold)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+
+    @property
+    def closed(self) -> bool:
+        """Return True if requests may be sent."""
+        return self.state is BreakerState.CLOSED
+
+    @property
+    def retry_in(self) -> float:
+        """Return the seconds until the breaker may be probed."""
+        return max(0.0, self._open_until - time.monotonic())
+
+    def record_success(self) -> None:
+        """Close the breaker and reset the backoff."""
+        self.state = BreakerState.CLOSED
+        self._failures = 0
+        self._trips = 0
+
+    def record_failure(self, retry_after: float | None = None) -> None:
+        """Count a failure, opening the breaker at the threshold.
+
+        A failed half-open probe opens the breaker again right away.
+        """
+        self._failures += 1
+        if (
+            self.state is BreakerState.HALF_OPEN
+            or self._failures >= self._failure_threshold
+        ):
+            self.trip(retry_after)
+
+    def trip(self, retry_after: float | None = None) -> None:
+        """Open the breaker, honouring a server-provided Retry-After."""
+        delay = backoff_delay(self._trips, self._base_delay, self._max_delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self._max_delay))
+        self._trips += 1
+        self._open_until = time.monotonic() + delay
+        self.state = BreakerState.OPEN
+
+    def try_half_open(self) -> bool:
+        """Move an open breaker whose delay has passed to half-open.
+
+        Returns True if the caller should now probe the endpoint.
+        """
+        if self.state is BreakerState.OPEN and time.monotonic() >= self._open_until:
+            self.state = BreakerState.HALF_OPEN
+            return True
+        return False
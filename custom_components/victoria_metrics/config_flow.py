@@ -15,31 +15,89 @@ from homeassistant.config_entries import (
 from homeassistant.core import callback
 from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.selector import (
+    BooleanSelector,
     EntitySelector,
     EntitySelectorConfig,
     NumberSelector,
     NumberSelectorConfig,
     NumberSelectorMode,
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
     TextSelector,
     TextSelectorConfig,
 )
 import voluptuous as vol
 
 from .const import (
+    COMPRESSION_MODES,
+    CONF_ALIGN_TIMESTAMPS,
+    CONF_BACKFILL_HOURS,
     CONF_BATCH_INTERVAL,
+    CONF_COALESCE_WINDOW,
+    CONF_COMPRESSION,
+    CONF_COMPRESSION_THRESHOLD,
+    CONF_EVENT_WINDOW,
     CONF_EXPORT_ENTITIES,
+    CONF_EXPORT_RULES,
+    CONF_EXTRA_ENDPOINTS,
+    CONF_FLUSH_SLICE_BUDGET,
+    CONF_HEARTBEAT_INTERVALS,
     CONF_HOST,
+    CONF_LINE_MODE,
+    CONF_MAX_BATCH_BYTES,
+    CONF_MAX_BATCH_LINES,
+    CONF_MAX_IN_FLIGHT,
     CONF_METRIC_PREFIX,
     CONF_PORT,
+    CONF_QUEUE_FULL_POLICY,
+    CONF_QUEUE_SIZE,
+    CONF_REGISTRY_TAGS,
+    CONF_REPLICAS,
+    CONF_SPOOL_EVICTION,
+    CONF_SPOOL_MAX_SIZE,
     CONF_SSL,
+    CONF_STAGGER_FLUSHES,
+    CONF_TIMESTAMP_PRECISION,
     CONF_TOKEN,
+    CONF_TRANSPORT,
     CONF_VERIFY_SSL,
+    DEFAULT_ALIGN_TIMESTAMPS,
+    DEFAULT_BACKFILL_HOURS,
     DEFAULT_BATCH_INTERVAL,
+    DEFAULT_COALESCE_WINDOW,
+    DEFAULT_COMPRESSION,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_EVENT_WINDOW,
+    DEFAULT_EXPORT_RULES,
+    DEFAULT_EXTRA_ENDPOINTS,
+    DEFAULT_FLUSH_SLICE_BUDGET,
+    DEFAULT_HEARTBEAT_INTERVALS,
+    DEFAULT_LINE_MODE,
+    DEFAULT_MAX_BATCH_BYTES,
+    DEFAULT_MAX_BATCH_LINES,
+    DEFAULT_MAX_IN_FLIGHT,
     DEFAULT_METRIC_PREFIX,
     DEFAULT_PORT,
+    DEFAULT_QUEUE_FULL_POLICY,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_REGISTRY_TAGS,
+    DEFAULT_REPLICAS,
+    DEFAULT_SPOOL_EVICTION,
+    DEFAULT_SPOOL_MAX_SIZE,
+    DEFAULT_STAGGER_FLUSHES,
+    DEFAULT_TIMESTAMP_PRECISION,
+    DEFAULT_TRANSPORT,
     DOMAIN,
+    LINE_MODES,
+    PRECISIONS,
+    QUEUE_FULL_POLICIES,
+    SPOOL_EVICTION_POLICIES,
+    TRANSPORTS,
     build_metric_name,
 )
+from .selection import EntityIndex, parse_rules
+from .sharding import parse_endpoints, parse_replicas
 from .writer import VictoriaMetricsWriter
 
 _LOGGER = logging.getLogger(__name__)
@@ -168,9 +226,21 @@ class VictoriaMetricsOptionsFlowHandler(OptionsFlowWithConfigEntry):
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
         """Manage the export options."""
+        errors: dict[str, str] = {}
+        if user_input is None and (
+            entry_data := self.hass.data.get(DOMAIN, {}).get(self.config_entry.entry_id)
+        ):
+            # Save edits made in the panel first, so the form starts from them
+            entry_data["store"].async_save()
+            self.options.update(self.config_entry.options)
         if user_input is not None:
-            self._user_input = user_input
-            return await self.async_step_preview()
+            try:
+                parse_rules(user_input.get(CONF_EXPORT_RULES, DEFAULT_EXPORT_RULES))
+            except ValueError:
+                errors[CONF_EXPORT_RULES] = "invalid_rules"
+            else:
+                self._user_input = user_input
+                return await self.async_step_delivery()
 
         # Exclude our own integration entities from the entity picker
         ent_reg = er.async_get(self.hass)
@@ -199,6 +269,50 @@ class VictoriaMetricsOptionsFlowHandler(OptionsFlowWithConfigEntry):
                         unit_of_measurement="seconds",
                     )
                 ),
+                vol.Optional(
+                    CONF_HEARTBEAT_INTERVALS,
+                    default=DEFAULT_HEARTBEAT_INTERVALS,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0,
+                        max=100,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="intervals",
+                    )
+                ),
+                vol.Optional(
+                    CONF_EVENT_WINDOW,
+                    default=DEFAULT_EVENT_WINDOW,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0,
+                        max=60,
+                        step=0.1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="seconds",
+                    )
+                ),
+                vol.Optional(
+                    CONF_ALIGN_TIMESTAMPS,
+                    default=DEFAULT_ALIGN_TIMESTAMPS,
+                ): BooleanSelector(),
+                vol.Optional(
+                    CONF_STAGGER_FLUSHES,
+                    default=DEFAULT_STAGGER_FLUSHES,
+                ): BooleanSelector(),
+                vol.Optional(
+                    CONF_FLUSH_SLICE_BUDGET,
+                    default=DEFAULT_FLUSH_SLICE_BUDGET,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=1,
+                        max=100,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="ms",
+                    )
+                ),
                 vol.Optional(
                     CONF_EXPORT_ENTITIES,
                     default=[],
@@ -208,14 +322,220 @@ class VictoriaMetricsOptionsFlowHandler(OptionsFlowWithConfigEntry):
                         exclude_entities=vm_entity_ids,
                     )
                 ),
+                vol.Optional(
+                    CONF_EXPORT_RULES,
+                    default=DEFAULT_EXPORT_RULES,
+                ): TextSelector(TextSelectorConfig(multiline=True)),
+                vol.Optional(
+                    CONF_REGISTRY_TAGS,
+                    default=DEFAULT_REGISTRY_TAGS,
+                ): BooleanSelector(),
+                vol.Optional(
+                    CONF_LINE_MODE,
+                    default=DEFAULT_LINE_MODE,
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=LINE_MODES,
+                        mode=SelectSelectorMode.DROPDOWN,
+                        translation_key=CONF_LINE_MODE,
+                    )
+                ),
             }
         )
 
         return self.async_show_form(
             step_id="init",
             data_schema=self.add_suggested_values_to_schema(
-                options_schema, self.options
+                options_schema, user_input or self.options
             ),
+            errors=errors,
+        )
+
+    async def async_step_delivery(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Manage how batches are delivered to Victoria Metrics."""
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            try:
+                parse_endpoints(
+                    user_input.get(CONF_EXTRA_ENDPOINTS, DEFAULT_EXTRA_ENDPOINTS),
+                    self.config_entry.data[CONF_PORT],
+                )
+            except ValueError:
+                errors[CONF_EXTRA_ENDPOINTS] = "invalid_endpoints"
+            try:
+                parse_replicas(user_input.get(CONF_REPLICAS, DEFAULT_REPLICAS))
+            except ValueError:
+                errors[CONF_REPLICAS] = "invalid_replicas"
+            if not errors:
+                self._user_input.update(user_input)
+                return await self.async_step_preview()
+
+        delivery_schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_EXTRA_ENDPOINTS,
+                    default=DEFAULT_EXTRA_ENDPOINTS,
+                ): TextSelector(TextSelectorConfig(multiline=True)),
+                vol.Optional(
+                    CONF_REPLICAS,
+                    default=DEFAULT_REPLICAS,
+                ): TextSelector(TextSelectorConfig(multiline=True)),
+                vol.Optional(
+                    CONF_TRANSPORT,
+                    default=DEFAULT_TRANSPORT,
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=TRANSPORTS,
+                        mode=SelectSelectorMode.DROPDOWN,
+                        translation_key=CONF_TRANSPORT,
+                    )
+                ),
+                vol.Optional(
+                    CONF_TIMESTAMP_PRECISION,
+                    default=DEFAULT_TIMESTAMP_PRECISION,
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=PRECISIONS,
+                        mode=SelectSelectorMode.DROPDOWN,
+                        translation_key=CONF_TIMESTAMP_PRECISION,
+                    )
+                ),
+                vol.Optional(
+                    CONF_COMPRESSION,
+                    default=DEFAULT_COMPRESSION,
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=COMPRESSION_MODES,
+                        mode=SelectSelectorMode.DROPDOWN,
+                        translation_key=CONF_COMPRESSION,
+                    )
+                ),
+                vol.Optional(
+                    CONF_COMPRESSION_THRESHOLD,
+                    default=DEFAULT_COMPRESSION_THRESHOLD,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0,
+                        max=1048576,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="bytes",
+                    )
+                ),
+                vol.Optional(
+                    CONF_SPOOL_MAX_SIZE,
+                    default=DEFAULT_SPOOL_MAX_SIZE,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0,
+                        max=4096,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="MiB",
+                    )
+                ),
+                vol.Optional(
+                    CONF_SPOOL_EVICTION,
+                    default=DEFAULT_SPOOL_EVICTION,
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=SPOOL_EVICTION_POLICIES,
+                        mode=SelectSelectorMode.DROPDOWN,
+                        translation_key=CONF_SPOOL_EVICTION,
+                    )
+                ),
+                vol.Optional(
+                    CONF_BACKFILL_HOURS,
+                    default=DEFAULT_BACKFILL_HOURS,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0,
+                        max=720,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="hours",
+                    )
+                ),
+                vol.Optional(
+                    CONF_MAX_IN_FLIGHT,
+                    default=DEFAULT_MAX_IN_FLIGHT,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=1,
+                        max=16,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                    )
+                ),
+                vol.Optional(
+                    CONF_QUEUE_SIZE,
+                    default=DEFAULT_QUEUE_SIZE,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=1,
+                        max=10000,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="batches",
+                    )
+                ),
+                vol.Optional(
+                    CONF_QUEUE_FULL_POLICY,
+                    default=DEFAULT_QUEUE_FULL_POLICY,
+                ): SelectSelector(
+                    SelectSelectorConfig(
+                        options=QUEUE_FULL_POLICIES,
+                        mode=SelectSelectorMode.DROPDOWN,
+                        translation_key=CONF_QUEUE_FULL_POLICY,
+                    )
+                ),
+                vol.Optional(
+                    CONF_MAX_BATCH_LINES,
+                    default=DEFAULT_MAX_BATCH_LINES,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=100,
+                        max=1000000,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="lines",
+                    )
+                ),
+                vol.Optional(
+                    CONF_MAX_BATCH_BYTES,
+                    default=DEFAULT_MAX_BATCH_BYTES,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=16,
+                        max=65536,
+                        step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="KiB",
+                    )
+                ),
+                vol.Optional(
+                    CONF_COALESCE_WINDOW,
+                    default=DEFAULT_COALESCE_WINDOW,
+                ): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0,
+                        max=30,
+                        step=0.1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="seconds",
+                    )
+                ),
+            }
+        )
+
+        return self.async_show_form(
+            step_id="delivery",
+            data_schema=self.add_suggested_values_to_schema(
+                delivery_schema, user_input or self.options
+            ),
+            errors=errors,
         )
 
     async def async_step_preview(
@@ -226,7 +546,13 @@ class VictoriaMetricsOptionsFlowHandler(OptionsFlowWithConfigEntry):
             return await self.async_step_save()
 
         prefix = self._user_input.get(CONF_METRIC_PREFIX, DEFAULT_METRIC_PREFIX)
-        entities: list[str] = self._user_input.get(CONF_EXPORT_ENTITIES, [])
+        entities: list[str] = list(self._user_input.get(CONF_EXPORT_ENTITIES, []))
+        rules = parse_rules(
+            self._user_input.get(CONF_EXPORT_RULES, DEFAULT_EXPORT_RULES)
+        )
+        if rules:
+            matched = EntityIndex(self.hass, rules).resolve()
+            entities.extend(sorted(matched.difference(entities)))
 
         if not entities:
             preview_text = "No entities selected."
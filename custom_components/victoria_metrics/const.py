@@ -15,11 +15,144 @@ CONF_METRIC_PREFIX = "metric_prefix"
 CONF_BATCH_INTERVAL = "batch_interval"
 CONF_EXPORT_ENTITIES = "export_entities"
 CONF_ENTITY_SETTINGS = "entity_settings"
+CONF_EXPORT_RULES = "export_rules"
+CONF_COMPRESSION = "compression"
+CONF_COMPRESSION_THRESHOLD = "compression_threshold"
+CONF_SPOOL_MAX_SIZE = "spool_max_size"
+CONF_SPOOL_EVICTION = "spool_eviction"
+CONF_MAX_IN_FLIGHT = "max_in_flight"
+CONF_QUEUE_SIZE = "queue_size"
+CONF_QUEUE_FULL_POLICY = "queue_full_policy"
+CONF_MAX_BATCH_LINES = "max_batch_lines"
+CONF_MAX_BATCH_BYTES = "max_batch_bytes"
+CONF_COALESCE_WINDOW = "coalesce_window"
+CONF_TRANSPORT = "transport"
+CONF_EXTRA_ENDPOINTS = "extra_endpoints"
+CONF_REPLICAS = "replicas"
+CONF_LINE_MODE = "line_mode"
+CONF_TIMESTAMP_PRECISION = "timestamp_precision"
+CONF_ALIGN_TIMESTAMPS = "align_timestamps"
+CONF_EVENT_WINDOW = "event_window"
+CONF_HEARTBEAT_INTERVALS = "heartbeat_intervals"
+CONF_STAGGER_FLUSHES = "stagger_flushes"
+CONF_FLUSH_SLICE_BUDGET = "flush_slice_budget"
+CONF_REGISTRY_TAGS = "registry_tags"
+CONF_BACKFILL_HOURS = "backfill_hours"
 
 DEFAULT_PORT = 8428
 DEFAULT_BATCH_INTERVAL = 300
 DEFAULT_METRIC_PREFIX = "ha"
 
+# Per-entity export modes: sample on the batch interval, write every change,
+# or summarize all changes of each batch interval
+EXPORT_MODE_BATCH = "batch"
+EXPORT_MODE_REALTIME = "realtime"
+EXPORT_MODE_AGGREGATE = "aggregate"
+EXPORT_MODES = [EXPORT_MODE_BATCH, EXPORT_MODE_REALTIME, EXPORT_MODE_AGGREGATE]
+DEFAULT_EXPORT_MODE = EXPORT_MODE_BATCH
+DEFAULT_EVENT_WINDOW = 1.0  # seconds state changes are coalesced for
+
+# Batch samples equal to the last one sent are skipped, but resent every
+# N-th interval so the series does not go stale. 0 sends every sample.
+DEFAULT_HEARTBEAT_INTERVALS = 0
+# Without a heartbeat, state samples held by a deadband are still resent
+# every N-th repeat, so a value resting inside the band does not go stale
+DEADBAND_HEARTBEAT_INTERVALS = 10
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_MODES = [COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD]
+DEFAULT_COMPRESSION = COMPRESSION_NONE
+DEFAULT_COMPRESSION_THRESHOLD = 1024  # bytes
+
+SPOOL_DIR = "victoria_metrics_spool"
+SPOOL_EVICT_OLDEST = "drop_oldest"
+SPOOL_EVICT_NEWEST = "drop_newest"
+SPOOL_EVICTION_POLICIES = [SPOOL_EVICT_OLDEST, SPOOL_EVICT_NEWEST]
+DEFAULT_SPOOL_MAX_SIZE = 64  # MiB, 0 disables the spool
+DEFAULT_SPOOL_EVICTION = SPOOL_EVICT_OLDEST
+SPOOL_REPLAY_INTERVAL = 30  # seconds
+SPOOL_REPLAY_CHUNK_BYTES = 512 * 1024
+
+# Recorder history is written for newly exported entities and to fill in
+# exporter downtime, and Victoria Metrics outages when the spool is disabled,
+# up to this many hours back; 0 disables automatic backfill
+DEFAULT_BACKFILL_HOURS = 24
+BACKFILL_CHUNK = 3600  # seconds of history per recorder query
+BACKFILL_QUERY_ENTITIES = 50  # entities per recorder query
+BACKFILL_RATE = 2000  # samples per second
+BACKFILL_MAX_QUEUE_DEPTH = 10  # queued batches above which backfill waits
+BACKFILL_CHECKPOINT_INTERVAL = 60  # seconds
+
+QUEUE_BLOCK = "block"
+QUEUE_DROP_OLDEST = "drop_oldest"
+QUEUE_MERGE = "merge"
+QUEUE_FULL_POLICIES = [QUEUE_BLOCK, QUEUE_DROP_OLDEST, QUEUE_MERGE]
+DEFAULT_MAX_IN_FLIGHT = 2
+DEFAULT_QUEUE_SIZE = 100  # batches
+DEFAULT_QUEUE_FULL_POLICY = QUEUE_DROP_OLDEST
+QUEUE_DRAIN_TIMEOUT = 30  # seconds
+
+# Circuit breaker per endpoint
+CIRCUIT_FAILURE_THRESHOLD = 3  # consecutive failures before opening
+CIRCUIT_BASE_DELAY = 2  # seconds, doubled on every failed probe
+CIRCUIT_MAX_DELAY = 300  # seconds
+
+DEFAULT_MAX_BATCH_LINES = 10000
+DEFAULT_MAX_BATCH_BYTES = 1024  # KiB
+DEFAULT_COALESCE_WINDOW = 1.0  # seconds, 0 sends every batch immediately
+
+TRANSPORT_INFLUX = "influx"
+TRANSPORT_REMOTE_WRITE = "remote_write"
+TRANSPORT_IMPORT_JSON = "import_json"
+TRANSPORT_IMPORT_PROMETHEUS = "import_prometheus"
+TRANSPORTS = [
+    TRANSPORT_INFLUX,
+    TRANSPORT_REMOTE_WRITE,
+    TRANSPORT_IMPORT_JSON,
+    TRANSPORT_IMPORT_PROMETHEUS,
+]
+DEFAULT_TRANSPORT = TRANSPORT_INFLUX
+
+# Timestamp precision of line protocol; the other transports always use ms
+PRECISION_NS = "ns"
+PRECISION_MS = "ms"
+PRECISION_S = "s"
+PRECISIONS = [PRECISION_NS, PRECISION_MS, PRECISION_S]
+DEFAULT_TIMESTAMP_PRECISION = PRECISION_NS
+
+# Snap batch sample timestamps down to a multiple of the batch interval
+DEFAULT_ALIGN_TIMESTAMPS = False
+
+# Spread the entities of each batch interval across it by entity ID hash,
+# instead of sampling and writing them all at once
+DEFAULT_STAGGER_FLUSHES = False
+
+# A batch flush yields to the event loop after this many milliseconds or
+# FLUSH_SLICE_ENTITIES entities, whichever comes first
+DEFAULT_FLUSH_SLICE_BUDGET = 5
+FLUSH_SLICE_ENTITIES = 500
+
+# Include/exclude rules selecting entities besides the explicit list, one
+# "[!]kind:value" entry per line
+DEFAULT_EXPORT_RULES = ""
+
+# Add area, device, manufacturer, model and label tags from the registries
+DEFAULT_REGISTRY_TAGS = False
+
+# Additional host[:port] entries, sharded by consistent hash of the series
+DEFAULT_EXTRA_ENDPOINTS = ""
+
+# Independent instances that receive a copy of every sample, one URL per line
+DEFAULT_REPLICAS = ""
+
+# One line per attribute, or one line per entity with attributes as fields
+LINE_MODE_SEPARATE = "separate"
+LINE_MODE_MULTI_FIELD = "multi_field"
+LINE_MODES = [LINE_MODE_SEPARATE, LINE_MODE_MULTI_FIELD]
+DEFAULT_LINE_MODE = LINE_MODE_SEPARATE
+
 PANEL_URL = "/victoria_metrics_panel"
 PANEL_COMPONENT_NAME = "victoria-metrics-panel"
 PANEL_TITLE = "Victoria Metrics"
@@ -0,0 +1,53 @@
+"""Deadband filtering of noisy numeric entity states.
+
+A value is only passed on when it differs from the last passed value by
+more than the tolerance: the larger of an absolute amount and a percentage
+of the last value. Smaller changes are replaced by the last passed value,
+which the export manager then skips as unchanged, apart from a periodic
+resend that keeps the series from going stale. Every skipped value is
+within the tolerance of the last written one, so the signal can be
+reconstructed to that accuracy by holding each written value.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import Any
+
+
+class Deadband:
+    """Per-entity deadband over the entity's numeric state."""
+
+    __slots__ = ("_last", "absolute", "percent")
+
+    def __init__(self, absolute: float = 0.0, percent: float = 0.0) -> None:
+        self.absolute = absolute
+        self.percent = percent
+        self._last: float | None = None
+
+    @classmethod
+    def from_settings(cls, settings: Mapping[str, Any]) -> Deadband | None:
+        """Build a deadband from entity settings, or None if none is set."""
+        absolute = float(settings.get("deadband") or 0)
+        percent = float(settings.get("deadband_percent") or 0)
+        if absolute <= 0 and percent <= 0:
+            return None
+        return cls(absolute, percent)
+
+    def hold(self, value: float | str) -> float | str:
+        """Return the value, or the last passed value if within tolerance.
+
+        String states always pass and restart the band. Held values repeat
+        the previous sample exactly, so the unchanged-sample suppression
+        drops them.
+        """
+        if isinstance(value, str):
+            self._last = None
+            return value
+        last = self._last
+        if last is not None and abs(value - last) <= max(
+            self.absolute, abs(last) * self.percent / 100
+        ):
+            return last
+        self._last = value
+        return value
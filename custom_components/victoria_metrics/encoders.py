@@ -0,0 +1,324 @@
+"""Wire-format encoders for the Victoria Metrics writer.
+
+Each encoder turns samples into records: byte strings that can be joined
+with the encoder's separator into one request body. Keeping records
+separate lets the writer coalesce, split and spool batches without knowing
+the wire format.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+import json
+from typing import ClassVar, NamedTuple
+
+from .const import (
+    PRECISION_MS,
+    PRECISION_NS,
+    PRECISION_S,
+    TRANSPORT_IMPORT_JSON,
+    TRANSPORT_IMPORT_PROMETHEUS,
+    TRANSPORT_INFLUX,
+    TRANSPORT_REMOTE_WRITE,
+)
+from .remote_write import (
+    CONTENT_ENCODING as REMOTE_WRITE_ENCODING,
+    CONTENT_TYPE as REMOTE_WRITE_CONTENT_TYPE,
+    PROTOCOL_VERSION as REMOTE_WRITE_VERSION,
+    encode_labels,
+    encode_timeseries,
+)
+from .sharding import series_key
+
+
+def escape_tag_value(value: str) -> str:
+    """Escape special characters in InfluxDB line protocol tag values."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace(" ", "\\ ")
+        .replace(",", "\\,")
+        .replace("=", "\\=")
+    )
+
+
+def escape_measurement(name: str) -> str:
+    """Escape special characters in measurement name."""
+    return name.replace(" ", "\\ ").replace(",", "\\,")
+
+
+def _escape_label_value(value: str) -> str:
+    """Escape a label value for the Prometheus exposition format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def value_field(value: float | str) -> str:
+    """Return the field name of a value: "value", or "state_text" for strings."""
+    return "state_text" if isinstance(value, str) else "value"
+
+
+class Series:
+    """A measurement and its tags, with wire-format fragments built once.
+
+    The export manager keeps one Series per entity and metric for as long as
+    the entity's tags stay the same, so sorting and escaping the tags happens
+    once per series instead of once per line. Tags must not be modified
+    after the Series is created.
+    """
+
+    __slots__ = (
+        "_encoded_labels",
+        "_influx_prefix",
+        "_key",
+        "_labels",
+        "_prometheus_labels",
+        "measurement",
+        "tags",
+    )
+
+    def __init__(self, measurement: str, tags: dict[str, str]) -> None:
+        self.measurement = measurement
+        self.tags = tags
+        self._influx_prefix: str | None = None
+        self._labels: tuple[tuple[str, str], ...] | None = None
+        self._key: str | None = None
+        self._prometheus_labels: str | None = None
+        self._encoded_labels: dict[str, bytes] = {}
+
+    @property
+    def influx_prefix(self) -> str:
+        """Return the escaped "measurement,tag=value,..." line prefix."""
+        if self._influx_prefix is None:
+            self._influx_prefix = escape_measurement(self.measurement) + "".join(
+                f",{escape_tag_value(key)}={escape_tag_value(str(val))}"
+                for key, val in sorted(self.tags.items())
+                if val
+            )
+        return self._influx_prefix
+
+    @property
+    def labels(self) -> tuple[tuple[str, str], ...]:
+        """Return the non-empty tags as sorted (name, value) labels."""
+        if self._labels is None:
+            self._labels = tuple(
+                sorted((key, str(val)) for key, val in self.tags.items() if val)
+            )
+        return self._labels
+
+    @property
+    def key(self) -> str:
+        """Return the key the series is sharded by."""
+        if self._key is None:
+            self._key = series_key(self.measurement, self.tags)
+        return self._key
+
+    @property
+    def prometheus_labels(self) -> str:
+        """Return the labels in exposition format, without braces."""
+        if self._prometheus_labels is None:
+            self._prometheus_labels = ",".join(
+                f'{key}="{_escape_label_value(val)}"' for key, val in self.labels
+            )
+        return self._prometheus_labels
+
+    def remote_write_labels(self, name: str) -> bytes:
+        """Return the protobuf-encoded labels of the metric name."""
+        encoded = self._encoded_labels.get(name)
+        if encoded is None:
+            encoded = self._encoded_labels[name] = encode_labels(
+                [("__name__", name), *self.labels]
+            )
+        return encoded
+
+    def sample(self, value: float | str, timestamp_ns: int) -> Sample:
+        """Build a sample with a "value" field, or "state_text" for strings."""
+        return Sample(self, {value_field(value): value}, timestamp_ns)
+
+
+class Sample(NamedTuple):
+    """A data point, independent of the wire format.
+
+    Field names follow InfluxDB: VictoriaMetrics stores each numeric field
+    as the series <measurement>_<field>.
+    """
+
+    series: Series
+    fields: dict[str, float | str]
+    timestamp_ns: int
+
+    @property
+    def measurement(self) -> str:
+        """Return the measurement name."""
+        return self.series.measurement
+
+    @property
+    def tags(self) -> dict[str, str]:
+        """Return the tags."""
+        return self.series.tags
+
+
+def iter_series(
+    sample: Sample,
+) -> Iterator[tuple[str, tuple[tuple[str, str], ...], float]]:
+    """Yield (metric name, sorted labels, value) per numeric field.
+
+    String fields are skipped since Prometheus-style samples are numeric.
+    """
+    series = sample.series
+    for field, value in sample.fields.items():
+        if not isinstance(value, str):
+            yield f"{series.measurement}_{field}", series.labels, value
+
+
+class Encoder(ABC):
+    """Base class for wire-format encoders."""
+
+    name: str
+    path: str
+    separator: ClassVar[bytes] = b"\n"
+    headers: ClassVar[dict[str, str]] = {}
+    # Content-Encoding mandated by the protocol, overriding the configured one
+    encoding: ClassVar[str | None] = None
+
+    @abstractmethod
+    def encode(self, samples: list[Sample]) -> list[bytes]:
+        """Encode samples into records."""
+
+
+_PRECISION_DIVISORS = {
+    PRECISION_NS: 1,
+    PRECISION_MS: 1_000_000,
+    PRECISION_S: 1_000_000_000,
+}
+
+
+class InfluxEncoder(Encoder):
+    """InfluxDB line protocol, sent to /write.
+
+    Every precision other than nanoseconds is registered as a transport of
+    its own (e.g. "influx_ms"), so spooled bodies are replayed with the
+    precision they were encoded in.
+    """
+
+    name = TRANSPORT_INFLUX
+    path = "/write"
+
+    def __init__(self, precision: str = PRECISION_NS) -> None:
+        self._divisor = _PRECISION_DIVISORS[precision]
+        if precision != PRECISION_NS:
+            self.name = f"{TRANSPORT_INFLUX}_{precision}"
+            self.path = f"/write?precision={precision}"
+
+    def format_sample(self, sample: Sample) -> str:
+        """Format a sample as one line of InfluxDB line protocol."""
+        field_str = ",".join(
+            f'{escape_tag_value(key)}="{value}"'
+            if isinstance(value, str)
+            else f"{escape_tag_value(key)}={value}"
+            for key, value in sample.fields.items()
+        )
+        timestamp = sample.timestamp_ns // self._divisor
+        return f"{sample.series.influx_prefix} {field_str} {timestamp}"
+
+    def encode(self, samples: list[Sample]) -> list[bytes]:
+        """Encode one line per sample."""
+        return [self.format_sample(sample).encode("utf-8") for sample in samples]
+
+
+class RemoteWriteEncoder(Encoder):
+    """Prometheus remote_write protobuf, sent snappy-compressed to /api/v1/write."""
+
+    name = TRANSPORT_REMOTE_WRITE
+    path = "/api/v1/write"
+    separator = b""
+    headers: ClassVar[dict[str, str]] = {
+        "Content-Type": REMOTE_WRITE_CONTENT_TYPE,
+        "X-Prometheus-Remote-Write-Version": REMOTE_WRITE_VERSION,
+    }
+    encoding = REMOTE_WRITE_ENCODING
+
+    def encode(self, samples: list[Sample]) -> list[bytes]:
+        """Encode one TimeSeries per numeric field."""
+        return [
+            encode_timeseries(
+                sample.series.remote_write_labels(name),
+                value,
+                sample.timestamp_ns // 1_000_000,
+            )
+            for sample in samples
+            for name, _, value in iter_series(sample)
+        ]
+
+
+class JsonLineEncoder(Encoder):
+    """VictoriaMetrics JSON line import format, sent to /api/v1/import.
+
+    Samples of the same series within a batch share one line, so the labels
+    are only sent once.
+    """
+
+    name = TRANSPORT_IMPORT_JSON
+    path = "/api/v1/import"
+
+    def encode(self, samples: list[Sample]) -> list[bytes]:
+        """Encode one line per series."""
+        series: dict[
+            tuple[str, tuple[tuple[str, str], ...]], tuple[list[float], list[int]]
+        ] = {}
+        for sample in samples:
+            timestamp_ms = sample.timestamp_ns // 1_000_000
+            for name, labels, value in iter_series(sample):
+                values, timestamps = series.setdefault((name, labels), ([], []))
+                values.append(value)
+                timestamps.append(timestamp_ms)
+        return [
+            json.dumps(
+                {
+                    "metric": {"__name__": name, **dict(labels)},
+                    "values": values,
+                    "timestamps": timestamps,
+                },
+                separators=(",", ":"),
+            ).encode("utf-8")
+            for (name, labels), (values, timestamps) in series.items()
+        ]
+
+
+class PrometheusTextEncoder(Encoder):
+    """Prometheus exposition format, sent to /api/v1/import/prometheus."""
+
+    name = TRANSPORT_IMPORT_PROMETHEUS
+    path = "/api/v1/import/prometheus"
+
+    def encode(self, samples: list[Sample]) -> list[bytes]:
+        """Encode one line per numeric field."""
+        records: list[bytes] = []
+        for sample in samples:
+            timestamp_ms = sample.timestamp_ns // 1_000_000
+            label_str = sample.series.prometheus_labels
+            for name, _, value in iter_series(sample):
+                records.append(f"{name}{{{label_str}}} {value} {timestamp_ms}".encode())
+        return records
+
+
+ENCODERS: dict[str, Encoder] = {
+    encoder.name: encoder
+    for encoder in (
+        InfluxEncoder(),
+        InfluxEncoder(PRECISION_MS),
+        InfluxEncoder(PRECISION_S),
+        RemoteWriteEncoder(),
+        JsonLineEncoder(),
+        PrometheusTextEncoder(),
+    )
+}
+
+
+def get_encoder(transport: str, precision: str = PRECISION_NS) -> Encoder:
+    """Return the encoder of a transport, falling back to line protocol.
+
+    The precision only applies to line protocol.
+    """
+    if transport == TRANSPORT_INFLUX and precision != PRECISION_NS:
+        transport = f"{TRANSPORT_INFLUX}_{precision}"
+    return ENCODERS.get(transport, ENCODERS[TRANSPORT_INFLUX])
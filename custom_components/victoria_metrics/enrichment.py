@@ -0,0 +1,115 @@
+"""Tags from the Home Assistant area, device, entity and label registries.
+
+Looking up an entity's area, device and labels on every flush would be
+too expensive, so RegistryTags caches the resulting tags per entity ID and
+drops cache entries only when a registry update touches them. The tags
+are:
+
+    area          name of the entity's area, or else its device's area
+    device        name of the device, as set by the user if renamed
+    manufacturer  manufacturer of the device
+    model         model of the device
+    label_<id>    "true" for every label of the entity
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity_registry as er,
+    label_registry as lr,
+)
+
+# Tags as sorted (key, value) pairs, so they compare cheaply
+type TagItems = tuple[tuple[str, str], ...]
+
+
+class RegistryTags:
+    """Cache of registry tags per entity, invalidated by registry events."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._cache: dict[str, TagItems] = {}
+        # Entities whose cached tags came from a device
+        self._device_entities: dict[str, set[str]] = {}
+        self._unsubs: list[CALLBACK_TYPE] = []
+
+    def get(self, entity_id: str) -> TagItems:
+        """Return the registry tags of an entity."""
+        tags = self._cache.get(entity_id)
+        if tags is None:
+            tags = self._cache[entity_id] = self._lookup(entity_id)
+        return tags
+
+    def _lookup(self, entity_id: str) -> TagItems:
+        """Build the registry tags of an entity from the registries."""
+        entry = er.async_get(self.hass).async_get(entity_id)
+        if entry is None:
+            return ()
+        tags: dict[str, str] = {}
+        area_id = entry.area_id
+        if entry.device_id and (
+            device := dr.async_get(self.hass).async_get(entry.device_id)
+        ):
+            self._device_entities.setdefault(device.id, set()).add(entity_id)
+            area_id = area_id or device.area_id
+            if name := device.name_by_user or device.name:
+                tags["device"] = name
+            if device.manufacturer:
+                tags["manufacturer"] = device.manufacturer
+            if device.model:
+                tags["model"] = device.model
+        if area_id and (area := ar.async_get(self.hass).async_get_area(area_id)):
+            tags["area"] = area.name
+        for label_id in entry.labels:
+            tags[f"label_{label_id}"] = "true"
+        return tuple(sorted(tags.items()))
+
+    def start(self) -> None:
+        """Invalidate cached tags on registry updates."""
+        bus = self.hass.bus
+        self._unsubs = [
+            bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED, self._handle_entity_registry
+            ),
+            bus.async_listen(
+                dr.EVENT_DEVICE_REGISTRY_UPDATED, self._handle_device_registry
+            ),
+            # Renamed areas and removed labels can affect any entity
+            bus.async_listen(ar.EVENT_AREA_REGISTRY_UPDATED, self._handle_clear),
+            bus.async_listen(lr.EVENT_LABEL_REGISTRY_UPDATED, self._handle_clear),
+        ]
+
+    def stop(self) -> None:
+        """Stop following registry updates."""
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+
+    @callback
+    def _handle_entity_registry(
+        self, event: Event[er.EventEntityRegistryUpdatedData]
+    ) -> None:
+        """Drop the tags of an entity that was updated, renamed or removed."""
+        data = event.data
+        self._cache.pop(data["entity_id"], None)
+        if data["action"] == "update" and (old := data.get("old_entity_id")):
+            self._cache.pop(old, None)
+
+    @callback
+    def _handle_device_registry(
+        self, event: Event[dr.EventDeviceRegistryUpdatedData]
+    ) -> None:
+        """Drop the tags of every entity of an updated or removed device."""
+        for entity_id in self._device_entities.pop(event.data["device_id"], ()):
+            self._cache.pop(entity_id, None)
+
+    @callback
+    def _handle_clear(self, _event: Event[Any]) -> None:
+        """Drop all cached tags."""
+        self._cache.clear()
+        self._device_entities.clear()
@@ -0,0 +1,195 @@
+"""Debounced persistence of the exported entity list and entity settings.
+
+Every config entry update writes .storage to disk, and the panel edits
+settings one input at a time. OptionsStore keeps edits to the entity list
+and entity settings in memory, presents them merged over the entry's
+options, and writes them to the entry once edits have paused for
+SAVE_DELAY seconds, or right away on unload and Home Assistant shutdown.
+If the entry's options are changed elsewhere in the meantime, e.g. by the
+options flow, unsaved edits of the keys that changed are dropped.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+import logging
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import CONF_ENTITY_SETTINGS, CONF_EXPORT_ENTITIES
+
+_LOGGER = logging.getLogger(__name__)
+
+SAVE_DELAY = 5  # seconds
+
+
+class OptionsStore:
+    """Pending edits to the entity list and settings of a config entry."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry: ConfigEntry,
+        *,
+        save_delay: float | None = SAVE_DELAY,
+    ) -> None:
+        """Initialize the store; a save_delay of None saves every edit."""
+        self.hass = hass
+        self.entry = entry
+        self._save_delay = save_delay
+        # Top-level option keys with unsaved values; they are copies owned
+        # by the store, so they can be edited in place
+        self._pending: dict[str, Any] = {}
+        # Entry options the pending edits were made on
+        self._base: Mapping[str, Any] = entry.options
+        self._save_timer: CALLBACK_TYPE | None = None
+        # Set index of the entity list it was built from
+        self._index_source: list[str] | None = None
+        self._index: set[str] = set()
+
+    @property
+    def options(self) -> Mapping[str, Any]:
+        """Return the entry options with unsaved edits applied."""
+        self._rebase()
+        if not self._pending:
+            return self.entry.options
+        return {**self.entry.options, **self._pending}
+
+    @property
+    def entities(self) -> list[str]:
+        """Return the explicitly exported entities."""
+        entities: list[str] = self.options.get(CONF_EXPORT_ENTITIES, [])
+        return entities
+
+    @property
+    def entity_set(self) -> set[str]:
+        """Return the explicitly exported entities as a set."""
+        entities = self.entities
+        if entities is not self._index_source:
+            self._index = set(entities)
+            self._index_source = entities
+        return self._index
+
+    @property
+    def entity_settings(self) -> Mapping[str, dict[str, Any]]:
+        """Return the settings of every entity that has any."""
+        settings: Mapping[str, dict[str, Any]] = self.options.get(
+            CONF_ENTITY_SETTINGS, {}
+        )
+        return settings
+
+    def set_entities(self, entity_ids: Iterable[str]) -> None:
+        """Replace the entity list."""
+        self._pending[CONF_EXPORT_ENTITIES] = list(entity_ids)
+        self._schedule_save()
+
+    def add_entities(self, entity_ids: Iterable[str]) -> list[str]:
+        """Append entities to the list and return those not already in it."""
+        index = self.entity_set
+        added = [eid for eid in dict.fromkeys(entity_ids) if eid not in index]
+        if added:
+            entities = self._own_entities()
+            entities.extend(added)
+            index.update(added)
+            self._schedule_save()
+        return added
+
+    def remove_entities(self, entity_ids: Iterable[str]) -> list[str]:
+        """Remove entities and their settings; return those that were listed."""
+        index = self.entity_set
+        removed = [eid for eid in dict.fromkeys(entity_ids) if eid in index]
+        if removed:
+            removed_set = set(removed)
+            self._pending[CONF_EXPORT_ENTITIES] = [
+                eid for eid in self.entities if eid not in removed_set
+            ]
+            settings = self._own_settings()
+            for eid in removed:
+                settings.pop(eid, None)
+            self._schedule_save()
+        return removed
+
+    def update_settings(
+        self, entity_id: str, changes: Mapping[str, Any]
+    ) -> dict[str, Any]:
+        """Apply setting changes to an entity and return its new settings.
+
+        Empty values of deadband, deadband_percent and metric_name remove
+        the setting.
+        """
+        settings = self._own_settings()
+        current = dict(settings.get(entity_id, {}))
+        for key in ("batch_interval", "export_mode"):
+            if key in changes:
+                current[key] = changes[key]
+        for key in ("deadband", "deadband_percent", "metric_name"):
+            if key in changes:
+                if changes[key]:
+                    current[key] = changes[key]
+                else:
+                    current.pop(key, None)
+        settings[entity_id] = current
+        self._schedule_save()
+        return current
+
+    def _rebase(self) -> None:
+        """Drop unsaved edits of options that were changed elsewhere."""
+        options = self.entry.options
+        if options is self._base:
+            return
+        for key in [
+            key for key in self._pending if options.get(key) != self._base.get(key)
+        ]:
+            _LOGGER.debug("Dropping unsaved %s edits, changed elsewhere", key)
+            del self._pending[key]
+        self._base = options
+
+    def _own_entities(self) -> list[str]:
+        """Return the pending entity list, copying it on first edit."""
+        if CONF_EXPORT_ENTITIES not in self._pending:
+            self._pending[CONF_EXPORT_ENTITIES] = list(self.entities)
+        entities: list[str] = self._pending[CONF_EXPORT_ENTITIES]
+        # Keep the index valid for the copy
+        self._index_source = entities
+        return entities
+
+    def _own_settings(self) -> dict[str, dict[str, Any]]:
+        """Return the pending entity settings, copying them on first edit."""
+        if CONF_ENTITY_SETTINGS not in self._pending:
+            self._pending[CONF_ENTITY_SETTINGS] = dict(self.entity_settings)
+        settings: dict[str, dict[str, Any]] = self._pending[CONF_ENTITY_SETTINGS]
+        return settings
+
+    def _schedule_save(self) -> None:
+        """Save once edits have paused for the save delay."""
+        if self._save_delay is None:
+            self.async_save()
+            return
+        if self._save_timer is not None:
+            self._save_timer()
+        self._save_timer = async_call_later(
+            self.hass, self._save_delay, self._save_later
+        )
+
+    @callback
+    def _save_later(self, _now: object) -> None:
+        """Save pending edits when the delay has passed."""
+        self._save_timer = None
+        self.async_save()
+
+    @callback
+    def async_save(self, _event: object = None) -> None:
+        """Write pending edits to the config entry now."""
+        if self._save_timer is not None:
+            self._save_timer()
+            self._save_timer = None
+        self._rebase()
+        if not self._pending:
+            return
+        options = {**self.entry.options, **self._pending}
+        self._pending = {}
+        self.hass.config_entries.async_update_entry(self.entry, options=options)
+        self._base = self.entry.options
@@ -0,0 +1,167 @@
+"""Prometheus remote_write encoding (protobuf + snappy).
+
+The WriteRequest message is small enough to encode by hand, which avoids a
+protobuf dependency. Each TimeSeries is encoded as a complete, field-tagged
+WriteRequest entry, so several encoded entries can simply be concatenated
+into one request body.
+
+Snappy compression uses cramjam or python-snappy when either is installed,
+and otherwise falls back to a pure Python block compressor.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+import importlib
+import logging
+import struct
+from types import ModuleType
+
+_LOGGER = logging.getLogger(__name__)
+
+cramjam: ModuleType | None
+try:
+    cramjam = importlib.import_module("cramjam")
+except ImportError:
+    cramjam = None
+
+snappy: ModuleType | None
+try:
+    snappy = importlib.import_module("snappy")
+except ImportError:
+    snappy = None
+
+CONTENT_TYPE = "application/x-protobuf"
+CONTENT_ENCODING = "snappy"
+PROTOCOL_VERSION = "0.1.0"
+
+_DOUBLE = struct.Struct("<d")
+
+# Field tags: (field_number << 3) | wire_type
+_TAG_WRITE_REQUEST_TIMESERIES = b"\x0a"  # 1, length-delimited
+_TAG_TIMESERIES_LABEL = b"\x0a"  # 1, length-delimited
+_TAG_TIMESERIES_SAMPLE = b"\x12"  # 2, length-delimited
+_TAG_LABEL_NAME = b"\x0a"  # 1, length-delimited
+_TAG_LABEL_VALUE = b"\x12"  # 2, length-delimited
+_TAG_SAMPLE_VALUE = b"\x09"  # 1, fixed64
+_TAG_SAMPLE_TIMESTAMP = b"\x10"  # 2, varint
+
+_SNAPPY_FRAGMENT = 1 << 16
+_SNAPPY_MAX_COPY = 64
+
+
+def _varint(value: int) -> bytes:
+    """Encode a non-negative integer as a protobuf varint."""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _length_delimited(tag: bytes, payload: bytes) -> bytes:
+    """Encode a length-delimited field."""
+    return tag + _varint(len(payload)) + payload
+
+
+def encode_labels(labels: list[tuple[str, str]]) -> bytes:
+    """Encode the repeated Label fields of a TimeSeries.
+
+    Labels must already be sorted by name, with __name__ first.
+    """
+    return b"".join(
+        _length_delimited(
+            _TAG_TIMESERIES_LABEL,
+            _length_delimited(_TAG_LABEL_NAME, name.encode("utf-8"))
+            + _length_delimited(_TAG_LABEL_VALUE, value.encode("utf-8")),
+        )
+        for name, value in labels
+    )
+
+
+def encode_timeseries(encoded_labels: bytes, value: float, timestamp_ms: int) -> bytes:
+    """Encode one TimeSeries with a single sample as a WriteRequest entry."""
+    sample = (
+        _TAG_SAMPLE_VALUE
+        + _DOUBLE.pack(value)
+        + _TAG_SAMPLE_TIMESTAMP
+        + _varint(timestamp_ms)
+    )
+    series = encoded_labels + _length_delimited(_TAG_TIMESERIES_SAMPLE, sample)
+    return _length_delimited(_TAG_WRITE_REQUEST_TIMESERIES, series)
+
+
+def _snappy_literal(out: bytearray, literal: bytes) -> None:
+    """Append a snappy literal element."""
+    n = len(literal) - 1
+    if n < 60:
+        out.append(n << 2)
+    elif n < 0x100:
+        out.append(60 << 2)
+        out.append(n)
+    elif n < 0x10000:
+        out.append(61 << 2)
+        out += n.to_bytes(2, "little")
+    else:
+        out.append(62 << 2)
+        out += n.to_bytes(3, "little")
+    out += literal
+
+
+def _snappy_copy(out: bytearray, offset: int, length: int) -> None:
+    """Append snappy copy elements with a 2-byte offset."""
+    while length > 0:
+        n = min(length, _SNAPPY_MAX_COPY)
+        out.append(((n - 1) << 2) | 0b10)
+        out += offset.to_bytes(2, "little")
+        length -= n
+
+
+def _snappy_compress_fragment(out: bytearray, fragment: bytes) -> None:
+    """Greedy LZ77 over one 64 KiB fragment using a 4-byte hash table."""
+    table: dict[bytes, int] = {}
+    size = len(fragment)
+    pos = 0
+    literal_start = 0
+    while pos + 4 <= size:
+        key = fragment[pos : pos + 4]
+        candidate = table.get(key)
+        table[key] = pos
+        if candidate is None:
+            pos += 1
+            continue
+        length = 4
+        while (
+            pos + length < size
+            and fragment[candidate + length] == fragment[pos + length]
+        ):
+            length += 1
+        if literal_start < pos:
+            _snappy_literal(out, fragment[literal_start:pos])
+        _snappy_copy(out, pos - candidate, length)
+        pos += length
+        literal_start = pos
+    if literal_start < size:
+        _snappy_literal(out, fragment[literal_start:])
+
+
+def _snappy_compress_py(data: bytes) -> bytes:
+    """Compress data in the snappy block format."""
+    out = bytearray(_varint(len(data)))
+    for start in range(0, len(data), _SNAPPY_FRAGMENT):
+        _snappy_compress_fragment(out, data[start : start + _SNAPPY_FRAGMENT])
+    return bytes(out)
+
+
+def _select_snappy() -> Callable[[bytes], bytes]:
+    """Pick the fastest available snappy block compressor."""
+    if cramjam is not None:
+        return lambda data: bytes(cramjam.snappy.compress_raw(data))
+    if snappy is not None:
+        return lambda data: bytes(snappy.compress(data))
+    _LOGGER.debug("Neither cramjam nor python-snappy found, using pure Python snappy")
+    return _snappy_compress_py
+
+
+snappy_compress = _select_snappy()
@@ -0,0 +1,155 @@
+"""Single-timer scheduler for per-interval batch flushes.
+
+Entities are indexed by batch interval, and the index is updated
+incrementally as entities are added, removed or moved. One timer drives
+all intervals: a heap holds the next due time of every interval in use,
+and the timer is always armed for the earliest of them.
+
+With staggering enabled each interval is split into up to MAX_SLOTS slots,
+and every entity is placed in a slot by a hash of its entity ID. The slots
+of an interval are due at evenly spread phases of it, so every entity
+keeps its cadence but the entities of an interval, and of intervals that
+line up such as 60s and 300s, are no longer sampled and written in one
+burst.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Coroutine
+import heapq
+import logging
+from typing import Any
+import zlib
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_at
+
+_LOGGER = logging.getLogger(__name__)
+
+# Slots per interval when staggering; at most one per second of the interval
+MAX_SLOTS = 60
+
+
+class FlushScheduler:
+    """Flush the entities of every batch interval when it is due."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        flush: Callable[[int, int, set[str]], Coroutine[Any, Any, None]],
+        *,
+        stagger: bool = False,
+    ) -> None:
+        self._hass = hass
+        self._flush = flush
+        self._stagger = stagger
+        # (interval, slot) -> entity IDs
+        self._index: dict[tuple[int, int], set[str]] = {}
+        # (loop time due, interval, slot); entries of unused slots are
+        # dropped lazily when they come up
+        self._heap: list[tuple[float, int, int]] = []
+        self._scheduled: set[tuple[int, int]] = set()
+        self._unsub: CALLBACK_TYPE | None = None
+        self._armed_at: float | None = None
+        self._running = False
+        # Flushes in progress, awaited on shutdown so that none resumes
+        # writing after the writer is closed
+        self._flushes: set[asyncio.Task[None]] = set()
+
+    def _slot(self, entity_id: str, interval: int) -> int:
+        """Return the slot of an entity within an interval."""
+        if not self._stagger:
+            return 0
+        # crc32 rather than hash(), so slots are stable across restarts
+        return zlib.crc32(entity_id.encode()) % min(interval, MAX_SLOTS)
+
+    def _first_due(self, interval: int, slot: int) -> float:
+        """Return the next loop time at the phase of a slot."""
+        now = self._hass.loop.time()
+        if not self._stagger:
+            return now + interval
+        phase = slot * interval / min(interval, MAX_SLOTS)
+        return now + ((phase - now) % interval or interval)
+
+    def add(self, entity_id: str, interval: int) -> None:
+        """Flush an entity every interval seconds."""
+        key = (interval, self._slot(entity_id, interval))
+        self._index.setdefault(key, set()).add(entity_id)
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            heapq.heappush(self._heap, (self._first_due(*key), *key))
+            self._arm()
+
+    def remove(self, entity_id: str, interval: int) -> None:
+        """Stop flushing an entity."""
+        key = (interval, self._slot(entity_id, interval))
+        entity_ids = self._index.get(key)
+        if entity_ids is None:
+            return
+        entity_ids.discard(entity_id)
+        if not entity_ids:
+            del self._index[key]
+
+    def move(self, entity_id: str, old_interval: int, new_interval: int) -> None:
+        """Move an entity to another interval."""
+        self.remove(entity_id, old_interval)
+        self.add(entity_id, new_interval)
+
+    def start(self) -> None:
+        """Start the timer."""
+        self._running = True
+        self._arm()
+
+    async def async_stop(self) -> None:
+        """Stop the timer and wait for flushes in progress."""
+        self.stop()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stop(self) -> None:
+        """Stop the timer."""
+        self._running = False
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+            self._armed_at = None
+
+    def _arm(self) -> None:
+        """Arm the timer for the earliest due slot."""
+        if not self._running or not self._heap:
+            return
+        due = self._heap[0][0]
+        if self._armed_at is not None and self._armed_at <= due:
+            return
+        if self._unsub is not None:
+            self._unsub()
+        self._armed_at = due
+        self._unsub = async_call_at(self._hass, self._fire, due)
+
+    @callback
+    def _fire(self, _now: object) -> None:
+        """Flush every slot that is due and re-arm the timer."""
+        self._unsub = None
+        self._armed_at = None
+        now = self._hass.loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            due, interval, slot = heapq.heappop(self._heap)
+            entity_ids = self._index.get((interval, slot))
+            if not entity_ids:
+                self._scheduled.discard((interval, slot))
+                continue
+            task = self._hass.async_create_task(
+                self._flush(interval, slot, entity_ids),
+                name=f"victoria_metrics_flush_{interval}_{slot}",
+            )
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+            # Skip ticks that were missed, e.g. while the loop was blocked,
+            # instead of flushing several times in a row
+            due += interval
+            if due <= now:
+                _LOGGER.debug("Skipping missed flushes of the %ds interval", interval)
+                due += (now - due) // interval * interval + interval
+            heapq.heappush(self._heap, (due, interval, slot))
+        self._arm()
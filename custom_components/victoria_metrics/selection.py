@@ -0,0 +1,245 @@
+"""Rule-based selection of exported entities.
+
+Besides the explicit entity list, entities can be selected by include and
+exclude rules, one per line in the form kind:value. The kinds are domain,
+glob (an entity ID pattern), device_class, area and label. A leading "!"
+turns a rule into an exclude rule:
+
+    domain:sensor
+    device_class:temperature
+    !glob:sensor.*_linkquality
+
+An entity is selected if it matches any include rule and no exclude rule.
+EntityIndex resolves the rules once at startup, then keeps the selection
+up to date from entity registry, device registry and state_changed events,
+re-evaluating only the entities those events are about.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+import fnmatch
+import logging
+import re
+from typing import NamedTuple
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import (
+    CALLBACK_TYPE,
+    Event,
+    EventStateChangedData,
+    HomeAssistant,
+    callback,
+)
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+RULE_DOMAIN = "domain"
+RULE_GLOB = "glob"
+RULE_DEVICE_CLASS = "device_class"
+RULE_AREA = "area"
+RULE_LABEL = "label"
+RULE_KINDS = (RULE_DOMAIN, RULE_GLOB, RULE_DEVICE_CLASS, RULE_AREA, RULE_LABEL)
+
+
+class ExportRule(NamedTuple):
+    """One include or exclude rule."""
+
+    kind: str
+    value: str
+    exclude: bool
+
+
+def parse_rules(text: str) -> list[ExportRule]:
+    """Parse selection rules, one "[!]kind:value" entry per line.
+
+    Blank lines and lines starting with "#" are ignored. Raises ValueError
+    for unknown kinds or empty values.
+    """
+    rules: list[ExportRule] = []
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith("#"):
+            continue
+        exclude = line.startswith("!")
+        kind, _, value = line.removeprefix("!").partition(":")
+        kind, value = kind.strip(), value.strip()
+        if kind not in RULE_KINDS or not value:
+            raise ValueError(f"Invalid rule: {line}")
+        rules.append(ExportRule(kind, value, exclude))
+    return rules
+
+
+class _RuleSet:
+    """Rules of one polarity, indexed by kind for constant-time matching."""
+
+    __slots__ = ("_glob", "values")
+
+    def __init__(self, rules: Iterable[ExportRule]) -> None:
+        self.values: dict[str, set[str]] = {kind: set() for kind in RULE_KINDS}
+        for rule in rules:
+            self.values[rule.kind].add(rule.value)
+        globs = self.values[RULE_GLOB]
+        # All globs are compiled into one pattern
+        self._glob = (
+            re.compile("|".join(fnmatch.translate(glob) for glob in sorted(globs)))
+            if globs
+            else None
+        )
+
+    def matches(
+        self,
+        entity_id: str,
+        device_class: str | None,
+        area_id: str | None,
+        labels: set[str],
+    ) -> bool:
+        """Return True if any rule matches the entity."""
+        values = self.values
+        return bool(
+            entity_id.partition(".")[0] in values[RULE_DOMAIN]
+            or (self._glob is not None and self._glob.match(entity_id))
+            or (device_class is not None and device_class in values[RULE_DEVICE_CLASS])
+            or (area_id is not None and area_id in values[RULE_AREA])
+            or not labels.isdisjoint(values[RULE_LABEL])
+        )
+
+
+class EntityIndex:
+    """The set of entities selected by the rules, updated incrementally."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        rules: list[ExportRule],
+        *,
+        on_add: Callable[[str], None] | None = None,
+        on_remove: Callable[[str], None] | None = None,
+    ) -> None:
+        self.hass = hass
+        self._include = _RuleSet(rule for rule in rules if not rule.exclude)
+        self._exclude = _RuleSet(rule for rule in rules if rule.exclude)
+        self._on_add = on_add
+        self._on_remove = on_remove
+        self._uses_areas = any(rule.kind == RULE_AREA for rule in rules)
+        self.selected: set[str] = set()
+        self._unsubs: list[CALLBACK_TYPE] = []
+
+    def resolve(self) -> set[str]:
+        """Evaluate every known entity once and return the selection."""
+        ent_reg = er.async_get(self.hass)
+        entity_ids = set(self.hass.states.async_entity_ids())
+        entity_ids.update(ent_reg.entities)
+        self.selected = {eid for eid in entity_ids if self._matches(eid)}
+        return self.selected
+
+    def start(self) -> None:
+        """Follow registry and state changes."""
+        bus = self.hass.bus
+        self._unsubs = [
+            bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED, self._handle_entity_registry
+            ),
+            bus.async_listen(
+                EVENT_STATE_CHANGED,
+                self._handle_state_added_or_removed,
+                event_filter=_is_added_or_removed,
+            ),
+        ]
+        if self._uses_areas:
+            # Entities without an area of their own inherit their device's
+            self._unsubs.append(
+                bus.async_listen(
+                    dr.EVENT_DEVICE_REGISTRY_UPDATED, self._handle_device_registry
+                )
+            )
+
+    def stop(self) -> None:
+        """Stop following changes."""
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+
+    def _matches(self, entity_id: str) -> bool:
+        """Return True if the rules select an entity."""
+        device_class: str | None = None
+        area_id: str | None = None
+        labels: set[str] = set()
+        entry = er.async_get(self.hass).async_get(entity_id)
+        if entry is not None:
+            # Our own sensors are never exported, nor are disabled entities
+            if entry.platform == DOMAIN or entry.disabled:
+                return False
+            device_class = entry.device_class or entry.original_device_class
+            area_id = entry.area_id
+            labels = entry.labels
+            if area_id is None and entry.device_id and self._uses_areas:
+                device = dr.async_get(self.hass).async_get(entry.device_id)
+                area_id = device.area_id if device is not None else None
+        if (
+            device_class is None
+            and (state := self.hass.states.get(entity_id)) is not None
+        ):
+            device_class = state.attributes.get("device_class")
+        return self._include.matches(
+            entity_id, device_class, area_id, labels
+        ) and not self._exclude.matches(entity_id, device_class, area_id, labels)
+
+    @callback
+    def _evaluate(self, entity_id: str) -> None:
+        """Re-evaluate one entity and report whether it joined or left."""
+        selected = self._matches(entity_id) and (
+            self.hass.states.get(entity_id) is not None
+            or er.async_get(self.hass).async_get(entity_id) is not None
+        )
+        if selected == (entity_id in self.selected):
+            return
+        if selected:
+            self.selected.add(entity_id)
+            _LOGGER.debug("%s now matches the export rules", entity_id)
+            if self._on_add is not None:
+                self._on_add(entity_id)
+        else:
+            self.selected.discard(entity_id)
+            _LOGGER.debug("%s no longer matches the export rules", entity_id)
+            if self._on_remove is not None:
+                self._on_remove(entity_id)
+
+    @callback
+    def _handle_entity_registry(
+        self, event: Event[er.EventEntityRegistryUpdatedData]
+    ) -> None:
+        """Re-evaluate an entity that was created, removed or updated."""
+        data = event.data
+        if data["action"] == "update" and (old := data.get("old_entity_id")):
+            self._evaluate(old)
+        self._evaluate(data["entity_id"])
+
+    @callback
+    def _handle_device_registry(
+        self, event: Event[dr.EventDeviceRegistryUpdatedData]
+    ) -> None:
+        """Re-evaluate the entities of a device that moved to another area."""
+        data = event.data
+        if data["action"] != "update" or "area_id" not in data["changes"]:
+            return
+        for entry in er.async_entries_for_device(
+            er.async_get(self.hass), data["device_id"]
+        ):
+            self._evaluate(entry.entity_id)
+
+    @callback
+    def _handle_state_added_or_removed(
+        self, event: Event[EventStateChangedData]
+    ) -> None:
+        """Re-evaluate an entity whose state appeared or disappeared."""
+        self._evaluate(event.data["entity_id"])
+
+
+@callback
+def _is_added_or_removed(event_data: EventStateChangedData) -> bool:
+    """Filter state_changed events down to entities appearing or leaving."""
+    return event_data["old_state"] is None or event_data["new_state"] is None
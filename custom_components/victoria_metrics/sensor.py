@@ -1,23 +1,99 @@
 """Sensor platform for Victoria Metrics Exporter.
 
 Creates one sensor entity per configured export so users can see
-all entity-to-metric mappings in the HA UI.
+all entity-to-metric mappings in the HA UI, plus diagnostic sensors
+for the writer's send queue and the export manager's flushes.
 """
 
 from __future__ import annotations
 
+from collections.abc import Callable
+from dataclasses import dataclass
 from typing import TYPE_CHECKING, Any
 
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import (
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import EntityCategory
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.typing import StateType
 
 from .const import DOMAIN
 
 if TYPE_CHECKING:
     from . import EntityConfig, ExportManager
+    from .writer import VictoriaMetricsWriter
+
+
+@dataclass(frozen=True, kw_only=True)
+class WriterSensorEntityDescription(SensorEntityDescription):
+    """Describes a Victoria Metrics writer statistic sensor."""
+
+    value_fn: Callable[[VictoriaMetricsWriter], StateType]
+
+
+WRITER_SENSORS: tuple[WriterSensorEntityDescription, ...] = (
+    WriterSensorEntityDescription(
+        key="queue_depth",
+        name="VM Writer queue depth",
+        icon="mdi:tray-full",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda writer: writer.queue_stats.queue_depth,
+    ),
+    WriterSensorEntityDescription(
+        key="in_flight",
+        name="VM Writer requests in flight",
+        icon="mdi:upload-network",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda writer: writer.queue_stats.in_flight,
+    ),
+    WriterSensorEntityDescription(
+        key="queue_wait",
+        name="VM Writer queue wait",
+        icon="mdi:timer-sand",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda writer: round(writer.queue_stats.last_queue_wait * 1000, 1),
+    ),
+    WriterSensorEntityDescription(
+        key="batches_dropped",
+        name="VM Writer dropped batches",
+        icon="mdi:tray-remove",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda writer: writer.queue_stats.batches_dropped,
+    ),
+    WriterSensorEntityDescription(
+        key="endpoints_healthy",
+        name="VM Writer healthy endpoints",
+        icon="mdi:server-network",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda writer: writer.healthy_endpoints,
+    ),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class ManagerSensorEntityDescription(SensorEntityDescription):
+    """Describes a Victoria Metrics export manager statistic sensor."""
+
+    value_fn: Callable[[ExportManager], StateType]
+
+
+MANAGER_SENSORS: tuple[ManagerSensorEntityDescription, ...] = (
+    ManagerSensorEntityDescription(
+        key="flush_slice",
+        name="VM Export longest flush slice",
+        icon="mdi:timer-alert",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda manager: round(manager.longest_flush_slice * 1000, 1),
+    ),
+)
 
 
 async def async_setup_entry(
@@ -28,12 +104,42 @@ async def async_setup_entry(
     """Set up Victoria Metrics export mapping sensors from a config entry."""
     entry_data = hass.data[DOMAIN][entry.entry_id]
     manager: ExportManager = entry_data["manager"]
-    sensors = [
-        VictoriaMetricsExportSensor(ec, manager)
-        for ec in manager.entity_configs.values()
-    ]
+    writer: VictoriaMetricsWriter = entry_data["writer"]
+    export_sensors = {
+        entity_id: VictoriaMetricsExportSensor(ec, manager)
+        for entity_id, ec in manager.entity_configs.items()
+    }
+    sensors: list[SensorEntity] = list(export_sensors.values())
+    sensors.extend(
+        VictoriaMetricsWriterSensor(entry, writer, description)
+        for description in WRITER_SENSORS
+    )
+    sensors.extend(
+        VictoriaMetricsManagerSensor(entry, manager, description)
+        for description in MANAGER_SENSORS
+    )
     async_add_entities(sensors)
 
+    @callback
+    def _entity_changed(ec: EntityConfig, added: bool) -> None:
+        """Add or remove the export sensor of an entity changed at runtime."""
+        if added:
+            sensor = VictoriaMetricsExportSensor(ec, manager)
+            export_sensors[ec.entity_id] = sensor
+            async_add_entities([sensor])
+            return
+        if ec.entity_id not in export_sensors:
+            return
+        sensor = export_sensors.pop(ec.entity_id)
+        ent_reg = er.async_get(hass)
+        if sensor.entity_id and ent_reg.async_get(sensor.entity_id):
+            # Removing the registry entry also removes the entity
+            ent_reg.async_remove(sensor.entity_id)
+        else:
+            hass.async_create_task(sensor.async_remove(force_remove=True))
+
+    manager.set_entity_listener(_entity_changed)
+
 
 class VictoriaMetricsExportSensor(SensorEntity):
     """Sensor showing the outgoing VM metric name for a configured entity."""
@@ -62,4 +168,57 @@ class VictoriaMetricsExportSensor(SensorEntity):
             "source_entity": self._ec.entity_id,
             "metric_name": self._ec.metric_name,
             "batch_interval": self._ec.batch_interval,
+            "export_mode": self._ec.export_mode,
+            "deadband": self._ec.deadband.absolute if self._ec.deadband else None,
+            "deadband_percent": (
+                self._ec.deadband.percent if self._ec.deadband else None
+            ),
         }
+
+
+class VictoriaMetricsWriterSensor(SensorEntity):
+    """Diagnostic sensor exposing a statistic of the writer's send queue."""
+
+    entity_description: WriterSensorEntityDescription
+    _attr_has_entity_name = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(
+        self,
+        entry: ConfigEntry,
+        writer: VictoriaMetricsWriter,
+        description: WriterSensorEntityDescription,
+    ) -> None:
+        """Initialize the writer statistic sensor."""
+        self.entity_description = description
+        self._writer = writer
+        self._attr_unique_id = f"vm_writer_{entry.entry_id}_{description.key}"
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the current value of the statistic."""
+        return self.entity_description.value_fn(self._writer)
+
+
+class VictoriaMetricsManagerSensor(SensorEntity):
+    """Diagnostic sensor exposing a statistic of the export manager."""
+
+    entity_description: ManagerSensorEntityDescription
+    _attr_has_entity_name = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(
+        self,
+        entry: ConfigEntry,
+        manager: ExportManager,
+        description: ManagerSensorEntityDescription,
+    ) -> None:
+        """Initialize the export manager statistic sensor."""
+        self.entity_description = description
+        self._manager = manager
+        self._attr_unique_id = f"vm_export_{entry.entry_id}_{description.key}"
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the current value of the statistic."""
+        return self.entity_description.value_fn(self._manager)
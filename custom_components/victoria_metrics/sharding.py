@@ -0,0 +1,103 @@
+"""Consistent-hash sharding of series across several Victoria Metrics endpoints.
+
+Every endpoint is placed on a hash ring at VIRTUAL_NODES points. A series is
+owned by the first endpoint clockwise from the hash of its name and tags, so
+adding or losing an endpoint only moves the series that endpoint owned. When
+the owner is unhealthy the walk continues to the next healthy endpoint.
+
+Also parses the endpoint and replica lists from the options flow.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect
+from collections.abc import Container
+import hashlib
+import re
+from urllib.parse import urlsplit
+
+VIRTUAL_NODES = 128
+
+_SEPARATORS = re.compile(r"[\s,]+")
+
+
+def _hash(key: bytes) -> int:
+    """Return a hash that is stable across restarts, unlike hash()."""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def parse_endpoints(text: str, default_port: int) -> list[tuple[str, int]]:
+    """Parse a comma or whitespace separated list of host[:port] entries.
+
+    Raises ValueError for entries without a host or with an invalid port.
+    """
+    endpoints: list[tuple[str, int]] = []
+    for item in _SEPARATORS.split(text.strip()):
+        if not item:
+            continue
+        parts = urlsplit(f"//{item}")
+        host = parts.hostname
+        if not host or parts.path or parts.query or parts.username:
+            raise ValueError(f"Invalid endpoint: {item}")
+        if ":" in host:
+            host = f"[{host}]"
+        endpoints.append((host, parts.port or default_port))
+    return endpoints
+
+
+def parse_replicas(text: str) -> list[tuple[str, str | None]]:
+    """Parse replica targets, one "URL [bearer token]" entry per line.
+
+    The URL may carry a path prefix, e.g. a vminsert tenant path. Raises
+    ValueError for malformed entries.
+    """
+    replicas: list[tuple[str, str | None]] = []
+    for line in text.splitlines():
+        url, _, token = line.strip().partition(" ")
+        if not url:
+            continue
+        parts = urlsplit(url)
+        # Accessing port raises ValueError if it is not a valid number
+        if (
+            parts.scheme not in {"http", "https"}
+            or not parts.hostname
+            or parts.port == 0
+        ):
+            raise ValueError(f"Invalid replica URL: {url}")
+        replicas.append((url.rstrip("/"), token.strip() or None))
+    return replicas
+
+
+class HashRing:
+    """Consistent-hash ring mapping series keys to endpoint indices."""
+
+    def __init__(self, nodes: list[str], replicas: int = VIRTUAL_NODES) -> None:
+        """Place every node on the ring."""
+        points = sorted(
+            (_hash(f"{node}#{replica}".encode()), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def lookup(self, key: str, healthy: Container[int]) -> int:
+        """Return the index of the first healthy node owning key.
+
+        Falls back to the primary owner when no node is healthy, so the
+        request fails and ends up in the spool.
+        """
+        owners = self._owners
+        start = bisect(self._hashes, _hash(key.encode())) % len(owners)
+        for offset in range(len(owners)):
+            index = owners[(start + offset) % len(owners)]
+            if index in healthy:
+                return index
+        return owners[start]
+
+
+def series_key(measurement: str, tags: dict[str, str]) -> str:
+    """Return the key a series is sharded by: its name and sorted tags."""
+    return measurement + "".join(
+        f",{key}={val}" for key, val in sorted(tags.items()) if val
+    )
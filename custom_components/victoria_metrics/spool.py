@@ -0,0 +1,268 @@
+"""Persistent on-disk spool for batches that could not be delivered.
+
+Payloads are appended to segment files as length-prefixed, CRC-checked
+records. The active segment has an ``.open`` suffix and is renamed to
+``.seg`` once it is full, so a crash can at worst leave a truncated record at
+the tail of one segment, which the reader detects and skips. Replay reads the
+oldest segment first and tracks its progress in a small cursor file that is
+replaced atomically.
+
+All methods do blocking file I/O and must be run in an executor.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+import logging
+import os
+from pathlib import Path
+import struct
+import threading
+import zlib
+
+from .const import SPOOL_EVICT_NEWEST, SPOOL_EVICT_OLDEST
+
+_LOGGER = logging.getLogger(__name__)
+
+SEALED_SUFFIX = ".seg"
+ACTIVE_SUFFIX = ".open"
+CURSOR_FILE = "cursor.json"
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+
+_MAGIC = b"VMS1"
+_HEADER = struct.Struct(">4sII")  # magic, payload length, crc32
+
+
+@dataclass(slots=True, frozen=True)
+class SpoolPosition:
+    """Position in the spool up to which records have been read."""
+
+    segment: str
+    offset: int
+    end_of_segment: bool
+
+
+def _fsync_dir(directory: Path) -> None:
+    """Flush directory metadata so renames and unlinks survive a crash."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteSpool:
+    """Append-only, segment-based spool of undelivered write payloads."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int,
+        *,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        eviction: str = SPOOL_EVICT_OLDEST,
+    ) -> None:
+        self._dir = directory
+        self._max_bytes = max_bytes
+        self._segment_bytes = min(segment_bytes, max_bytes)
+        self._eviction = eviction
+        self._lock = threading.Lock()
+        self._sealed: list[str] = []
+        self._sizes: dict[str, int] = {}
+        self._active: str | None = None
+        self._next_seq = 0
+        self._cursor_segment: str | None = None
+        self._cursor_offset = 0
+        self.dropped_bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """Return the total size of all segments on disk."""
+        return sum(self._sizes.values())
+
+    @property
+    def is_empty(self) -> bool:
+        """Return True if there is nothing left to replay."""
+        return self.size_bytes - self._cursor_offset <= 0
+
+    def open(self) -> None:
+        """Create the spool directory and recover segments from a previous run."""
+        with self._lock:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            for path in self._dir.glob(f"*{ACTIVE_SUFFIX}"):
+                # A leftover active segment means we did not shut down cleanly.
+                path.rename(path.with_suffix(SEALED_SUFFIX))
+            for path in sorted(self._dir.glob(f"*{SEALED_SUFFIX}")):
+                self._sealed.append(path.name)
+                self._sizes[path.name] = path.stat().st_size
+            if self._sealed:
+                self._next_seq = int(Path(self._sealed[-1]).stem) + 1
+            self._load_cursor()
+            if self._sealed:
+                _LOGGER.info(
+                    "Found %d spooled bytes in %d segments at %s",
+                    self.size_bytes,
+                    len(self._sealed),
+                    self._dir,
+                )
+
+    def _load_cursor(self) -> None:
+        """Restore the replay cursor, discarding it if its segment is gone."""
+        try:
+            data = json.loads((self._dir / CURSOR_FILE).read_text())
+        except (OSError, ValueError):
+            return
+        segment = data.get("segment")
+        if segment in self._sizes:
+            self._cursor_segment = segment
+            self._cursor_offset = int(data.get("offset", 0))
+
+    def _store_cursor(self) -> None:
+        """Atomically persist the replay cursor."""
+        tmp = self._dir / f"{CURSOR_FILE}.tmp"
+        tmp.write_text(
+            json.dumps({"segment": self._cursor_segment, "offset": self._cursor_offset})
+        )
+        tmp.replace(self._dir / CURSOR_FILE)
+
+    def _open_active(self) -> None:
+        """Start a new active segment."""
+        name = f"{self._next_seq:012d}{ACTIVE_SUFFIX}"
+        self._next_seq += 1
+        self._active = name
+        self._sizes[name] = 0
+
+    def _seal_active(self) -> None:
+        """Rename the active segment so it becomes eligible for replay."""
+        if self._active is None:
+            return
+        name = self._active
+        self._active = None
+        if self._sizes.get(name, 0) == 0:
+            self._sizes.pop(name, None)
+            (self._dir / name).unlink(missing_ok=True)
+            return
+        sealed = str(Path(name).with_suffix(SEALED_SUFFIX))
+        (self._dir / name).rename(self._dir / sealed)
+        _fsync_dir(self._dir)
+        self._sizes[sealed] = self._sizes.pop(name)
+        self._sealed.append(sealed)
+
+    def _remove_segment(self, name: str) -> None:
+        """Delete a sealed segment and forget about it."""
+        (self._dir / name).unlink(missing_ok=True)
+        self._sealed.remove(name)
+        self._sizes.pop(name, None)
+        if self._cursor_segment == name:
+            self._cursor_segment = None
+            self._cursor_offset = 0
+
+    def _make_room(self, needed: int) -> bool:
+        """Apply the eviction policy until `needed` more bytes fit."""
+        while self.size_bytes + needed > self._max_bytes:
+            if self._eviction == SPOOL_EVICT_NEWEST:
+                return False
+            if not self._sealed:
+                if self._active is None or self._sizes.get(self._active, 0) == 0:
+                    return needed <= self._max_bytes
+                self._seal_active()
+                continue
+            oldest = self._sealed[0]
+            size = self._sizes.get(oldest, 0)
+            self._remove_segment(oldest)
+            self.dropped_bytes += size
+            _LOGGER.warning(
+                "Spool full, evicted oldest segment %s (%d bytes)", oldest, size
+            )
+        return True
+
+    def append(self, payload: bytes) -> bool:
+        """Append a payload to the active segment.
+
+        Returns False if the payload was dropped by the eviction policy.
+        """
+        record = _HEADER.pack(_MAGIC, len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if not self._make_room(len(record)):
+                self.dropped_bytes += len(record)
+                _LOGGER.warning(
+                    "Spool full, dropped %d bytes of undelivered data", len(record)
+                )
+                return False
+            if (
+                self._active is not None
+                and self._sizes[self._active] + len(record) > self._segment_bytes
+            ):
+                self._seal_active()
+            if self._active is None:
+                self._open_active()
+            active = str(self._active)
+            with (self._dir / active).open("ab") as fh:
+                fh.write(record)
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._sizes[active] += len(record)
+            return True
+
+    def read_chunk(self, max_bytes: int) -> tuple[list[bytes], SpoolPosition | None]:
+        """Read records from the oldest segment, up to roughly max_bytes.
+
+        Returns the payloads and the position to pass to `ack` once they have
+        been delivered.
+        """
+        with self._lock:
+            if not self._sealed:
+                self._seal_active()
+            if not self._sealed:
+                return [], None
+            segment = self._sealed[0]
+            offset = self._cursor_offset if self._cursor_segment == segment else 0
+            payloads: list[bytes] = []
+            read = 0
+            end = False
+            with (self._dir / segment).open("rb") as fh:
+                fh.seek(offset)
+                while read < max_bytes:
+                    header = fh.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        end = True
+                        break
+                    magic, length, crc = _HEADER.unpack(header)
+                    payload = fh.read(length)
+                    if (
+                        magic != _MAGIC
+                        or len(payload) < length
+                        or zlib.crc32(payload) != crc
+                    ):
+                        _LOGGER.warning(
+                            "Discarding corrupt tail of spool segment %s at offset %d",
+                            segment,
+                            offset,
+                        )
+                        end = True
+                        break
+                    payloads.append(payload)
+                    offset += _HEADER.size + length
+                    read += length
+                else:
+                    end = offset >= self._sizes[segment]
+            return payloads, SpoolPosition(segment, offset, end)
+
+    def ack(self, position: SpoolPosition) -> None:
+        """Mark everything up to position as delivered."""
+        with self._lock:
+            if position.segment not in self._sizes:
+                return
+            if position.end_of_segment:
+                self._remove_segment(position.segment)
+                _fsync_dir(self._dir)
+            else:
+                self._cursor_segment = position.segment
+                self._cursor_offset = position.offset
+            self._store_cursor()
+
+    def close(self) -> None:
+        """Seal the active segment so it is replayed on the next start."""
+        with self._lock:
+            self._seal_active()
@@ -2,27 +2,32 @@
 
 from __future__ import annotations
 
+from datetime import timedelta
 import logging
 from typing import TYPE_CHECKING, Any
 
 from homeassistant.components import websocket_api
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt as dt_util
 import voluptuous as vol
 
 from .const import (
     CONF_BATCH_INTERVAL,
-    CONF_ENTITY_SETTINGS,
-    CONF_EXPORT_ENTITIES,
     CONF_METRIC_PREFIX,
     DEFAULT_BATCH_INTERVAL,
+    DEFAULT_EXPORT_MODE,
     DEFAULT_METRIC_PREFIX,
     DOMAIN,
+    EXPORT_MODES,
     build_metric_name,
 )
+from .deadband import Deadband
+from .options_store import OptionsStore
 
 if TYPE_CHECKING:
     from . import ExportManager
+    from .selection import EntityIndex
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +48,31 @@ def async_register_websocket_commands(hass: HomeAssistant) -> None:
     websocket_api.async_register_command(hass, handle_get_audit_log)
     websocket_api.async_register_command(hass, handle_add_entity)
     websocket_api.async_register_command(hass, handle_remove_entity)
+    websocket_api.async_register_command(hass, handle_add_entities)
+    websocket_api.async_register_command(hass, handle_remove_entities)
+    websocket_api.async_register_command(hass, handle_update_entity_settings_bulk)
+    websocket_api.async_register_command(hass, handle_get_backfill)
+    websocket_api.async_register_command(hass, handle_start_backfill)
+    websocket_api.async_register_command(hass, handle_cancel_backfill)
+
+
+def _get_store(hass: HomeAssistant, entry: ConfigEntry) -> OptionsStore:
+    """Return the options store of a loaded entry.
+
+    Edits to an entry that is not loaded are saved right away.
+    """
+    entry_data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if entry_data:
+        store: OptionsStore = entry_data["store"]
+        return store
+    return OptionsStore(hass, entry, save_delay=None)
+
+
+def _rule_selected(hass: HomeAssistant, entry: ConfigEntry) -> set[str]:
+    """Return the entities the export rules select, while the entry is loaded."""
+    entry_data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    index: EntityIndex | None = entry_data.get("index") if entry_data else None
+    return index.selected if index is not None else set()
 
 
 @websocket_api.websocket_command(
@@ -56,21 +86,25 @@ def handle_get_config(
     connection: websocket_api.ActiveConnection,
     msg: dict[str, Any],
 ) -> None:
-    """Return the current Victoria Metrics export configuration."""
+    """Return the current Victoria Metrics export configuration.
+
+    Entities selected only by the export rules are listed after the
+    explicitly exported ones, marked as rule_selected.
+    """
     entry = _get_config_entry(hass)
     if entry is None:
         connection.send_error(msg["id"], "not_found", "No config entry found")
         return
 
+    store = _get_store(hass, entry)
     prefix = entry.options.get(CONF_METRIC_PREFIX, DEFAULT_METRIC_PREFIX)
     batch_interval = entry.options.get(CONF_BATCH_INTERVAL, DEFAULT_BATCH_INTERVAL)
-    entities: list[str] = entry.options.get(CONF_EXPORT_ENTITIES, [])
-    entity_settings: dict[str, dict[str, Any]] = entry.options.get(
-        CONF_ENTITY_SETTINGS, {}
-    )
+    entities = store.entities
+    entity_settings = store.entity_settings
+    rule_selected = sorted(_rule_selected(hass, entry).difference(store.entity_set))
 
     previews: list[dict[str, Any]] = []
-    for entity_id in entities:
+    for entity_id in [*entities, *rule_selected]:
         settings = entity_settings.get(entity_id, {})
         metric_name_override: str = settings.get("metric_name", "")
         previews.append(
@@ -81,6 +115,10 @@ def handle_get_config(
                 ),
                 "metric_name_override": metric_name_override,
                 "batch_interval": settings.get("batch_interval", batch_interval),
+                "export_mode": settings.get("export_mode", DEFAULT_EXPORT_MODE),
+                "deadband": settings.get("deadband"),
+                "deadband_percent": settings.get("deadband_percent"),
+                "rule_selected": entity_id not in store.entity_set,
             }
         )
 
@@ -95,32 +133,48 @@ def handle_get_config(
     )
 
 
+# Settings accepted for an entity by update_entity_settings and its bulk form
+_ENTITY_SETTINGS_SCHEMA: dict[str | vol.Marker, Any] = {
+    vol.Optional("batch_interval"): vol.All(int, vol.Range(min=10, max=3600)),
+    vol.Optional("export_mode"): vol.In(EXPORT_MODES),
+    vol.Optional("deadband"): vol.Any(
+        None, vol.All(vol.Coerce(float), vol.Range(min=0))
+    ),
+    vol.Optional("deadband_percent"): vol.Any(
+        None, vol.All(vol.Coerce(float), vol.Range(min=0, max=100))
+    ),
+    vol.Optional("metric_name"): vol.Any(str, None),
+}
+
+
 @websocket_api.websocket_command(
     {
         vol.Required("type"): "victoria_metrics/save_entities",
         vol.Required("entities"): [str],
     }
 )
-@websocket_api.async_response
-async def handle_save_entities(
+@callback
+def handle_save_entities(
     hass: HomeAssistant,
     connection: websocket_api.ActiveConnection,
     msg: dict[str, Any],
 ) -> None:
-    """Update the exported entities list and reload."""
+    """Update the exported entities list and apply it without reload."""
     entry = _get_config_entry(hass)
     if entry is None:
         connection.send_error(msg["id"], "not_found", "No config entry found")
         return
 
+    store = _get_store(hass, entry)
+    old_entities = set(store.entity_set)
     new_entities: list[str] = msg["entities"]
-
-    # Merge with existing options, updating only the entities list
-    new_options = dict(entry.options)
-    new_options[CONF_EXPORT_ENTITIES] = new_entities
-
-    hass.config_entries.async_update_entry(entry, options=new_options)
-    await hass.config_entries.async_reload(entry.entry_id)
+    store.set_entities(new_entities)
+    _apply_entity_set(
+        hass,
+        entry,
+        added=set(new_entities) - old_entities,
+        removed=old_entities.difference(new_entities),
+    )
 
     connection.send_result(msg["id"], {"success": True})
 
@@ -129,12 +183,11 @@ async def handle_save_entities(
     {
         vol.Required("type"): "victoria_metrics/update_entity_settings",
         vol.Required("entity_id"): str,
-        vol.Optional("batch_interval"): vol.All(int, vol.Range(min=10, max=3600)),
-        vol.Optional("metric_name"): vol.Any(str, None),
+        **_ENTITY_SETTINGS_SCHEMA,
     }
 )
-@websocket_api.async_response
-async def handle_update_entity_settings(
+@callback
+def handle_update_entity_settings(
     hass: HomeAssistant,
     connection: websocket_api.ActiveConnection,
     msg: dict[str, Any],
@@ -146,46 +199,120 @@ async def handle_update_entity_settings(
         return
 
     entity_id: str = msg["entity_id"]
-    entities: list[str] = entry.options.get(CONF_EXPORT_ENTITIES, [])
-    if entity_id not in entities:
+    store = _get_store(hass, entry)
+    if not _is_exported(hass, entry, store, entity_id):
         connection.send_error(msg["id"], "not_found", "Entity not in export list")
         return
 
-    # Build updated entity_settings dict
-    new_options = dict(entry.options)
-    entity_settings: dict[str, dict[str, Any]] = dict(
-        new_options.get(CONF_ENTITY_SETTINGS, {})
+    _update_entity_settings(hass, entry, store, msg)
+    connection.send_result(msg["id"], {"success": True})
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "victoria_metrics/update_entity_settings_bulk",
+        vol.Required("updates"): [
+            vol.Schema({vol.Required("entity_id"): str, **_ENTITY_SETTINGS_SCHEMA})
+        ],
+    }
+)
+@callback
+def handle_update_entity_settings_bulk(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Update the settings of many entities at once.
+
+    Updates for entities that are neither in the export list nor selected
+    by the export rules are skipped and returned as not_found.
+    """
+    entry = _get_config_entry(hass)
+    if entry is None:
+        connection.send_error(msg["id"], "not_found", "No config entry found")
+        return
+
+    store = _get_store(hass, entry)
+    updated: list[str] = []
+    not_found: list[str] = []
+    for update in msg["updates"]:
+        if not _is_exported(hass, entry, store, update["entity_id"]):
+            not_found.append(update["entity_id"])
+            continue
+        _update_entity_settings(hass, entry, store, update)
+        updated.append(update["entity_id"])
+
+    connection.send_result(
+        msg["id"], {"success": True, "updated": updated, "not_found": not_found}
     )
-    current = dict(entity_settings.get(entity_id, {}))
 
-    if "batch_interval" in msg:
-        current["batch_interval"] = msg["batch_interval"]
-    if "metric_name" in msg:
-        if msg["metric_name"]:
-            current["metric_name"] = msg["metric_name"]
-        else:
-            current.pop("metric_name", None)
 
-    entity_settings[entity_id] = current
-    new_options[CONF_ENTITY_SETTINGS] = entity_settings
+def _is_exported(
+    hass: HomeAssistant, entry: ConfigEntry, store: OptionsStore, entity_id: str
+) -> bool:
+    """Return True if an entity is exported explicitly or by the export rules."""
+    return entity_id in store.entity_set or entity_id in _rule_selected(hass, entry)
 
-    # Persist to config entry options (survives restart)
-    hass.config_entries.async_update_entry(entry, options=new_options)
 
-    # Apply at runtime without reload
-    domain_data = hass.data.get(DOMAIN, {})
-    entry_data = domain_data.get(entry.entry_id)
+def _update_entity_settings(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    store: OptionsStore,
+    update: dict[str, Any],
+) -> None:
+    """Store an entity's changed settings and apply them to the manager.
+
+    The settings are persisted debounced by the options store.
+    """
+    entity_id: str = update["entity_id"]
+    settings = store.update_settings(entity_id, update)
+    entry_data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
     if entry_data:
-        manager: ExportManager = entry_data["manager"]
-        if "batch_interval" in msg:
-            manager.set_batch_interval(entity_id, msg["batch_interval"])
-        if "metric_name" in msg:
-            prefix = entry.options.get(CONF_METRIC_PREFIX, DEFAULT_METRIC_PREFIX)
-            override = msg["metric_name"] or None
-            new_name = build_metric_name(prefix, entity_id, override)
-            manager.set_metric_name(entity_id, new_name)
+        _apply_entity_settings(
+            entry, entry_data["manager"], entity_id, update, settings
+        )
 
-    connection.send_result(msg["id"], {"success": True})
+
+def _apply_entity_settings(
+    entry: ConfigEntry,
+    manager: ExportManager,
+    entity_id: str,
+    msg: dict[str, Any],
+    settings: dict[str, Any],
+) -> None:
+    """Apply the settings changed by msg to the running export manager."""
+    if "batch_interval" in msg:
+        manager.set_batch_interval(entity_id, msg["batch_interval"])
+    if "export_mode" in msg:
+        manager.set_export_mode(entity_id, msg["export_mode"])
+    if "deadband" in msg or "deadband_percent" in msg:
+        manager.set_deadband(entity_id, Deadband.from_settings(settings))
+    if "metric_name" in msg:
+        prefix = entry.options.get(CONF_METRIC_PREFIX, DEFAULT_METRIC_PREFIX)
+        override = msg["metric_name"] or None
+        new_name = build_metric_name(prefix, entity_id, override)
+        manager.set_metric_name(entity_id, new_name)
+
+
+def _apply_entity_set(
+    hass: HomeAssistant, entry: ConfigEntry, *, added: set[str], removed: set[str]
+) -> None:
+    """Add and remove entities on the running export manager.
+
+    The manager adds and removes the matching export sensors. Removed
+    entities that the export rules still select keep being exported.
+    """
+    entry_data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if not entry_data:
+        return
+    manager: ExportManager = entry_data["manager"]
+    index: EntityIndex | None = entry_data.get("index")
+    manager.remove_entities(
+        entity_id
+        for entity_id in removed
+        if index is None or entity_id not in index.selected
+    )
+    manager.add_entities_from_options(added, entry_data["store"].options)
 
 
 @websocket_api.websocket_command(
@@ -223,72 +350,179 @@ def handle_get_audit_log(
         vol.Required("entity_id"): str,
     }
 )
-@websocket_api.async_response
-async def handle_add_entity(
+@callback
+def handle_add_entity(
     hass: HomeAssistant,
     connection: websocket_api.ActiveConnection,
     msg: dict[str, Any],
 ) -> None:
-    """Add a single entity to the export list and reload."""
+    """Add a single entity to the export list without reload."""
     entry = _get_config_entry(hass)
     if entry is None:
         connection.send_error(msg["id"], "not_found", "No config entry found")
         return
 
     entity_id: str = msg["entity_id"]
-    entities: list[str] = list(entry.options.get(CONF_EXPORT_ENTITIES, []))
+    added = _get_store(hass, entry).add_entities([entity_id])
+    _apply_entity_set(hass, entry, added=set(added), removed=set())
+
+    connection.send_result(msg["id"], {"success": True, "already_tracked": not added})
+
 
-    if entity_id in entities:
-        connection.send_result(msg["id"], {"success": True, "already_tracked": True})
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "victoria_metrics/remove_entity",
+        vol.Required("entity_id"): str,
+    }
+)
+@callback
+def handle_remove_entity(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Remove a single entity and its settings from the export list."""
+    entry = _get_config_entry(hass)
+    if entry is None:
+        connection.send_error(msg["id"], "not_found", "No config entry found")
         return
 
-    entities.append(entity_id)
-    new_options = dict(entry.options)
-    new_options[CONF_EXPORT_ENTITIES] = entities
+    entity_id: str = msg["entity_id"]
+    removed = _get_store(hass, entry).remove_entities([entity_id])
+    _apply_entity_set(hass, entry, added=set(), removed=set(removed))
+
+    connection.send_result(msg["id"], {"success": True, "was_tracked": bool(removed)})
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "victoria_metrics/add_entities",
+        vol.Required("entity_ids"): [str],
+    }
+)
+@callback
+def handle_add_entities(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Add entities to the export list and return those newly added."""
+    entry = _get_config_entry(hass)
+    if entry is None:
+        connection.send_error(msg["id"], "not_found", "No config entry found")
+        return
 
-    hass.config_entries.async_update_entry(entry, options=new_options)
-    await hass.config_entries.async_reload(entry.entry_id)
+    added = _get_store(hass, entry).add_entities(msg["entity_ids"])
+    _apply_entity_set(hass, entry, added=set(added), removed=set())
 
-    connection.send_result(msg["id"], {"success": True, "already_tracked": False})
+    connection.send_result(msg["id"], {"success": True, "added": added})
 
 
 @websocket_api.websocket_command(
     {
-        vol.Required("type"): "victoria_metrics/remove_entity",
-        vol.Required("entity_id"): str,
+        vol.Required("type"): "victoria_metrics/remove_entities",
+        vol.Required("entity_ids"): [str],
     }
 )
-@websocket_api.async_response
-async def handle_remove_entity(
+@callback
+def handle_remove_entities(
     hass: HomeAssistant,
     connection: websocket_api.ActiveConnection,
     msg: dict[str, Any],
 ) -> None:
-    """Remove a single entity from the export list and reload."""
+    """Remove entities and their settings and return those that were listed."""
     entry = _get_config_entry(hass)
     if entry is None:
         connection.send_error(msg["id"], "not_found", "No config entry found")
         return
 
-    entity_id: str = msg["entity_id"]
-    entities: list[str] = list(entry.options.get(CONF_EXPORT_ENTITIES, []))
+    removed = _get_store(hass, entry).remove_entities(msg["entity_ids"])
+    _apply_entity_set(hass, entry, added=set(), removed=set(removed))
+
+    connection.send_result(msg["id"], {"success": True, "removed": removed})
+
+
+def _get_manager(hass: HomeAssistant) -> ExportManager | None:
+    """Return the export manager of the loaded config entry, if any."""
+    entry = _get_config_entry(hass)
+    if entry is None:
+        return None
+    entry_data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if not entry_data:
+        return None
+    manager: ExportManager = entry_data["manager"]
+    return manager
 
-    if entity_id not in entities:
-        connection.send_result(msg["id"], {"success": True, "was_tracked": False})
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "victoria_metrics/get_backfill",
+    }
+)
+@callback
+def handle_get_backfill(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Return the progress of backfill from the recorder."""
+    manager = _get_manager(hass)
+    if manager is None:
+        connection.send_error(msg["id"], "not_found", "No config entry loaded")
         return
 
-    entities.remove(entity_id)
-    new_options = dict(entry.options)
-    new_options[CONF_EXPORT_ENTITIES] = entities
+    connection.send_result(msg["id"], manager.backfill.status())
 
-    # Clean up per-entity settings for the removed entity
-    entity_settings: dict[str, dict[str, Any]] = dict(
-        new_options.get(CONF_ENTITY_SETTINGS, {})
-    )
-    entity_settings.pop(entity_id, None)
-    new_options[CONF_ENTITY_SETTINGS] = entity_settings
 
-    hass.config_entries.async_update_entry(entry, options=new_options)
-    await hass.config_entries.async_reload(entry.entry_id)
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "victoria_metrics/start_backfill",
+        vol.Optional("hours"): vol.All(int, vol.Range(min=1, max=720)),
+        vol.Optional("entity_ids"): [str],
+    }
+)
+@callback
+def handle_start_backfill(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Backfill exported entities from the recorder for the last hours."""
+    manager = _get_manager(hass)
+    if manager is None:
+        connection.send_error(msg["id"], "not_found", "No config entry loaded")
+        return
+    if "recorder" not in hass.config.components:
+        connection.send_error(msg["id"], "not_supported", "Recorder is not loaded")
+        return
+
+    entity_ids = [
+        entity_id
+        for entity_id in msg.get("entity_ids", manager.entity_configs)
+        if entity_id in manager.entity_configs
+    ]
+    end = dt_util.utcnow()
+    hours = msg.get("hours", manager.backfill.hours)
+    manager.backfill.request(entity_ids, end - timedelta(hours=hours), end)
+    connection.send_result(msg["id"], manager.backfill.status())
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "victoria_metrics/cancel_backfill",
+    }
+)
+@websocket_api.async_response
+async def handle_cancel_backfill(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Stop the running backfill and drop queued ones."""
+    manager = _get_manager(hass)
+    if manager is None:
+        connection.send_error(msg["id"], "not_found", "No config entry loaded")
+        return
 
-    connection.send_result(msg["id"], {"success": True, "was_tracked": True})
+    await manager.backfill.async_cancel()
+    connection.send_result(msg["id"], manager.backfill.status())
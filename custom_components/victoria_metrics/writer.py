@@ -1,51 +1,313 @@
-"""Victoria Metrics HTTP writer using InfluxDB line protocol."""
+"""Victoria Metrics HTTP writer with sharding and fan-out to several targets."""
 
 from __future__ import annotations
 
 import asyncio
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from enum import StrEnum
+import gzip
+import importlib
 import logging
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, NamedTuple
+from urllib.parse import urlsplit
 
 import aiohttp
 
+from .breaker import CircuitBreaker, backoff_delay
+from .const import (
+    COMPRESSION_GZIP,
+    COMPRESSION_NONE,
+    COMPRESSION_ZSTD,
+    DEFAULT_COALESCE_WINDOW,
+    DEFAULT_COMPRESSION,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    DEFAULT_MAX_BATCH_BYTES,
+    DEFAULT_MAX_BATCH_LINES,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_QUEUE_FULL_POLICY,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_TIMESTAMP_PRECISION,
+    QUEUE_BLOCK,
+    QUEUE_DRAIN_TIMEOUT,
+    QUEUE_MERGE,
+    SPOOL_REPLAY_CHUNK_BYTES,
+    TRANSPORT_INFLUX,
+)
+from .encoders import (
+    ENCODERS,
+    Sample,
+    get_encoder,
+)
+from .remote_write import CONTENT_ENCODING as SNAPPY_ENCODING, snappy_compress
+from .sharding import HashRing
+
+if TYPE_CHECKING:
+    from .encoders import Encoder
+    from .spool import WriteSpool
+
+zstandard: ModuleType | None
+try:
+    zstandard = importlib.import_module("zstandard")
+except ImportError:
+    zstandard = None
+
 _LOGGER = logging.getLogger(__name__)
 
 MAX_RETRIES = 3
 RETRY_BACKOFF_BASE = 1  # seconds
+RETRY_BACKOFF_MAX = 10  # seconds
+# How often a worker holding a batch checks whether its breaker has closed
+BREAKER_POLL_INTERVAL = 1  # seconds
 
+# Batches of at least this many samples are encoded, and bodies at least
+# this large are compressed, in the writer's encoding thread so a big flush
+# does not stall the event loop. Smaller ones skip the thread hop.
+ENCODE_EXECUTOR_THRESHOLD = 2000  # samples
+COMPRESSION_EXECUTOR_THRESHOLD = 256 * 1024  # bytes
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
 
-def _escape_tag_value(value: str) -> str:
-    """Escape special characters in InfluxDB line protocol tag values."""
-    return (
-        value.replace("\\", "\\\\")
-        .replace(" ", "\\ ")
-        .replace(",", "\\,")
-        .replace("=", "\\=")
-    )
+PRIMARY_TARGET = "primary"
 
 
-def _escape_measurement(name: str) -> str:
-    """Escape special characters in measurement name."""
-    return name.replace(" ", "\\ ").replace(",", "\\,")
+def _compress(data: bytes, encoding: str) -> bytes:
+    """Compress a request body with the given Content-Encoding."""
+    if encoding == SNAPPY_ENCODING:
+        return snappy_compress(data)
+    if encoding == COMPRESSION_ZSTD:
+        # The writer falls back to gzip when zstandard is missing
+        if zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package")
+        compressed: bytes = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        return compressed
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
 
 
-class VictoriaMetricsWriter:
-    """Async HTTP writer for Victoria Metrics using InfluxDB line protocol."""
+async def _encode_body(
+    raw: bytes, encoder: Encoder, compression: str, threshold: int, executor: Executor
+) -> tuple[bytes, str]:
+    """Optionally compress a request body.
+
+    Returns (body, content_encoding). Bodies below the compression threshold
+    are sent as-is with the "identity" encoding, unless the transport
+    mandates an encoding.
+    """
+    encoding = encoder.encoding or compression
+    if encoder.encoding is None and (
+        encoding == COMPRESSION_NONE or len(raw) < threshold
+    ):
+        return raw, "identity"
+    if len(raw) >= COMPRESSION_EXECUTOR_THRESHOLD:
+        body = await asyncio.get_running_loop().run_in_executor(
+            executor, _compress, raw, encoding
+        )
+    else:
+        body = _compress(raw, encoding)
+    return body, encoding
+
+
+def _retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header given in seconds; HTTP dates are ignored."""
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _health_url(url: str) -> str:
+    """Return the /health URL of the server behind a (possibly prefixed) URL."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/health"
+
+
+class WriteResult(StrEnum):
+    """Outcome of a write request."""
+
+    SUCCESS = "success"
+    # Permanent failure (bad request, auth); retrying the same body won't help.
+    REJECTED = "rejected"
+    # Transient failure (timeout, connection error, 5xx, 429); worth spooling.
+    FAILED = "failed"
+
+
+@dataclass(slots=True)
+class BatchStats:
+    """Size and outcome of a single write request."""
+
+    lines_count: int
+    bytes_raw: int
+    bytes_sent: int
+    encoding: str
+    success: bool
+    target: str = PRIMARY_TARGET
+
+    @property
+    def compression_ratio(self) -> float:
+        """Return raw size divided by size on the wire."""
+        return self.bytes_raw / self.bytes_sent if self.bytes_sent else 1.0
+
+
+@dataclass(slots=True)
+class Endpoint:
+    """A Victoria Metrics (or vminsert) node and its health."""
+
+    url: str
+    health_url: str
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    # Whether the endpoint takes part in routing; follows the breaker state
+    healthy: bool = True
+
+
+@dataclass(slots=True)
+class QueuedBatch:
+    """An encoded batch waiting in the send queue.
+
+    body holds the compressed request body, shared by all targets. It is
+    None when the body has to be compressed again, e.g. after merging.
+    """
+
+    raw: bytes
+    lines_count: int
+    enqueued_at: float
+    transport: str
+    endpoint: int = 0
+    body: bytes | None = None
+    encoding: str = "identity"
+
+
+@dataclass(slots=True)
+class QueueStats:
+    """Counters describing the send queue."""
+
+    queue_depth: int = 0
+    in_flight: int = 0
+    last_queue_wait: float = 0.0  # seconds
+    batches_dropped: int = 0
+    batches_merged: int = 0
+    batches_split: int = 0
+    batches_coalesced: int = 0
+    # Batches spooled without a request because their breaker was open
+    batches_buffered: int = 0
+
+
+class ReplicaConfig(NamedTuple):
+    """An additional, independent Victoria Metrics instance to fan out to."""
+
+    url: str
+    token: str | None
+    spool: WriteSpool | None
+
+
+class WriteTarget:
+    """Delivery to one Victoria Metrics deployment.
+
+    A target owns its send queue, workers, retry state, spool and HTTP
+    session, so a slow or unreachable target does not hold up the others.
+    With several endpoints, each series is sent to the endpoint owning it on
+    a consistent-hash ring. Every endpoint has a circuit breaker; while it is
+    open the endpoint is skipped and its batches are rerouted, spooled or
+    held back instead of being retried.
+    """
 
     def __init__(
         self,
-        host: str,
-        port: int,
-        ssl: bool = False,
-        verify_ssl: bool = True,
-        token: str | None = None,
+        name: str,
+        urls: list[str],
+        *,
+        verify_ssl: bool,
+        token: str | None,
+        spool: WriteSpool | None,
+        compression: str,
+        compression_threshold: int,
+        executor: Executor,
+        max_in_flight: int,
+        queue_size: int,
+        queue_full_policy: str,
+        max_batch_bytes: int,
+        report: Callable[[BatchStats], None],
     ) -> None:
-        """Initialize the writer."""
-        scheme = "https" if ssl else "http"
-        self._base_url = f"{scheme}://{host}:{port}"
-        self._write_url = f"{self._base_url}/write"
+        """Initialize the target."""
+        self.name = name
+        self._endpoints = [Endpoint(url, _health_url(url)) for url in urls]
+        self._ring = HashRing(urls) if len(urls) > 1 else None
+        self._healthy = set(range(len(self._endpoints)))
+        self._owners: dict[str, int] = {}
         self._verify_ssl = verify_ssl
         self._token = token
         self._session: aiohttp.ClientSession | None = None
+        self._spool = spool
+        self._replay_lock = asyncio.Lock()
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._executor = executor
+        self._report = report
+        # The concurrency limit applies per endpoint
+        self._max_in_flight = max(1, max_in_flight) * len(self._endpoints)
+        self._queue_size = max(1, queue_size)
+        self._queue_full_policy = queue_full_policy
+        self._max_batch_bytes = max_batch_bytes
+        self._queue: deque[QueuedBatch] = deque()
+        self._queue_has_items = asyncio.Event()
+        self._queue_has_space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Set once the target is closing; batches are then no longer held
+        self._closing = asyncio.Event()
+        self._workers: list[asyncio.Task[None]] = []
+        self.stats = QueueStats()
+
+    @property
+    def sharded(self) -> bool:
+        """Return True if series are spread across several endpoints."""
+        return self._ring is not None
+
+    @property
+    def healthy_endpoints(self) -> int:
+        """Return the number of endpoints currently considered healthy."""
+        return len(self._healthy)
+
+    def _sync_health(self, index: int) -> None:
+        """Reshard if an endpoint's breaker opened or closed."""
+        endpoint = self._endpoints[index]
+        healthy = endpoint.breaker.closed
+        if endpoint.healthy == healthy:
+            return
+        endpoint.healthy = healthy
+        if healthy:
+            self._healthy.add(index)
+            _LOGGER.info("Victoria Metrics endpoint %s is back up", endpoint.url)
+        elif self._ring is None:
+            self._healthy.discard(index)
+            _LOGGER.warning("Victoria Metrics endpoint %s is down", endpoint.url)
+        else:
+            self._healthy.discard(index)
+            _LOGGER.warning(
+                "Victoria Metrics endpoint %s is down, moving its series to "
+                "%d other endpoints",
+                endpoint.url,
+                len(self._healthy),
+            )
+        self._owners.clear()
+
+    def route(self, key: str) -> int:
+        """Return the index of the endpoint a series is sent to."""
+        if self._ring is None:
+            return 0
+        owner = self._owners.get(key)
+        if owner is None:
+            owner = self._owners[key] = self._ring.lookup(key, self._healthy)
+        return owner
+
+    def _fallback(self, index: int) -> int:
+        """Return index if that endpoint is healthy, else the first healthy one."""
+        if index in self._healthy or not self._healthy:
+            return index
+        return min(self._healthy)
 
     def _get_session(self) -> aiohttp.ClientSession:
         """Get or create the aiohttp session."""
@@ -61,80 +323,253 @@ class VictoriaMetricsWriter:
             )
         return self._session
 
-    async def test_connection(self) -> bool:
-        """Test connectivity to Victoria Metrics."""
+    async def _check_health(self, index: int) -> bool:
+        """Probe the /health endpoint. Raises on connection errors."""
+        session = self._get_session()
+        async with session.get(
+            self._endpoints[index].health_url,
+            timeout=aiohttp.ClientTimeout(total=10),
+        ) as resp:
+            return resp.status == 200
+
+    async def _probe(self, index: int) -> bool:
+        """Probe an endpoint, opening its breaker if it is unreachable."""
+        breaker = self._endpoints[index].breaker
         try:
-            session = self._get_session()
-            async with session.get(
-                f"{self._base_url}/health",
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as resp:
-                return resp.status == 200
+            healthy = await self._check_health(index)
         except (TimeoutError, aiohttp.ClientError) as err:
             _LOGGER.error(
-                "Failed to connect to Victoria Metrics at %s: %s", self._base_url, err
+                "Failed to connect to Victoria Metrics at %s: %s",
+                self._endpoints[index].url,
+                err,
             )
-            return False
+            healthy = False
+        if healthy:
+            breaker.record_success()
+        else:
+            breaker.trip()
+        self._sync_health(index)
+        return healthy
 
-    @staticmethod
-    def format_line(
-        metric_name: str,
-        tags: dict[str, str],
-        value: float | str,
-        timestamp_ns: int,
-    ) -> str:
-        """Format a data point as InfluxDB line protocol.
-
-        Format: measurement,tag1=val1,tag2=val2 field=value timestamp_ns
+    async def _probe_if_due(self, index: int) -> None:
+        """Probe /health once an open breaker's backoff delay has passed."""
+        breaker = self._endpoints[index].breaker
+        if not breaker.try_half_open():
+            return
+        try:
+            healthy = await self._check_health(index)
+        except (TimeoutError, aiohttp.ClientError) as err:
+            _LOGGER.debug(
+                "Health probe of %s failed: %s", self._endpoints[index].url, err
+            )
+            healthy = False
+        if healthy:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        self._sync_health(index)
+
+    async def probe_all(self) -> bool:
+        """Probe every endpoint. Returns True if any of them is healthy."""
+        results = await asyncio.gather(
+            *(self._probe(index) for index in range(len(self._endpoints)))
+        )
+        return any(results)
+
+    async def check_endpoints(self) -> None:
+        """Re-probe endpoints that are down so they can take their series back."""
+        down = [
+            index for index in range(len(self._endpoints)) if index not in self._healthy
+        ]
+        if down:
+            await asyncio.gather(*(self._probe_if_due(index) for index in down))
+
+    async def _send(self, batch: QueuedBatch, *, spool: bool = True) -> WriteResult:
+        """POST a batch, compressing it first if needed, and report its stats.
+
+        Bodies that fail transiently mark the endpoint as down and are
+        written to the spool, if one is configured, so they can be replayed
+        once Victoria Metrics is back.
         """
-        escaped_name = _escape_measurement(metric_name)
+        body, encoding = batch.body, batch.encoding
+        if body is None:
+            body, encoding = await _encode_body(
+                batch.raw,
+                ENCODERS[batch.transport],
+                self._compression,
+                self._compression_threshold,
+                self._executor,
+            )
+        result = await self._post(body, encoding, batch.transport, batch.endpoint)
+        self._sync_health(batch.endpoint)
+        stats = BatchStats(
+            lines_count=batch.lines_count,
+            bytes_raw=len(batch.raw),
+            bytes_sent=len(body),
+            encoding=encoding,
+            success=result is WriteResult.SUCCESS,
+            target=self.name,
+        )
+        _LOGGER.debug(
+            "Sent %d lines to %s, %d -> %d bytes (%s, ratio %.2f)",
+            stats.lines_count,
+            self._endpoints[batch.endpoint].url,
+            stats.bytes_raw,
+            stats.bytes_sent,
+            stats.encoding,
+            stats.compression_ratio,
+        )
+        self._report(stats)
+        if result is WriteResult.FAILED and spool:
+            await self._spool_batch(batch)
+        return result
+
+    async def _spool_batch(self, batch: QueuedBatch) -> None:
+        """Append a raw body to the spool, tagged with transport and endpoint."""
+        if self._spool is not None:
+            tag = f"{batch.transport} {self._endpoints[batch.endpoint].url}\n"
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._spool.append, tag.encode() + batch.raw
+            )
+
+    async def replay_spool(self) -> None:
+        """Replay spooled batches oldest-first once Victoria Metrics is healthy.
+
+        Batches go back to the endpoint they were meant for, or to another
+        healthy endpoint if it is still down.
+        """
+        spool = self._spool
+        if spool is None or spool.is_empty or self._replay_lock.locked():
+            return
+        async with self._replay_lock:
+            if not self._healthy:
+                return
 
-        tag_parts = []
-        for key, val in sorted(tags.items()):
-            if val:
-                tag_parts.append(
-                    f"{_escape_tag_value(key)}={_escape_tag_value(str(val))}"
+            loop = asyncio.get_running_loop()
+            replayed = 0
+            while True:
+                payloads, position = await loop.run_in_executor(
+                    None, spool.read_chunk, SPOOL_REPLAY_CHUNK_BYTES
+                )
+                if position is None:
+                    break
+                result = WriteResult.SUCCESS
+                for transport, endpoint, bodies in self._group_spooled(payloads):
+                    separator = ENCODERS[transport].separator
+                    raw = separator.join(bodies)
+                    count = raw.count(separator) + 1 if separator else len(bodies)
+                    batch = QueuedBatch(
+                        raw,
+                        count,
+                        time.monotonic(),
+                        transport,
+                        self._fallback(endpoint),
+                    )
+                    result = await self._send(batch, spool=False)
+                    if result is WriteResult.FAILED:
+                        break
+                    if result is WriteResult.REJECTED:
+                        _LOGGER.warning(
+                            "Victoria Metrics rejected %d spooled bytes, discarding",
+                            len(raw),
+                        )
+                    replayed += len(raw)
+                if result is WriteResult.FAILED:
+                    _LOGGER.debug("Spool replay interrupted, will retry later")
+                    break
+                await loop.run_in_executor(None, spool.ack, position)
+            if replayed:
+                _LOGGER.info(
+                    "Replayed %d spooled bytes to Victoria Metrics (%s)",
+                    replayed,
+                    self.name,
                 )
 
-        tag_str = "," + ",".join(tag_parts) if tag_parts else ""
+    def _group_spooled(
+        self, payloads: list[bytes]
+    ) -> list[tuple[str, int, list[bytes]]]:
+        """Group consecutive spooled payloads by transport and endpoint.
 
-        if isinstance(value, str):
-            field_str = f'state_text="{value}"'
+        Payloads for an endpoint that is no longer configured go to the first
+        endpoint.
+        """
+        urls = {endpoint.url: index for index, endpoint in enumerate(self._endpoints)}
+        groups: list[tuple[str, int, list[bytes]]] = []
+        for payload in payloads:
+            tag, _, raw = payload.partition(b"\n")
+            transport, _, url = tag.decode().partition(" ")
+            if transport not in ENCODERS:
+                _LOGGER.warning("Discarding spooled batch with unknown format")
+                continue
+            endpoint = urls.get(url, 0)
+            if groups and groups[-1][:2] == (transport, endpoint):
+                groups[-1][2].append(raw)
+            else:
+                groups.append((transport, endpoint, [raw]))
+        return groups
+
+    @staticmethod
+    async def _handle_response(
+        resp: aiohttp.ClientResponse, breaker: CircuitBreaker
+    ) -> WriteResult:
+        """Classify a write response and update the breaker accordingly."""
+        if resp.status in {200, 204}:
+            breaker.record_success()
+            return WriteResult.SUCCESS
+        if resp.status == 401:
+            _LOGGER.error(
+                "Authentication failed for Victoria Metrics (HTTP 401). "
+                "Check your token configuration."
+            )
         else:
-            field_str = f"value={value}"
+            text = await resp.text()
+            _LOGGER.warning(
+                "Victoria Metrics returned HTTP %s: %s",
+                resp.status,
+                text[:200],
+            )
+        retry_after = _retry_after(resp.headers.get("Retry-After"))
+        if resp.status in {408, 429} or (resp.status >= 500 and retry_after):
+            breaker.trip(retry_after)
+            return WriteResult.FAILED
+        if resp.status >= 500:
+            breaker.record_failure()
+            return WriteResult.FAILED
+        breaker.record_success()
+        return WriteResult.REJECTED
 
-        return f"{escaped_name}{tag_str} {field_str} {timestamp_ns}"
+    async def _post(
+        self, body: bytes, encoding: str, transport: str, endpoint: int
+    ) -> WriteResult:
+        """POST an encoded body to a Victoria Metrics endpoint.
 
-    async def _post(self, data: str) -> bool:
-        """POST data to Victoria Metrics with retry logic."""
+        Outcomes feed the endpoint's circuit breaker: 2xx and most 4xx
+        responses show the server is up; 5xx responses and connection errors
+        count as failures; 429 and 408 open the breaker right away, for at
+        least the Retry-After period. Connection errors are retried with
+        jittered backoff until the breaker opens.
+        """
+        encoder = ENCODERS[transport]
+        breaker = self._endpoints[endpoint].breaker
+        headers = dict(encoder.headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
         for attempt in range(MAX_RETRIES):
             try:
                 session = self._get_session()
                 async with session.post(
-                    self._write_url,
-                    data=data.encode("utf-8"),
+                    f"{self._endpoints[endpoint].url}{encoder.path}",
+                    data=body,
+                    headers=headers,
                     timeout=aiohttp.ClientTimeout(total=30),
                 ) as resp:
-                    if resp.status in {200, 204}:
-                        return True
-                    if resp.status == 401:
-                        _LOGGER.error(
-                            "Authentication failed for Victoria Metrics (HTTP 401). "
-                            "Check your token configuration."
-                        )
-                        return False
-                    body = await resp.text()
-                    _LOGGER.warning(
-                        "Victoria Metrics returned HTTP %s: %s",
-                        resp.status,
-                        body[:200],
-                    )
-                    return False
+                    return await self._handle_response(resp, breaker)
             except (TimeoutError, aiohttp.ClientError) as err:
-                if attempt < MAX_RETRIES - 1:
-                    wait = RETRY_BACKOFF_BASE * (2**attempt)
+                breaker.record_failure()
+                if breaker.closed and attempt < MAX_RETRIES - 1:
+                    wait = backoff_delay(attempt, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
                     _LOGGER.debug(
-                        "Write attempt %d failed (%s), retrying in %ds",
+                        "Write attempt %d failed (%s), retrying in %.1fs",
                         attempt + 1,
                         err,
                         wait,
@@ -143,25 +578,454 @@ class VictoriaMetricsWriter:
                 else:
                     _LOGGER.warning(
                         "Failed to write to Victoria Metrics after %d attempts: %s",
-                        MAX_RETRIES,
+                        attempt + 1,
                         err,
                     )
-                    return False
-        return False
+                    return WriteResult.FAILED
+        return WriteResult.FAILED
 
-    async def write_batch(self, lines: list[str]) -> bool:
-        """Write multiple lines to Victoria Metrics in a single request."""
-        if not lines:
-            return True
-        data = "\n".join(lines)
-        _LOGGER.debug("Writing batch of %d metrics to Victoria Metrics", len(lines))
-        return await self._post(data)
+    def _ensure_workers(self) -> None:
+        """Start the send workers on first use."""
+        if self._workers:
+            return
+        loop = asyncio.get_running_loop()
+        self._workers = [
+            loop.create_task(
+                self._send_worker(), name=f"victoria_metrics_send_{self.name}_{i}"
+            )
+            for i in range(self._max_in_flight)
+        ]
+
+    async def _send_worker(self) -> None:
+        """Take batches off the queue and POST them."""
+        stats = self.stats
+        while True:
+            while not self._queue:
+                self._queue_has_items.clear()
+                await self._queue_has_items.wait()
+            batch = self._queue.popleft()
+            self._queue_has_space.set()
+            stats.queue_depth = len(self._queue)
+            stats.last_queue_wait = time.monotonic() - batch.enqueued_at
+            stats.in_flight += 1
+            try:
+                await self._deliver(batch)
+            finally:
+                stats.in_flight -= 1
+                if not self._queue and not stats.in_flight:
+                    self._idle.set()
 
-    async def write_single(self, line: str) -> bool:
-        """Write a single line to Victoria Metrics."""
-        return await self._post(line)
+    async def _deliver(self, batch: QueuedBatch) -> None:
+        """Send a batch unless its endpoint's breaker is open.
+
+        Batches for an open endpoint go to another healthy endpoint if there
+        is one, else to the spool. Without a spool they are held until the
+        breaker closes, leaving the queue to buffer newer batches. Once the
+        target is closing they are sent once more and dropped if that fails.
+        """
+        while True:
+            breaker = self._endpoints[batch.endpoint].breaker
+            if not breaker.closed:
+                await self._probe_if_due(batch.endpoint)
+            if breaker.closed:
+                await self._send(batch)
+                return
+            fallback = self._fallback(batch.endpoint)
+            if fallback != batch.endpoint:
+                batch.endpoint = fallback
+                continue
+            if self._spool is not None:
+                self.stats.batches_buffered += 1
+                await self._spool_batch(batch)
+                return
+            if self._closing.is_set():
+                await self._send_or_drop(batch)
+                return
+            try:
+                async with asyncio.timeout(
+                    max(breaker.retry_in, BREAKER_POLL_INTERVAL)
+                ):
+                    await self._closing.wait()
+            except TimeoutError:
+                pass
+
+    async def _send_or_drop(self, batch: QueuedBatch) -> None:
+        """Send a held batch one last time, dropping it if that fails."""
+        if await self._send(batch) is WriteResult.FAILED:
+            self.stats.batches_dropped += 1
+            _LOGGER.warning(
+                "Victoria Metrics endpoint %s still down while closing, "
+                "dropping batch of %d lines",
+                self._endpoints[batch.endpoint].url,
+                batch.lines_count,
+            )
+
+    async def enqueue(self, batch: QueuedBatch) -> None:
+        """Add a batch to the send queue, applying the queue-full policy.
+
+        The block policy waits for space until the target is closing; from
+        then on the oldest batch is dropped instead.
+        """
+        self._ensure_workers()
+        stats = self.stats
+        if self._queue_full_policy == QUEUE_BLOCK:
+            while len(self._queue) >= self._queue_size and not self._closing.is_set():
+                self._queue_has_space.clear()
+                await self._queue_has_space.wait()
+        if len(self._queue) >= self._queue_size:
+            if (
+                self._queue_full_policy == QUEUE_MERGE
+                and self._queue[-1].transport == batch.transport
+                and self._queue[-1].endpoint == batch.endpoint
+                and len(self._queue[-1].raw) + len(batch.raw) < self._max_batch_bytes
+            ):
+                tail = self._queue[-1]
+                tail.raw += ENCODERS[batch.transport].separator + batch.raw
+                tail.lines_count += batch.lines_count
+                tail.body = None
+                stats.batches_merged += 1
+                return
+            dropped = self._queue.popleft()
+            stats.batches_dropped += 1
+            _LOGGER.warning(
+                "Send queue for %s full, dropping oldest batch of %d lines%s",
+                self.name,
+                dropped.lines_count,
+                " to the spool" if self._spool is not None else "",
+            )
+            await self._spool_batch(dropped)
+        self._queue.append(batch)
+        stats.queue_depth = len(self._queue)
+        self._idle.clear()
+        self._queue_has_items.set()
+
+    def begin_close(self) -> None:
+        """Stop holding batches back and wake producers waiting for space."""
+        self._closing.set()
+        self._queue_has_space.set()
 
     async def close(self) -> None:
-        """Close the HTTP session."""
+        """Drain the send queue and close the HTTP session.
+
+        Batches still queued after QUEUE_DRAIN_TIMEOUT are moved to the spool.
+        """
+        self.begin_close()
+        if self._workers:
+            try:
+                async with asyncio.timeout(QUEUE_DRAIN_TIMEOUT):
+                    await self._idle.wait()
+            except TimeoutError:
+                _LOGGER.warning(
+                    "Timed out draining %d queued batches for %s",
+                    len(self._queue),
+                    self.name,
+                )
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+            while self._queue:
+                await self._spool_batch(self._queue.popleft())
         if self._session and not self._session.closed:
             await self._session.close()
+        if self._spool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._spool.close)
+
+
+class VictoriaMetricsWriter:
+    """Async HTTP writer for Victoria Metrics.
+
+    Samples are encoded by the configured transport's encoder (see
+    encoders.py), then coalesced, split and compressed once. The resulting
+    request bodies are queued on every target: the primary deployment plus
+    any replicas. Each target delivers independently (see WriteTarget).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        ssl: bool = False,
+        verify_ssl: bool = True,
+        token: str | None = None,
+        *,
+        compression: str = DEFAULT_COMPRESSION,
+        compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+        spool: WriteSpool | None = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        queue_full_policy: str = DEFAULT_QUEUE_FULL_POLICY,
+        max_batch_lines: int = DEFAULT_MAX_BATCH_LINES,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES * 1024,
+        coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+        transport: str = TRANSPORT_INFLUX,
+        precision: str = DEFAULT_TIMESTAMP_PRECISION,
+        extra_endpoints: list[tuple[str, int]] | None = None,
+        replicas: list[ReplicaConfig] | None = None,
+    ) -> None:
+        """Initialize the writer."""
+        scheme = "https" if ssl else "http"
+        self._encoder = get_encoder(transport, precision)
+        if compression == COMPRESSION_ZSTD and zstandard is None:
+            _LOGGER.warning(
+                "zstd compression requested but the zstandard package is not "
+                "installed, falling back to gzip"
+            )
+            compression = COMPRESSION_GZIP
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._batch_listener: Callable[[BatchStats], None] | None = None
+        self._max_batch_lines = max(1, max_batch_lines)
+        self._max_batch_bytes = max(1, max_batch_bytes)
+        # One thread keeps large batches in order and off the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="victoria_metrics_encode"
+        )
+
+        primary_urls = [
+            f"{scheme}://{ep_host}:{ep_port}"
+            for ep_host, ep_port in [(host, port), *(extra_endpoints or [])]
+        ]
+        self._targets = [
+            WriteTarget(
+                name,
+                urls,
+                verify_ssl=verify_ssl,
+                token=target_token,
+                spool=target_spool,
+                compression=compression,
+                compression_threshold=compression_threshold,
+                executor=self._executor,
+                max_in_flight=max_in_flight,
+                queue_size=queue_size,
+                queue_full_policy=queue_full_policy,
+                max_batch_bytes=self._max_batch_bytes,
+                report=self._report_batch,
+            )
+            for name, urls, target_token, target_spool in [
+                (PRIMARY_TARGET, primary_urls, token, spool),
+                *(
+                    (replica.url, [replica.url], replica.token, replica.spool)
+                    for replica in replicas or []
+                ),
+            ]
+        ]
+        self._sharded = any(target.sharded for target in self._targets)
+        self._stats = QueueStats()
+        self._coalesce_window = coalesce_window
+        # Pending records, keyed by the endpoint they go to on each target
+        self._pending: dict[tuple[int, ...], list[bytes]] = {}
+        self._pending_lines = 0
+        self._pending_bytes = 0
+        self._pending_batches = 0
+        self._coalesce_handle: asyncio.TimerHandle | None = None
+        self._background_tasks: set[asyncio.Task[None]] = set()
+
+    def set_batch_listener(self, listener: Callable[[BatchStats], None]) -> None:
+        """Register a callback invoked with the stats of every write request."""
+        self._batch_listener = listener
+
+    def _report_batch(self, stats: BatchStats) -> None:
+        """Forward the stats of a write request to the listener."""
+        if self._batch_listener is not None:
+            self._batch_listener(stats)
+
+    @property
+    def queue_stats(self) -> QueueStats:
+        """Return send queue counters summed over all targets."""
+        stats = replace(self._stats)
+        for target in self._targets:
+            target_stats = target.stats
+            stats.queue_depth += target_stats.queue_depth
+            stats.in_flight += target_stats.in_flight
+            stats.last_queue_wait = max(
+                stats.last_queue_wait, target_stats.last_queue_wait
+            )
+            stats.batches_dropped += target_stats.batches_dropped
+            stats.batches_merged += target_stats.batches_merged
+            stats.batches_buffered += target_stats.batches_buffered
+        return stats
+
+    @property
+    def healthy_endpoints(self) -> int:
+        """Return the number of endpoints currently considered healthy."""
+        return sum(target.healthy_endpoints for target in self._targets)
+
+    async def test_connection(self) -> bool:
+        """Test connectivity to Victoria Metrics.
+
+        Succeeds if at least one endpoint of any target is reachable.
+        """
+        results = await asyncio.gather(
+            *(target.probe_all() for target in self._targets)
+        )
+        return any(results)
+
+    async def check_endpoints(self) -> None:
+        """Re-probe endpoints that are down so they can take their series back."""
+        await asyncio.gather(*(target.check_endpoints() for target in self._targets))
+
+    async def replay_spool(self) -> None:
+        """Replay the spool of every target that is reachable again."""
+        await asyncio.gather(*(target.replay_spool() for target in self._targets))
+
+    def _split(self, records: list[bytes]) -> tuple[list[list[bytes]], list[bytes]]:
+        """Split encoded records into chunks within the line and byte budget.
+
+        Returns (full_chunks, remainder).
+        """
+        chunks: list[list[bytes]] = []
+        chunk: list[bytes] = []
+        chunk_bytes = 0
+        for record in records:
+            size = len(record) + 1
+            if chunk and (
+                chunk_bytes + size > self._max_batch_bytes
+                or len(chunk) >= self._max_batch_lines
+            ):
+                chunks.append(chunk)
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(record)
+            chunk_bytes += size
+        return chunks, chunk
+
+    async def _flush_pending(self, *, force: bool = False) -> None:
+        """Queue the coalesced records as one or more size-bounded requests.
+
+        Each request body is joined and compressed once and then shared by
+        all targets. Unless force is set, a trailing partial chunk stays
+        pending so that it can still be merged with batches arriving within
+        the window.
+        """
+        if force and self._coalesce_handle is not None:
+            self._coalesce_handle.cancel()
+            self._coalesce_handle = None
+        stats = self._stats
+        if self._pending_batches > 1:
+            stats.batches_coalesced += self._pending_batches - 1
+        pending = self._pending
+        self._pending = {}
+        self._pending_lines = 0
+        self._pending_bytes = 0
+        self._pending_batches = 0
+        encoder = self._encoder
+        for route, records in pending.items():
+            chunks, remainder = self._split(records)
+            if force or not self._coalesce_window:
+                chunks.append(remainder)
+                remainder = []
+            if len(chunks) > 1:
+                stats.batches_split += 1
+            if remainder:
+                self._pending[route] = remainder
+                self._pending_lines += len(remainder)
+                self._pending_bytes += sum(len(record) + 1 for record in remainder)
+                self._pending_batches = 1
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                raw = encoder.separator.join(chunk)
+                body, encoding = await _encode_body(
+                    raw,
+                    encoder,
+                    self._compression,
+                    self._compression_threshold,
+                    self._executor,
+                )
+                now = time.monotonic()
+                for target, endpoint in zip(self._targets, route, strict=True):
+                    await target.enqueue(
+                        QueuedBatch(
+                            raw, len(chunk), now, encoder.name, endpoint, body, encoding
+                        )
+                    )
+
+    def _coalesce_window_elapsed(self) -> None:
+        """Queue pending records once the coalescing window has passed."""
+        self._coalesce_handle = None
+        task = asyncio.get_running_loop().create_task(self._flush_pending(force=True))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _encode_routes(
+        self, routes: dict[tuple[int, ...], list[Sample]]
+    ) -> list[tuple[tuple[int, ...], list[bytes]]]:
+        """Encode the samples of every route.
+
+        Only reads the samples, which are immutable snapshots of the entity
+        states, so it may run in the encoding thread.
+        """
+        encode = self._encoder.encode
+        return [(route, encode(samples)) for route, samples in routes.items()]
+
+    def _add_pending(self, route: tuple[int, ...], records: list[bytes]) -> None:
+        """Add encoded records to the pending records of a route."""
+        self._pending.setdefault(route, []).extend(records)
+        self._pending_lines += len(records)
+        self._pending_bytes += sum(len(record) + 1 for record in records)
+
+    async def write_batch(self, samples: list[Sample]) -> bool:
+        """Encode samples and queue them to be written to Victoria Metrics.
+
+        Batches arriving within the coalescing window are merged into one
+        request, and anything above the line or byte budget is split into
+        chunks that are POSTed in parallel. Samples are encoded once, however
+        many targets they are sent to, in the encoding thread for large
+        batches. Returns once the samples are queued; delivery happens in
+        the background.
+        """
+        if not samples:
+            return True
+        _LOGGER.debug("Queueing batch of %d metrics for Victoria Metrics", len(samples))
+        targets = self._targets
+        shards: dict[tuple[int, ...], list[Sample]] = {}
+        if not self._sharded:
+            shards[(0,) * len(targets)] = samples
+        else:
+            for sample in samples:
+                key = sample.series.key
+                route = tuple(target.route(key) for target in targets)
+                shards.setdefault(route, []).append(sample)
+        if len(samples) >= ENCODE_EXECUTOR_THRESHOLD:
+            encoded = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._encode_routes, shards
+            )
+        else:
+            encoded = self._encode_routes(shards)
+        for route, records in encoded:
+            self._add_pending(route, records)
+        self._pending_batches += 1
+        if (
+            not self._coalesce_window
+            or self._pending_bytes >= self._max_batch_bytes
+            or self._pending_lines >= self._max_batch_lines
+        ):
+            await self._flush_pending()
+        if self._pending_lines and self._coalesce_handle is None:
+            self._coalesce_handle = asyncio.get_running_loop().call_later(
+                self._coalesce_window, self._coalesce_window_elapsed
+            )
+        return True
+
+    async def write_single(self, sample: Sample) -> bool:
+        """Queue a single sample to be written to Victoria Metrics."""
+        return await self.write_batch([sample])
+
+    def begin_close(self) -> None:
+        """Stop every target from holding batches back while shutting down.
+
+        Called before waiting for flushes in progress, which may otherwise
+        wait on a target whose endpoints are down.
+        """
+        for target in self._targets:
+            target.begin_close()
+
+    async def close(self) -> None:
+        """Flush pending records, then drain and close every target."""
+        self.begin_close()
+        await self._flush_pending(force=True)
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks)
+        await asyncio.gather(*(target.close() for target in self._targets))
+        self._executor.shutdown(wait=False)
@@ -252,6 +252,20 @@ const STYLES = `
     font-family: var(--code-font-family, monospace);
     text-align: right;
   }
+  .export-mode-select {
+    padding: 4px 6px;
+    border: 1px solid var(--divider-color);
+    border-radius: 4px;
+    background: var(--primary-background-color);
+    color: var(--primary-text-color);
+    font-size: 12px;
+    font-family: inherit;
+  }
+  .batch-interval-input:disabled,
+  .preset-btn:disabled {
+    opacity: 0.4;
+    cursor: default;
+  }
   .batch-interval-input:focus {
     border-color: var(--primary-color);
     outline: none;
@@ -294,6 +308,11 @@ const STYLES = `
     opacity: 1;
     background: rgba(var(--rgb-error-color, 219, 68, 55), 0.1);
   }
+  .rule-badge {
+    padding: 4px 8px;
+    font-size: 13px;
+    color: var(--secondary-text-color);
+  }
   .empty-state {
     text-align: center;
     padding: 48px 16px;
@@ -401,6 +420,41 @@ const STYLES = `
     background: var(--table-row-alternative-background-color,
                     rgba(var(--rgb-primary-text-color, 0, 0, 0), 0.04));
   }
+  .backfill-section {
+    background: var(--ha-card-background, var(--card-background-color));
+    border-radius: var(--ha-card-border-radius, 12px);
+    box-shadow: var(--ha-card-box-shadow, 0 2px 2px rgba(0, 0, 0, 0.1));
+    padding: 16px;
+    margin-top: 24px;
+  }
+  .backfill-header {
+    display: flex;
+    align-items: center;
+    gap: 8px;
+    font-size: 16px;
+    font-weight: 500;
+    color: var(--primary-text-color);
+  }
+  .backfill-header .settings-btn {
+    margin-left: auto;
+  }
+  .backfill-status {
+    font-size: 13px;
+    color: var(--secondary-text-color);
+    margin-top: 8px;
+  }
+  .backfill-bar {
+    height: 4px;
+    border-radius: 2px;
+    background: var(--divider-color);
+    margin-top: 8px;
+    overflow: hidden;
+  }
+  .backfill-bar-fill {
+    height: 100%;
+    background: var(--primary-color);
+    transition: width 0.3s;
+  }
   .audit-section {
     margin-top: 24px;
   }
@@ -477,6 +531,12 @@ function escapeHtml(text) {
   return div.innerHTML;
 }
 
+function formatBytes(bytes) {
+  if (bytes < 1024) return bytes + " B";
+  if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + " KiB";
+  return (bytes / (1024 * 1024)).toFixed(1) + " MiB";
+}
+
 class VictoriaMetricsPanel extends HTMLElement {
   constructor() {
     super();
@@ -489,11 +549,14 @@ class VictoriaMetricsPanel extends HTMLElement {
     this._initialized = false;
     this._config = null;
     this._configEntities = [];
+    this._ruleEntities = [];
     this._saving = false;
     this._searchQuery = "";
     this._configLoadPending = false;
     this._auditEntries = [];
     this._auditTimer = null;
+    this._backfill = null;
+    this._backfillTimer = null;
   }
 
   set hass(hass) {
@@ -521,7 +584,11 @@ class VictoriaMetricsPanel extends HTMLElement {
     }
     this._updateIfChanged();
     this._loadAuditLog();
-    this._auditTimer = setInterval(() => { this._loadAuditLog(); }, 10000);
+    this._loadBackfill();
+    this._auditTimer = setInterval(() => {
+      this._loadAuditLog();
+      this._loadBackfill();
+    }, 10000);
   }
 
   disconnectedCallback() {
@@ -529,6 +596,10 @@ class VictoriaMetricsPanel extends HTMLElement {
       clearInterval(this._auditTimer);
       this._auditTimer = null;
     }
+    if (this._backfillTimer) {
+      clearTimeout(this._backfillTimer);
+      this._backfillTimer = null;
+    }
   }
 
   _initLayout() {
@@ -610,6 +681,20 @@ class VictoriaMetricsPanel extends HTMLElement {
     this._cardEl.className = "card";
     this.shadowRoot.appendChild(this._cardEl);
 
+    // Backfill section
+    this._backfillSection = document.createElement("div");
+    this._backfillSection.className = "backfill-section";
+    this._backfillSection.innerHTML =
+      '<div class="backfill-header">Backfill from Recorder' +
+        '<button class="settings-btn backfill-btn"></button>' +
+      "</div>" +
+      '<div class="backfill-status"></div>' +
+      '<div class="backfill-bar"><div class="backfill-bar-fill"></div></div>';
+    this._backfillSection.querySelector(".backfill-btn").addEventListener("click", () => {
+      this._toggleBackfill();
+    });
+    this.shadowRoot.appendChild(this._backfillSection);
+
     // Audit log section
     this._auditSection = document.createElement("div");
     this._auditSection.className = "audit-section";
@@ -637,10 +722,18 @@ class VictoriaMetricsPanel extends HTMLElement {
       var result = await this._hass.connection.sendMessagePromise({
         type: "victoria_metrics/get_config",
       });
-      var newEntities = result.entities.map(function (e) { return e.entity_id; });
-      var changed = JSON.stringify(newEntities) !== JSON.stringify(this._configEntities);
+      // Only explicitly exported entities are saved back by the panel;
+      // those selected by the export rules are kept apart
+      var newEntities = [];
+      var ruleEntities = [];
+      result.entities.forEach(function (e) {
+        (e.rule_selected ? ruleEntities : newEntities).push(e.entity_id);
+      });
+      var changed = JSON.stringify(newEntities) !== JSON.stringify(this._configEntities) ||
+        JSON.stringify(ruleEntities) !== JSON.stringify(this._ruleEntities);
       this._config = result;
       this._configEntities = newEntities;
+      this._ruleEntities = ruleEntities;
       if (changed) {
         this._updateIfChanged();
       }
@@ -670,6 +763,8 @@ class VictoriaMetricsPanel extends HTMLElement {
         metricName: metricName,
         metricNameOverride: item.metric_name_override || "",
         batchInterval: batchInterval,
+        exportMode: item.export_mode || "batch",
+        ruleSelected: !!item.rule_selected,
       });
     }
 
@@ -711,19 +806,32 @@ class VictoriaMetricsPanel extends HTMLElement {
       const presetActive = function (v) {
         return r.batchInterval === v ? ' active' : '';
       };
+      const realtime = r.exportMode === "realtime";
+      const disabled = realtime ? " disabled" : "";
+      const modeOption = function (value, label) {
+        return '<option value="' + value + '"' + (r.exportMode === value ? " selected" : "") +
+          ">" + label + "</option>";
+      };
       const intervalCell =
         '<div class="interval-wrapper">' +
+          '<select class="export-mode-select"' +
+            ' data-entity="' + escapeHtml(r.sourceEntity) + '"' +
+            ' title="Sample on the interval, write every state change, or summarize the changes of each interval">' +
+            modeOption("batch", "Interval") +
+            modeOption("realtime", "On change") +
+            modeOption("aggregate", "Summary") +
+          "</select>" +
           '<input type="number" class="batch-interval-input"' +
             ' value="' + r.batchInterval + '"' +
             ' min="10" max="3600" step="10"' +
-            ' data-entity="' + escapeHtml(r.sourceEntity) + '">' +
+            ' data-entity="' + escapeHtml(r.sourceEntity) + '"' + disabled + '>' +
           '<span class="batch-interval-suffix">s</span>' +
           '<button type="button" class="preset-btn' + presetActive(60) + '"' +
             ' data-entity="' + escapeHtml(r.sourceEntity) + '"' +
-            ' data-value="60">60s</button>' +
+            ' data-value="60"' + disabled + '>60s</button>' +
           '<button type="button" class="preset-btn' + presetActive(300) + '"' +
             ' data-entity="' + escapeHtml(r.sourceEntity) + '"' +
-            ' data-value="300">5m</button>' +
+            ' data-value="300"' + disabled + '>5m</button>' +
         '</div>';
 
       const displayName = this._formatDisplayName(r.sourceEntity);
@@ -751,9 +859,11 @@ class VictoriaMetricsPanel extends HTMLElement {
         "</td>" +
         "<td>" + intervalCell + "</td>" +
         "<td>" +
-          '<button class="remove-btn" data-entity="' + escapeHtml(r.sourceEntity) + '">' +
-            "Remove" +
-          "</button>" +
+          (r.ruleSelected
+            ? '<span class="rule-badge" title="Selected by the export rules">Rule</span>'
+            : '<button class="remove-btn" data-entity="' + escapeHtml(r.sourceEntity) + '">' +
+                "Remove" +
+              "</button>") +
         "</td>" +
         "</tr>";
     }
@@ -764,7 +874,7 @@ class VictoriaMetricsPanel extends HTMLElement {
           "<th>Entity</th>" +
           "<th>Friendly Name</th>" +
           "<th>Metric Name</th>" +
-          "<th>Min Interval</th>" +
+          "<th>Export</th>" +
           "<th></th>" +
         "</tr></thead>" +
         "<tbody>" + tableRows + "</tbody>" +
@@ -803,6 +913,14 @@ class VictoriaMetricsPanel extends HTMLElement {
       });
     });
 
+    // Export mode handlers
+    this._cardEl.querySelectorAll(".export-mode-select").forEach(function (select) {
+      select.addEventListener("change", function () {
+        const entityId = select.getAttribute("data-entity");
+        self._updateEntitySetting(entityId, { export_mode: select.value });
+      });
+    });
+
     // Batch interval preset button handlers
     this._cardEl.querySelectorAll(".preset-btn").forEach(function (btn) {
       btn.addEventListener("click", function () {
@@ -869,14 +987,16 @@ class VictoriaMetricsPanel extends HTMLElement {
         "<thead><tr>" +
           '<th style="text-align:left;padding:4px 8px;border-bottom:1px solid var(--divider-color);">Entity</th>' +
           '<th style="text-align:left;padding:4px 8px;border-bottom:1px solid var(--divider-color);">Metric</th>' +
-          '<th style="text-align:right;padding:4px 8px;border-bottom:1px solid var(--divider-color);">Min Interval</th>' +
+          '<th style="text-align:right;padding:4px 8px;border-bottom:1px solid var(--divider-color);">Export</th>' +
         "</tr></thead><tbody>";
       for (const e of sorted) {
         entitiesHtml +=
           "<tr>" +
           '<td style="padding:4px 8px;font-family:monospace;font-size:12px;">' + escapeHtml(e.entity_id) + "</td>" +
           '<td style="padding:4px 8px;font-family:monospace;font-size:12px;">' + escapeHtml(e.metric_name) + "</td>" +
-          '<td style="padding:4px 8px;text-align:right;">' + e.batch_interval + "s</td>" +
+          '<td style="padding:4px 8px;text-align:right;">' +
+            (e.export_mode === "realtime" ? "on change"
+              : (e.export_mode === "aggregate" ? "summary " : "") + e.batch_interval + "s") + "</td>" +
           "</tr>";
       }
       entitiesHtml += "</tbody></table>";
@@ -916,6 +1036,7 @@ class VictoriaMetricsPanel extends HTMLElement {
         entity_id: entityId,
       };
       if ("batch_interval" in settings) msg.batch_interval = settings.batch_interval;
+      if ("export_mode" in settings) msg.export_mode = settings.export_mode;
       if ("metric_name" in settings) msg.metric_name = settings.metric_name;
 
       await this._hass.connection.sendMessagePromise(msg);
@@ -1068,6 +1189,16 @@ class VictoriaMetricsPanel extends HTMLElement {
       var timeStr = d.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit", second: "2-digit" });
       var valueStr = e.value === null ? "skipped" : String(e.value);
       var linesInfo = e.lines_count > 1 ? " (" + e.lines_count + " lines)" : "";
+      if (e.bytes_raw !== null && e.bytes_raw !== undefined) {
+        valueStr = formatBytes(e.bytes_raw) + " \u2192 " + formatBytes(e.bytes_sent);
+        if (e.encoding && e.encoding !== "identity") {
+          valueStr += " (" + e.encoding + ", " + e.value + "x)";
+        }
+        linesInfo = " (" + e.lines_count + " lines)";
+      } else if (e.mode === "suppressed") {
+        valueStr = Math.round(e.value * 100) + "% unchanged";
+        linesInfo = " (" + e.lines_count + " lines skipped)";
+      }
 
       html +=
         '<div class="audit-entry">' +
@@ -1082,6 +1213,81 @@ class VictoriaMetricsPanel extends HTMLElement {
     this._auditCard.innerHTML = html;
   }
 
+  async _loadBackfill() {
+    if (!this._hass) return;
+    if (this._backfillTimer) {
+      clearTimeout(this._backfillTimer);
+      this._backfillTimer = null;
+    }
+    try {
+      this._backfill = await this._hass.connection.sendMessagePromise({
+        type: "victoria_metrics/get_backfill",
+      });
+    } catch (_err) {
+      // Backfill status is non-critical
+      this._backfill = null;
+    }
+    this._renderBackfill();
+    // Follow a running backfill more closely than the audit log
+    if (this._backfill && this._backfill.running && this.isConnected) {
+      this._backfillTimer = setTimeout(() => { this._loadBackfill(); }, 2000);
+    }
+  }
+
+  async _toggleBackfill() {
+    if (!this._hass || !this._backfill) return;
+    try {
+      this._backfill = await this._hass.connection.sendMessagePromise({
+        type: this._backfill.running
+          ? "victoria_metrics/cancel_backfill"
+          : "victoria_metrics/start_backfill",
+      });
+    } catch (err) {
+      // E.g. the recorder is not loaded; shown until the next refresh
+      this._backfillSection.querySelector(".backfill-status").textContent =
+        "Backfill failed: " + (err.message || err);
+      return;
+    }
+    this._loadBackfill();
+  }
+
+  _renderBackfill() {
+    if (!this._backfillSection) return;
+    var b = this._backfill;
+    this._backfillSection.style.display = b ? "" : "none";
+    if (!b) return;
+
+    var statusEl = this._backfillSection.querySelector(".backfill-status");
+    var barEl = this._backfillSection.querySelector(".backfill-bar");
+    var btn = this._backfillSection.querySelector(".backfill-btn");
+    btn.textContent = b.running
+      ? "Cancel"
+      : "Backfill last " + b.hours + (b.hours === 1 ? " hour" : " hours");
+
+    var samples = b.samples_written.toLocaleString() + " samples";
+    if (b.running) {
+      var pct = b.chunks_total > 0
+        ? Math.floor((b.chunks_done / b.chunks_total) * 100)
+        : 0;
+      var status = "Backfilling: " + pct + "%, " + samples + " written";
+      if (b.position !== null) {
+        status += ", reading history from " +
+          new Date(b.position * 1000).toLocaleString();
+      }
+      if (b.queued > 0) status += " (" + b.queued + " more queued)";
+      statusEl.textContent = status;
+      barEl.style.display = "";
+      barEl.firstChild.style.width = pct + "%";
+    } else {
+      statusEl.textContent = b.finished !== null
+        ? "Last backfill finished " + new Date(b.finished * 1000).toLocaleString() +
+          ", " + samples + " written."
+        : "Entity history from the recorder is backfilled automatically " +
+          "for new entities and after downtime.";
+      barEl.style.display = "none";
+    }
+  }
+
   _updateDropdown() {
     if (!this._hass || this._searchQuery.length < 2) {
       this._closeDropdown();
@@ -1096,6 +1302,7 @@ class VictoriaMetricsPanel extends HTMLElement {
     for (const entityId of Object.keys(states)) {
       // Skip entities already exported
       if (this._configEntities.indexOf(entityId) >= 0) continue;
+      if (this._ruleEntities.indexOf(entityId) >= 0) continue;
       // Skip VM integration's own entities
       if (entityId.startsWith("sensor.vm_export_")) continue;
 
@@ -1178,10 +1385,8 @@ class VictoriaMetricsPanel extends HTMLElement {
         type: "victoria_metrics/save_entities",
         entities: entities,
       });
-      // Optimistically update local state while reload completes
+      // The change is applied without a reload, so refresh config right away
       this._configEntities = entities;
-      // Wait for the integration reload to complete, then refresh config
-      await new Promise(function (resolve) { setTimeout(resolve, 2000); });
       await this._loadConfig();
     } catch (_err) {
       // Refresh config from backend on error
@@ -0,0 +1,107 @@
+"""Micro-benchmark of the per-line cost of formatting entity states.
+
+Compares building the tags and series of every line from scratch, as the
+export manager did before series were cached, with the cached path through
+EntityConfig. Run from the repository root in an environment with Home
+Assistant installed:
+
+    python -m scripts.benchmark_line_format [--entities 10000] [--rounds 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable
+import time
+
+from homeassistant.core import State
+
+from custom_components.victoria_metrics import (
+    EntityConfig,
+    _build_tags,
+    _state_to_timestamp_ns,
+)
+from custom_components.victoria_metrics.encoders import ENCODERS, Sample, Series
+
+
+def _make_states(count: int) -> list[State]:
+    """Build sensor states with the usual tag-producing attributes."""
+    return [
+        State(
+            f"sensor.room_{index}_temperature",
+            f"{20 + index % 10}.5",
+            {
+                "friendly_name": f"Room {index}, temperature",
+                "device_class": "temperature",
+                "unit_of_measurement": "°C",
+            },
+        )
+        for index in range(count)
+    ]
+
+
+def _uncached(states: list[State]) -> list[Sample]:
+    """Rebuild tags and series for every line."""
+    samples = []
+    for state in states:
+        tags = _build_tags(state.entity_id, state)
+        samples.append(
+            Series("hass_temperature", tags).sample(
+                float(state.state), _state_to_timestamp_ns(state)
+            )
+        )
+    return samples
+
+
+def _cached(configs: list[EntityConfig], states: list[State]) -> list[Sample]:
+    """Reuse each entity's cached tags and series."""
+    samples = []
+    for ec, state in zip(configs, states, strict=True):
+        tags = ec.tags_for(state)
+        samples.append(
+            ec.make_sample(
+                ec.metric_name, tags, float(state.state), _state_to_timestamp_ns(state)
+            )
+        )
+    return samples
+
+
+def _time_per_line(
+    build: Callable[[], list[Sample]], transport: str, rounds: int, lines: int
+) -> float:
+    """Return the best time per line in microseconds over several rounds."""
+    encoder = ENCODERS[transport]
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        encoder.encode(build())
+        best = min(best, time.perf_counter() - start)
+    return best / lines * 1e6
+
+
+def main() -> None:
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    states = _make_states(args.entities)
+    configs = [EntityConfig(state.entity_id, "hass_temperature") for state in states]
+    # Fill the caches, as the first flush after startup would
+    _cached(configs, states)
+
+    print(f"{args.entities} entities, best of {args.rounds} rounds, us per line")
+    print(f"{'transport':<20}{'uncached':>10}{'cached':>10}{'speedup':>10}")
+    for transport in ENCODERS:
+        before = _time_per_line(
+            lambda: _uncached(states), transport, args.rounds, args.entities
+        )
+        after = _time_per_line(
+            lambda: _cached(configs, states), transport, args.rounds, args.entities
+        )
+        print(f"{transport:<20}{before:>10.2f}{after:>10.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
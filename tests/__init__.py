@@ -0,0 +1 @@
+"""Tests for the Victoria Metrics Exporter integration."""
@@ -0,0 +1,16 @@
+"""Fixtures for the Victoria Metrics Exporter tests."""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from custom_components.victoria_metrics.writer import VictoriaMetricsWriter
+
+
+@pytest.fixture
+def writer() -> MagicMock:
+    """Return a writer that records batches instead of sending them."""
+    mock = MagicMock(spec=VictoriaMetricsWriter)
+    mock.write_batch = AsyncMock(return_value=True)
+    mock.close = AsyncMock()
+    return mock
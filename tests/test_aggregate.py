@@ -0,0 +1,32 @@
+"""Tests for aggregate export."""
+
+from unittest.mock import MagicMock
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.victoria_metrics import EntityConfig, ExportManager
+from custom_components.victoria_metrics.const import EXPORT_MODE_AGGREGATE
+
+
+async def test_attribute_updates_are_not_counted(
+    hass: HomeAssistant, writer: MagicMock
+) -> None:
+    """Only changes of the state itself count towards the summary."""
+    hass.states.async_set("sensor.temp", "20", {"unit_of_measurement": "°C"})
+    ec = EntityConfig("sensor.temp", "temp", 60, export_mode=EXPORT_MODE_AGGREGATE)
+    manager = ExportManager(hass, writer, {"sensor.temp": ec}, 60)
+    manager.start()
+
+    for humidity in range(5):
+        hass.states.async_set(
+            "sensor.temp", "20", {"unit_of_measurement": "°C", "humidity": humidity}
+        )
+    await hass.async_block_till_done()
+    assert ec.accumulator is not None
+    assert ec.accumulator.count == 0
+
+    hass.states.async_set("sensor.temp", "21", {"unit_of_measurement": "°C"})
+    await hass.async_block_till_done()
+    assert ec.accumulator.count == 1
+
+    await manager.shutdown()